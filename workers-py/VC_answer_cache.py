@@ -0,0 +1,262 @@
+# Answer cache for repeated analyst questions.
+#
+# The same question ("top 5 AI VCs by AUM") comes in many phrasings and every
+# one used to pay for the full summarizer -> router -> agent -> final run. The
+# graph now looks the answer up once the context is resolved and the query is
+# routed, by exact key (context summary + normalized query). Entries expire
+# after a TTL and the whole cache is dropped when the dataset version moves.
+#
+# Semantic matching is opt-in: set ANSWER_CACHE_EMBEDDINGS to an
+# init_embeddings spec such as "openai:text-embedding-3-small". Similar
+# questions can still ask for a different country, metric or sector ("by total
+# investments" / "by total exits" embed at ~0.9), so a semantic hit also needs
+# the same key terms (numbers, metrics, sectors, named entities) in both the
+# query and the context summary.
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+import VC_chain_database as vc_database
+from VC_vocabulary import get_vocabulary
+
+log = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 6 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2000))
+ANSWER_CACHE_EMBEDDINGS = os.getenv("ANSWER_CACHE_EMBEDDINGS", "")     # empty: exact matches only
+# Cosine similarity both the query and the context summary must reach for a semantic hit
+ANSWER_CACHE_QUERY_SIMILARITY = float(os.getenv("ANSWER_CACHE_QUERY_SIMILARITY", 0.90))
+ANSWER_CACHE_CONTEXT_SIMILARITY = float(os.getenv("ANSWER_CACHE_CONTEXT_SIMILARITY", 0.90))
+
+# Routes whose answers depend only on the question and the dataset. General
+# answers come from web search and the current date, so they are never cached.
+CACHEABLE_ROUTES = {"ranking", "reasoning", "prediction"}
+
+_WORD_RE = re.compile(r"[^\W_]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+# Phrases naming a metric (matched as substrings of the normalized text, so
+# "exit" covers "exits" and "exited")
+METRIC_TERMS = {
+    "aum": ("aum", "assets under management"),
+    "ticket_size": ("ticket", "cheque size", "check size"),
+    "follow_on": ("follow on", "follow-on", "followon"),
+    "exits": ("exit",),
+    "investments": ("investment", "invested", "deals"),
+    "market_size": ("market size",),
+    "cagr": ("cagr", "growth rate"),
+    "funding": ("funding", "raised", "round"),
+}
+
+
+def normalize_query(query: str) -> str:
+    """Case-, width- and whitespace-insensitive form of a query, without trailing punctuation."""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return " ".join(query.split()).strip(" ?!.")
+
+
+def key_terms(text: str, vocabulary=None) -> frozenset:
+    """
+    What must be identical for two similar texts to share an answer: numbers,
+    metrics, sector / subsector / VC names from the vocabulary, and capitalized
+    words after the first (countries, firms, startups).
+    """
+    normalized = normalize_query(text)
+    terms = {f"number:{number}" for number in _NUMBER_RE.findall(normalized)}
+    terms.update(f"metric:{metric}" for metric, phrases in METRIC_TERMS.items()
+                 if any(phrase in normalized for phrase in phrases))
+    words = _WORD_RE.findall(unicodedata.normalize("NFKC", text))
+    terms.update(f"name:{word.lower()}" for word in words[1:] if word[0].isupper())
+    if vocabulary is not None:
+        padded = f" {' '.join(_WORD_RE.findall(normalized))} "
+        names = vocabulary.sectors + vocabulary.subsectors + [top_tier for top_tier, _ in vocabulary.vc_sectors if top_tier]
+        for name in names:
+            name_words = " ".join(_WORD_RE.findall(name.lower()))
+            if name_words and f" {name_words} " in padded:
+                terms.add(f"name:{name_words}")
+    return frozenset(terms)
+
+
+class LocalHashEmbeddings(Embeddings):
+    """
+    Deterministic embedder: signed feature hashing of words, word bigrams and
+    character trigrams. The same text gets the same vector in every process.
+    For tests only: it scores "... in Germany" / "... in France" above 0.9.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> list[str]:
+        words = _WORD_RE.findall(normalize_query(text))
+        features = [f"w:{word}" for word in words]
+        features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float64)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def make_embedder(spec: str = ANSWER_CACHE_EMBEDDINGS) -> Optional[Embeddings]:
+    """Embedding model for semantic matching, or None (exact matches only)."""
+    if not spec:
+        return None
+    if spec == "local":
+        log.warning("AnswerCache: the local hashed embedder is not a semantic model; using exact matches only")
+        return None
+    from langchain.embeddings import init_embeddings
+    return init_embeddings(spec)
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float64)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCacheEntry:
+    def __init__(self, key: str, route: str, query: str, answer: str, terms: frozenset,
+                 context_vector: Optional[np.ndarray], query_vector: Optional[np.ndarray]):
+        self.key = key
+        self.route = route
+        self.query = query
+        self.terms = terms              # key_terms of the query and of the context summary
+        self.answer = answer
+        self.context_vector = context_vector
+        self.query_vector = query_vector
+        self.created_at = time.time()
+
+
+class AnswerCache:
+    def __init__(self, embedder: Optional[Embeddings] = None, ttl: int = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 query_similarity: float = ANSWER_CACHE_QUERY_SIMILARITY, context_similarity: float = ANSWER_CACHE_CONTEXT_SIMILARITY):
+        self.embedder = embedder if embedder is not None else make_embedder()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.query_similarity = query_similarity
+        self.context_similarity = context_similarity
+        self._entries = OrderedDict()   # key -> AnswerCacheEntry, oldest first
+        self._version = None
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    @staticmethod
+    def make_key(context_summary: str, query: str, route: str) -> str:
+        return hashlib.sha256(f"{route}\x00{context_summary.strip()}\x00{normalize_query(query)}".encode()).hexdigest()
+
+    def _check_version(self):
+        version = vc_database.get_dataset_version()
+        if version != self._version:
+            if self._entries:
+                log.info("AnswerCache: dataset version %s -> %s, dropping %d answers", self._version, version, len(self._entries))
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest.created_at >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _terms(context_summary: str, query: str) -> Optional[tuple]:
+        """(query terms, context terms), or None when the vocabulary is unavailable."""
+        try:
+            vocabulary = get_vocabulary()
+        except Exception as e:
+            log.warning("AnswerCache: vocabulary unavailable, no semantic matching: %s", e)
+            return None
+        return key_terms(query, vocabulary), key_terms(context_summary, vocabulary)
+
+    async def _embed(self, context_summary: str, query: str) -> tuple[np.ndarray, np.ndarray]:
+        context_vector, query_vector = await self.embedder.aembed_documents([context_summary, normalize_query(query)])
+        return _unit(context_vector), _unit(query_vector)
+
+    async def lookup(self, context_summary: str, query: str, route: str) -> Optional[str]:
+        """Cached answer for this question in this context, or None."""
+        key = self.make_key(context_summary, query, route)
+        with self._lock:
+            self._check_version()
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats["exact_hits"] += 1
+                return entry.answer
+            # Only entries stored with a semantic model have terms and vectors
+            candidates = [entry for entry in self._entries.values() if entry.route == route and entry.terms is not None]
+        if candidates:
+            # "top 5" / "top 10" or "Germany" / "France" embed almost identically: key terms must match exactly
+            terms = self._terms(context_summary, query)
+            candidates = [entry for entry in candidates if entry.terms == terms]
+        if not candidates:
+            self._count("misses")
+            return None
+
+        context_vector, query_vector = await self._embed(context_summary, query)
+        query_sims = np.stack([entry.query_vector for entry in candidates]) @ query_vector
+        context_sims = np.stack([entry.context_vector for entry in candidates]) @ context_vector
+        eligible = (query_sims >= self.query_similarity) & (context_sims >= self.context_similarity)
+        if not eligible.any():
+            self._count("misses")
+            return None
+        best = candidates[int(np.argmax(np.where(eligible, query_sims, -np.inf)))]
+        log.info("AnswerCache: semantic hit %r ~ %r", normalize_query(query), best.query)
+        self._count("semantic_hits")
+        return best.answer
+
+    async def store(self, context_summary: str, query: str, route: str, answer: str):
+        terms = self._terms(context_summary, query) if self.embedder is not None else None
+        context_vector = query_vector = None
+        if terms is not None:
+            context_vector, query_vector = await self._embed(context_summary, query)
+        key = self.make_key(context_summary, query, route)
+        entry = AnswerCacheEntry(key, route, normalize_query(query), answer, terms, context_vector, query_vector)
+        with self._lock:
+            self._check_version()
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stats["stores"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
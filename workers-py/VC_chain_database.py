@@ -1,261 +1,442 @@
 import os
+import re
+import json
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-import pandas as pd
+from sqlalchemy import text
+import asyncio
 from typing import Optional
-import datetime
 import time
-from psycopg2.pool import ThreadedConnectionPool
-from psycopg2 import OperationalError, InterfaceError
-from langchain_core.messages import trim_messages
-from langgraph.graph import MessagesState
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_google_vertexai import ChatVertexAI
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from vertexai import init
-
-init(project="soy-blend-462121-m4", location="europe-west8")
+import threading
+import VC_chain_systemprompts as vc_systemprompts
+from VC_db_pools import PoolManager
+
 load_dotenv()
 
-llm_main = ChatVertexAI(model_name="gemini-2.5-flash", temperature=0, thinking_budget=1024)
-
-engine = create_engine(
-    os.environ["POSTGRES_URL"],
-    pool_size=20,  # Increased from 10
-    max_overflow=40,  # Increased from 20
-    connect_args={
-        "prepare_threshold": None,
-        "sslmode": "require",
-        "sslcert": None,
-        "sslkey": None,
-        "sslrootcert": None,
-        "sslcrl": None
-    },
-    pool_pre_ping=True,
-    pool_recycle=1800  # Reduced from 3600 for better connection recycling
-)
-
-db_pool = SQLDatabase(engine)
-
-toolkit = SQLDatabaseToolkit(db=db_pool, llm=llm_main)
-
-def save_interaction_to_db(session_id: str, user_input: str, assistant_reply: str, markdown_table: Optional[str] = None):
-    timestamp = datetime.datetime.now()
-
-    query = """
-                        INSERT INTO interactions (
-                            session_id,
-                            user_input,
-                            assistant_reply,
-                            timestamp,
-                            markdown_table
-                        ) VALUES (%s, %s, %s, %s, %s)
-                    """
-    with engine.begin() as con:
-        con.execute(text(query), (session_id, user_input, assistant_reply, timestamp, markdown_table))
-        con.commit()
-
-
-
-
-
-##########################################
-### might need to delete later
-# Replace Google Docs constants with DB config
-DB_HOST = os.getenv("DB_HOST")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_SSL = os.getenv("DB_SSL", "prefer")  # For secure connections
-POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # Connection pool size
-
-
-DATABASE_SCHEMA = """
-Table: startup_profile
-Columns:
-    - Startup (TEXT)
-    - HQ Location (TEXT)
-    - HQ Country (TEXT)
-    - Description (TEXT)
-    - Sectors (TEXT)
-    - Industry Groups (TEXT) (MULTI-SELECT)
-    - Last Funding Date (DATE)
-    - Last Funding Amount (NUMERIC)
-    - Series (TEXT)
-    - Total Funding Amount (NUMERIC)
-    - Top 5 Investors (TEXT) (MULTI-SELECT)
-    - Monthly Visits (INTEGER)
-    - Number of Funding Rounds (INTEGER)
-    - Estimated Revenue (NUMERIC)
-
-Table: funding_rounds
-Columns:
-    - Series Company (TEXT)
-    - Startup (TEXT)
-    - Series (TEXT)
-    - Funds Raised (NUMERIC)
-    - Announced Date (DATE)
-    - Sectors (TEXT) (MULTI-SELECT)
-    - All Investors (TEXT) (MULTI-SELECT)
-    - Pre Money Valuation (NUMERIC)
-    - Number of Investors (INTEGER)
-    - Startup Description (TEXT)
-    - Company Website (TEXT)
-    - Revenue Range (TEXT)
-    - Total Funding Amount (NUMERIC)
-    - Number of Funding Rounds (INTEGER)
-    - Funding Round Type (TEXT)
-
-Relationships:
-    - startup_profile.Startup = funding_rounds.Startup (indicating a common identifier for a startup across tables)
-"""
+# One bounded pool per kind of work, sized from DB_CONNECTION_BUDGET (see VC_db_pools)
+pools = PoolManager(os.environ["POSTGRES_URL"])
+
+engine = pools.engine("interactive")            # VC tools, snapshots, chat history
+agent_sql_engine = pools.engine("agent_sql")    # LLM-written SQL (execute_query, SQL toolkit)
+background_engine = pools.engine("background")  # sheet loads, derived tables, logging
+async_engine = pools.engine("async")            # ASGI serving mode
+
+# SQLDatabase reflects the whole schema and the toolkit needs a Vertex AI client:
+# both are built on first use only
+_sql_toolkit = None
+_sql_toolkit_lock = threading.Lock()
+
+def get_sql_toolkit():
+    """LangChain SQLDatabaseToolkit over the agent SQL pool, created on first call."""
+    global _sql_toolkit
+    if _sql_toolkit is None:
+        with _sql_toolkit_lock:
+            if _sql_toolkit is None:
+                from vertexai import init
+                from langchain_google_vertexai import ChatVertexAI
+                from langchain_community.utilities.sql_database import SQLDatabase
+                from langchain_community.agent_toolkits import SQLDatabaseToolkit
+                init(project="soy-blend-462121-m4", location="europe-west8")
+                llm_main = ChatVertexAI(model_name="gemini-2.5-flash", temperature=0, thinking_budget=1024)
+                _sql_toolkit = SQLDatabaseToolkit(db=SQLDatabase(agent_sql_engine), llm=llm_main)
+    return _sql_toolkit
+
+
+# Sheets are loaded by ingest_sheets.py (VC_sheet_ingest), never at startup; the flag is only warned about
+LOAD_SHEETS = os.getenv("LOAD_SHEETS", "false").lower() == "true"
 
-### to be deleted later:
 
 
-SHEETS = {
-    "vc_overall_raw":   (os.environ["VC_FIRMS_SHEET_ID"],   0),  # gid 0
-    "vc_sector_based_raw": (os.environ["VC_FIRMS_SHEET_ID"], 1673702863),
-    "vc_market_cagr": (os.environ["VC_FIRMS_SHEET_ID"], 1104412318),
-    "funding_rounds":   (os.environ["FUNDING_ROUNDS_SHEET_ID"], 0),
-    "startup_profile": (os.environ["STARTUP_DATA_SHEET_ID"],    0),
+# ── funding_rounds_v2 link tables ─────────────────────────────────────
+# investors / categories are comma-separated text. The tools query these
+# normalized (round × investor) and (round × category) tables instead of
+# exploding the whole table on every call. funding_round_link_sources keeps
+# the raw text each round's links were built from, so a refresh only
+# rebuilds rounds that are new, changed or deleted.
+
+FUNDING_ROUND_LINKS_DDL = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    ALTER TABLE funding_rounds_v2
+        ADD COLUMN IF NOT EXISTS round_id BIGINT GENERATED BY DEFAULT AS IDENTITY;
+    CREATE UNIQUE INDEX IF NOT EXISTS funding_rounds_v2_round_id_idx ON funding_rounds_v2 (round_id);
+
+    CREATE TABLE IF NOT EXISTS funding_round_investors (
+        round_id BIGINT NOT NULL,
+        investor TEXT   NOT NULL,
+        PRIMARY KEY (round_id, investor)
+    );
+    CREATE INDEX IF NOT EXISTS funding_round_investors_investor_idx ON funding_round_investors (investor, round_id);
+    CREATE INDEX IF NOT EXISTS funding_round_investors_investor_trgm_idx ON funding_round_investors USING gin (investor gin_trgm_ops);
+
+    CREATE TABLE IF NOT EXISTS funding_round_categories (
+        round_id BIGINT NOT NULL,
+        category TEXT   NOT NULL,
+        PRIMARY KEY (round_id, category)
+    );
+    CREATE INDEX IF NOT EXISTS funding_round_categories_category_idx ON funding_round_categories (category, round_id);
+    CREATE INDEX IF NOT EXISTS funding_round_categories_category_trgm_idx ON funding_round_categories USING gin (category gin_trgm_ops);
+
+    CREATE TABLE IF NOT EXISTS funding_round_link_sources (
+        round_id   BIGINT PRIMARY KEY,
+        investors  TEXT,
+        categories TEXT
+    );
+"""
+
+FUNDING_ROUND_LINKS_REFRESH = """
+    CREATE TEMP TABLE stale_rounds ON COMMIT DROP AS
+    SELECT s.round_id
+    FROM   funding_round_link_sources s
+    LEFT   JOIN funding_rounds_v2 fr ON fr.round_id = s.round_id
+    WHERE  fr.round_id IS NULL
+       OR  fr.investors  IS DISTINCT FROM s.investors
+       OR  fr.categories IS DISTINCT FROM s.categories;
+
+    DELETE FROM funding_round_investors    WHERE round_id IN (SELECT round_id FROM stale_rounds);
+    DELETE FROM funding_round_categories   WHERE round_id IN (SELECT round_id FROM stale_rounds);
+    DELETE FROM funding_round_link_sources WHERE round_id IN (SELECT round_id FROM stale_rounds);
+
+    CREATE TEMP TABLE pending_rounds ON COMMIT DROP AS
+    SELECT fr.round_id, fr.investors, fr.categories
+    FROM   funding_rounds_v2 fr
+    WHERE  NOT EXISTS (SELECT 1 FROM funding_round_link_sources s WHERE s.round_id = fr.round_id);
+
+    INSERT INTO funding_round_investors (round_id, investor)
+    SELECT DISTINCT p.round_id, TRIM(firm.value)
+    FROM   pending_rounds p
+    CROSS  JOIN LATERAL unnest(string_to_array(COALESCE(p.investors, ''), ',')) AS firm(value)
+    WHERE  TRIM(firm.value) <> ''
+      AND  TRIM(firm.value) <> '#NAME? ()';
+
+    INSERT INTO funding_round_categories (round_id, category)
+    SELECT DISTINCT p.round_id, TRIM(sec.value)
+    FROM   pending_rounds p
+    CROSS  JOIN LATERAL unnest(string_to_array(COALESCE(p.categories, ''), ',')) AS sec(value)
+    WHERE  TRIM(sec.value) <> ''
+      AND  TRIM(sec.value) <> '#NAME? ()';
+
+    INSERT INTO funding_round_link_sources (round_id, investors, categories)
+    SELECT round_id, investors, categories FROM pending_rounds;
+"""
+
+def refresh_funding_round_links() -> int:
+    """Create the link tables if needed and bring them in line with funding_rounds_v2. Returns rounds rebuilt."""
+    started = time.time()
+    with background_engine.begin() as conn:
+        conn.execute(text(FUNDING_ROUND_LINKS_DDL))
+        conn.execute(text(FUNDING_ROUND_LINKS_REFRESH))
+        rebuilt = conn.execute(text(
+            "SELECT COUNT(*) FROM (SELECT round_id FROM stale_rounds UNION SELECT round_id FROM pending_rounds) r"
+        )).scalar()
+        conn.execute(text("ANALYZE funding_round_investors; ANALYZE funding_round_categories;"))
+    print(f"Funding round link tables refreshed in {time.time() - started:.2f}s ({rebuilt} rounds rebuilt)")
+    return rebuilt
+
+
+# ── Typed VC metric columns ──────────────────────────────────────────
+# The sheets store metrics as text ("$9,200,000,000", "1M-3M", "37.46%").
+# Each METRIC_EXPR is evaluated once per row here and stored in a NUMERIC
+# column (METRIC_NUMERIC_COLUMN) with its own index, so VCRankingTool sorts
+# on a plain column instead of re-parsing every row on every call.
+
+VC_JOIN_KEY_INDEXES = {
+    "vc_overall_raw":      ["Top Tier"],
+    "vc_sector_based_raw": ["Top Tier", "Sector"],
+    "vc_market_cagr":      ["Sector"],
 }
 
-def public_csv_url(sheet_id: str, gid: int):
-    return (f"https://docs.google.com/spreadsheets/d/{sheet_id}/"
-            f"export?format=csv&gid={gid}")
+def _index_name(table: str, column: str) -> str:
+    return f"{table}_{re.sub(r'[^a-z0-9]+', '_', column.lower()).strip('_')}_idx"
 
-LOAD_SHEETS = os.getenv("LOAD_SHEETS", "false").lower() == "true"
+def vc_metric_columns(table: str) -> list[str]:
+    """Typed metric columns of one VC table (empty for any other table)."""
+    return [vc_systemprompts.METRIC_NUMERIC_COLUMN[metric] for metric, (source, _) in vc_systemprompts.METRIC_SOURCE.items()
+            if source == table]
 
-if LOAD_SHEETS:
-    with engine.begin() as conn:
-        for table, (sheet_id, gid) in SHEETS.items():
-            df = pd.read_csv(public_csv_url(sheet_id, gid))
-            df.replace({'NO DATA': None}, inplace=True)   # keep NULL semantics
-            df.to_sql(table, conn, if_exists="replace", index=False)  # 👈 creates or overwrites
-
-        # Optional: run any type-casts Supabase needs
-        conn.execute(text("""
-            ALTER TABLE funding_rounds
-            ALTER COLUMN "Announced Date" TYPE date USING to_date("Announced Date", 'Mon DD, YYYY'),
-            ALTER COLUMN "Funds Raised" TYPE numeric USING replace(replace("Funds Raised", ',', ''), '$', '')::numeric;
-            
-            ALTER TABLE startup_profile
-            ALTER COLUMN "Last Funding Date" TYPE date USING to_date("Last Funding Date", 'Mon DD, YYYY');
-        """))
-
-
-# Database connection pool (using psycopg2)
-db_pool = None
-
-def init_db_pool():
-    global db_pool
-    if not all([DB_HOST, DB_NAME, DB_USER, DB_PASSWORD]):
-        return
-    
-    try:
-        db_pool = ThreadedConnectionPool(
-            minconn=1,
-            maxconn=POOL_SIZE,
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            sslmode=DB_SSL
-        )
-    except Exception as e:
-        print(f"Error initializing database pool: {e}")
+def write_vc_metric_columns(conn, table: str, target: Optional[str] = None, indexes: bool = True) -> list[str]:
+    """
+    Add and fill the typed metric columns of VC table `table` on `target` (the
+    table itself, or a staging copy about to be swapped in), with their indexes
+    and the join key indexes unless `indexes` is False. Index names follow
+    `target`, so a swap renames them with the table. Returns the indexed columns.
+    """
+    target = target or table
+    indexed = []
+    for metric, expr in vc_systemprompts.METRIC_EXPR.items():
+        source, alias = vc_systemprompts.METRIC_SOURCE[metric]
+        if source != table:
+            continue
+        column = vc_systemprompts.METRIC_NUMERIC_COLUMN[metric]
+        conn.execute(text(f'ALTER TABLE "{target}" ADD COLUMN IF NOT EXISTS "{column}" NUMERIC'))
+        conn.execute(text(f'UPDATE "{target}" AS {alias} SET "{column}" = {expr}'))
+        if indexes:
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {_index_name(target, column)} ON "{target}" ("{column}" DESC NULLS LAST)'))
+            indexed.append(column)
+    if indexes:
+        for column in VC_JOIN_KEY_INDEXES.get(table, []):
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {_index_name(target, column)} ON "{target}" ("{column}")'))
+            indexed.append(column)
+    return indexed
+
+def normalize_vc_metrics(tables=None):
+    """Write the typed metric columns and their indexes for the VC tables (all three by default)."""
+    started = time.time()
+    with background_engine.begin() as conn:
+        for table in tables or VC_JOIN_KEY_INDEXES:
+            write_vc_metric_columns(conn, table)
+            conn.execute(text(f"ANALYZE {table}"))
+    print(f"VC metric columns normalized in {time.time() - started:.2f}s")
+
+class MetricParityError(RuntimeError):
+    """The typed metric columns disagree with METRIC_EXPR; rankings on them would be wrong."""
+
+# Dataset version whose typed columns failed the parity check, or None. While it is
+# the current version VCRankingTool sorts on METRIC_EXPR and skips the in-memory engine.
+_parity_failed_version = None
+_parity_lock = threading.Lock()
+
+def check_vc_metric_parity() -> dict:
+    """
+    Compare every stored metric column against its METRIC_EXPR evaluated on the same row.
+    Returns {metric: mismatching row count}. Right after write_vc_metric_columns this is
+    zero by construction; it finds columns gone stale (raw text edited by a path that
+    did not rewrite them), so it runs when the columns were not just rebuilt.
+    """
+    mismatches = {}
+    with background_engine.connect() as conn:
+        for metric, expr in vc_systemprompts.METRIC_EXPR.items():
+            table, alias = vc_systemprompts.METRIC_SOURCE[metric]
+            column = vc_systemprompts.METRIC_NUMERIC_COLUMN[metric]
+            mismatches[metric] = conn.execute(text(
+                f'SELECT COUNT(*) FROM {table} AS {alias} WHERE {alias}."{column}" IS DISTINCT FROM ({expr})'
+            )).scalar()
+    return mismatches
+
+def verify_vc_metric_parity():
+    """Raise MetricParityError, and stop ranking on the typed columns, when any row disagrees."""
+    global _parity_failed_version
+    version = get_dataset_version()
+    mismatches = {metric: count for metric, count in check_vc_metric_parity().items() if count}
+    _parity_failed_version = version if mismatches else None
+    if mismatches:
+        raise MetricParityError(f"Typed VC metric columns disagree with METRIC_EXPR (rows per metric: {mismatches}); "
+                                f"ranking on METRIC_EXPR until the dataset version moves past {version}")
+
+def typed_metrics_usable() -> bool:
+    """
+    False while the current dataset version failed the parity check. A reload by
+    ingest_sheets.py (another process) bumps the version, and the check runs again.
+    """
+    if _parity_failed_version is None or get_dataset_version() == _parity_failed_version:
+        return _parity_failed_version is None
+    with _parity_lock:
+        if _parity_failed_version is not None and get_dataset_version() != _parity_failed_version:
+            try:
+                verify_vc_metric_parity()
+            except MetricParityError as e:
+                print(str(e))
+            except Exception as e:
+                print(f"Error re-checking VC metric parity: {e}")
+    return _parity_failed_version is None
+
+# ── Dataset version ──────────────────────────────────────────────────
+# A single counter bumped whenever the underlying data changes. In-process
+# caches remember the version they were built from and rebuild when it moves.
+# Reads are cached for DATASET_VERSION_TTL seconds so checking it is free on
+# the request path.
+
+DATASET_VERSION_TTL = float(os.getenv("DATASET_VERSION_TTL", 30))
+
+DATASET_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS dataset_version (
+        id         INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version    BIGINT      NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# What changed in each version, when the writer knows (differential sheet
+# sync): one row per table, with the changed natural keys when there are at
+# most DATASET_CHANGES_MAX_KEYS of them. A version without rows changed
+# everything as far as readers can tell.
+DATASET_CHANGES_DDL = """
+    CREATE TABLE IF NOT EXISTS dataset_changes (
+        version    BIGINT NOT NULL,
+        table_name TEXT   NOT NULL,
+        inserted   INT    NOT NULL DEFAULT 0,
+        updated    INT    NOT NULL DEFAULT 0,
+        deleted    INT    NOT NULL DEFAULT 0,
+        keys       JSONB,               -- [[key values], ...]; NULL when unknown or too many
+        PRIMARY KEY (version, table_name)
+    );
+"""
 
-# Initialize pool when module loads
-init_db_pool()
+DATASET_CHANGES_MAX_KEYS = int(os.getenv("DATASET_CHANGES_MAX_KEYS", 10_000))
 
+_dataset_version = None
+_dataset_version_checked_at = 0.0
 
-def save_interaction_to_db(session_id: str, user_input: str, assistant_reply: str, markdown_table: Optional[str] = None):
-    """Saves interaction to PostgreSQL database with retry logic"""
-    if not db_pool:
-        return
-    
-    max_retries, retry_delay = 3, 2
-    conn = None
-    
+def bump_dataset_version(changes: Optional[dict] = None) -> int:
+    """
+    Mark the data as changed; versioned caches reload on their next check.
+    `changes` ({table: {"inserted": [keys], "updated": [keys], "deleted": [keys]} or None})
+    lets them reload only what depends on those tables. Without it, everything changed.
+    """
+    global _dataset_version, _dataset_version_checked_at
+    with background_engine.begin() as conn:
+        conn.execute(text(DATASET_VERSION_DDL))
+        conn.execute(text(DATASET_CHANGES_DDL))
+        version = conn.execute(text("""
+            INSERT INTO dataset_version (id, version) VALUES (1, 1)
+            ON CONFLICT (id) DO UPDATE SET version = dataset_version.version + 1, updated_at = now()
+            RETURNING version
+        """)).scalar()
+        for table, diff in (changes or {}).items():
+            diff = diff or {}
+            keys = [list(key) for kind in ("inserted", "updated", "deleted") for key in diff.get(kind, ())]
+            conn.execute(text("""
+                INSERT INTO dataset_changes (version, table_name, inserted, updated, deleted, keys)
+                VALUES (:version, :table, :inserted, :updated, :deleted, CAST(:keys AS JSONB))
+            """), {"version": version, "table": table, "inserted": len(diff.get("inserted", ())),
+                   "updated": len(diff.get("updated", ())), "deleted": len(diff.get("deleted", ())),
+                   "keys": json.dumps(keys, default=str) if diff and len(keys) <= DATASET_CHANGES_MAX_KEYS else None})
+    _dataset_version, _dataset_version_checked_at = version, time.time()
+    print(f"Dataset version bumped to {version}" + (f" ({', '.join(changes)} changed)" if changes else ""))
+    return version
+
+_dataset_changes = {}
+
+def get_dataset_changes(since: Optional[int], until: int) -> Optional[dict]:
+    """
+    {table: set of changed key tuples, or None for "any row"} for the versions
+    after `since` up to `until`; None when that is unknown (treat as: everything changed).
+    """
+    if since is None or since >= until:
+        return None if since is None else {}
+    cached = _dataset_changes.get((since, until))
+    if cached is not None:
+        return cached[0]
     try:
-        for attempt in range(max_retries):
-            try:
-                conn = db_pool.getconn()
-                with conn.cursor() as cur:
-                    query = """
-                        INSERT INTO interactions (
-                            session_id,
-                            user_input,
-                            assistant_reply,
-                            timestamp,
-                            markdown_table
-                        ) VALUES (%s, %s, %s, %s, %s)
-                    """
-                    timestamp = datetime.datetime.now()
-                    cur.execute(query, (
-                        session_id,
-                        user_input,
-                        assistant_reply,
-                        timestamp,
-                        markdown_table
-                    ))
-                    conn.commit()
-                    return
-            except (OperationalError, InterfaceError) as e:
-                if attempt + 1 == max_retries:
-                    raise
-                time.sleep(retry_delay)
-                retry_delay *= 2
-                # Reset connection
-                if conn:
-                    db_pool.putconn(conn, close=True)
-                    conn = None
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT version, table_name, keys FROM dataset_changes
+                WHERE  version > :since AND version <= :until
+            """), {"since": since, "until": until}).fetchall()
     except Exception as e:
-        print(f"Failed to save interaction after {max_retries} attempts: {e}")
-    finally:
-        if conn:
-            db_pool.putconn(conn)
-
-print("Defining memory function...")
-memory_store = {}
-
-
-def get_session_memory(state: MessagesState, session_id: str):
-    if session_id in memory:
-        selected_messages = trim_messages(
-            memory[session_id],
-            token_counter=len,  # <-- len will simply count the number of messages rather than tokens
-            max_tokens=5,  # <-- allow up to 5 messages.
-            strategy="last",
-            start_on="human",
-            include_system=True,
-            allow_partial=False,
-        )
-        memory[session_id] = selected_messages
+        print(f"Could not read dataset changes: {e}")
+        return None
+    if {version for version, _, _ in rows} != set(range(since + 1, until + 1)):
+        changes = None
     else:
-        memory[session_id] = state["messages"]
-    return {"messages": memory[session_id]}
-
-def get_chat_history(session_id: str, limit: int = 20):
-    query = """
-        SELECT parts
-        FROM "Message_v2"
-        WHERE "chatId" = :session_id
-        ORDER BY "createdAt" DESC
-        LIMIT :limit
-    """
-    max_retries = 3
-    retry_delay = 1
+        changes = {}
+        for _, table, keys in rows:
+            if keys is None or changes.get(table, set()) is None:
+                changes[table] = None
+            else:
+                changes.setdefault(table, set()).update(tuple(key) for key in keys)
+    if len(_dataset_changes) > 100:
+        _dataset_changes.clear()
+    _dataset_changes[(since, until)] = (changes,)
+    return changes
+
+def tables_unchanged(since: Optional[int], until: int, tables) -> bool:
+    """True when none of `tables` changed between the two versions (as far as the change log knows)."""
+    changes = get_dataset_changes(since, until)
+    return changes is not None and not set(tables) & set(changes)
+
+def get_dataset_version() -> int:
+    """Current dataset version (0 if never bumped), re-read at most every DATASET_VERSION_TTL seconds."""
+    global _dataset_version, _dataset_version_checked_at
+    if _dataset_version is not None and time.time() - _dataset_version_checked_at < DATASET_VERSION_TTL:
+        return _dataset_version
+    try:
+        with engine.connect() as conn:
+            version = conn.execute(text("SELECT version FROM dataset_version WHERE id = 1")).scalar()
+        _dataset_version = version or 0
+    except Exception as e:
+        # Table not created yet (or DB hiccup): keep serving the last known version
+        print(f"Could not read dataset version: {e}")
+        if _dataset_version is None:
+            _dataset_version = 0
+    _dataset_version_checked_at = time.time()
+    return _dataset_version
+
+
+
+# ── Router decisions ──
+# Every routing decision, kept as training data for the local router
+# (VC_local_router / train_local_router.py).
+
+ROUTER_DECISIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS router_decisions (
+        id              BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        session_id      TEXT,
+        user_input      TEXT        NOT NULL,
+        context_summary TEXT,
+        query_type      TEXT        NOT NULL,
+        source          TEXT        NOT NULL,   -- 'llm' or 'local'
+        confidence      REAL,
+        created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+_router_decisions_ready = False
+
+def save_router_decision(session_id: Optional[str], user_input: str, context_summary: str, query_type: str, source: str, confidence: Optional[float] = None):
+    global _router_decisions_ready
+    try:
+        with background_engine.begin() as conn:
+            if not _router_decisions_ready:
+                conn.execute(text(ROUTER_DECISIONS_DDL))
+                _router_decisions_ready = True
+            conn.execute(text("""
+                INSERT INTO router_decisions (session_id, user_input, context_summary, query_type, source, confidence)
+                VALUES (:session_id, :user_input, :context_summary, :query_type, :source, :confidence)
+            """), {"session_id": session_id, "user_input": user_input, "context_summary": context_summary,
+                   "query_type": query_type, "source": source, "confidence": confidence})
+    except Exception as e:
+        print(f"Error saving router decision: {e}")
 
-    for attempt in range(max_retries):
+
+def refresh_derived_tables(tables=None) -> int:
+    """
+    Rebuild what is derived from the raw tables: the link tables (from
+    funding_rounds_v2) and the typed metric columns (of each VC table). With
+    `tables`, only what derives from those tables. Returns rounds rebuilt.
+    """
+    global _parity_failed_version
+    rounds_rebuilt = 0
+    if tables is None or "funding_rounds_v2" in tables:
         try:
-            with engine.begin() as con:
-                return con.execute(text(query), {"session_id": session_id, "limit": limit}).fetchall()
+            rounds_rebuilt = refresh_funding_round_links()
         except Exception as e:
-            print(f"Database connection attempt {attempt + 1} failed: {e}")
-            if attempt + 1 == max_retries:
-                print(f"Failed to get chat history after {max_retries} attempts")
-                return []
-            time.sleep(retry_delay)
-            retry_delay *= 2
\ No newline at end of file
+            print(f"Error refreshing funding round link tables: {e}")
+    vc_tables = [table for table in VC_JOIN_KEY_INDEXES if tables is None or table in tables]
+    if vc_tables:
+        try:
+            normalize_vc_metrics(vc_tables)
+            _parity_failed_version = None
+        except Exception as e:
+            print(f"Error normalizing VC metric columns: {e}")
+    return rounds_rebuilt
+
+# ingest_sheets.py writes the derived data; a full rebuild at startup takes table locks
+# and bumps the version (flushing every worker's caches), so it is opt-in
+REFRESH_DERIVED_TABLES = os.getenv("REFRESH_DERIVED_TABLES", "false").lower() == "true"
+
+def prepare_dataset():
+    """
+    Startup check of the dataset (a warm-up phase, VC_chain_logic.warm_up): the
+    metric parity check, or the full derived-table refresh with REFRESH_DERIVED_TABLES.
+    """
+    if LOAD_SHEETS:
+        print("Warning: LOAD_SHEETS is ignored at startup; load the sheets with `python ingest_sheets.py`")
+    if REFRESH_DERIVED_TABLES:
+        if refresh_derived_tables():
+            try:
+                bump_dataset_version()
+            except Exception as e:
+                print(f"Error bumping dataset version: {e}")
+    else:
+        # Columns written by an earlier ingest: make sure nothing edited the raw text since
+        verify_vc_metric_parity()
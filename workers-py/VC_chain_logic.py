@@ -1,4 +1,8 @@
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import (
     Annotated,
     Sequence,
@@ -8,7 +12,6 @@ from typing import (
 from langchain_core.prompts.chat import SystemMessagePromptTemplate
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
-from langchain.embeddings import init_embeddings
 from langchain.schema.runnable import RunnableConfig
 from langgraph.graph import add_messages
 from langgraph.prebuilt import create_react_agent
@@ -20,12 +23,23 @@ from langchain_openai import ChatOpenAI
 from pydantic_core.core_schema import TypedDictSchema
 import VC_chain_tools as vc_tools
 import VC_chain_systemprompts as vc_systemprompts
-from langgraph.store.memory import InMemoryStore
 import VC_chain_database as vc_database
 import VC_email_utils
+from VC_answer_cache import ANSWER_CACHE_ENABLED, CACHEABLE_ROUTES, get_answer_cache
+from VC_local_router import LOCAL_ROUTER_THRESHOLD, get_local_router
+from VC_vocabulary import get_vocabulary
+from VC_ranking_engine import ranking_engine
+from VC_schema_card import current_schema_card_text, get_schema_card
+from VC_chat_history import CREATE_HISTORY_INDEX, ensure_history_index
+from VC_interaction_logger import interaction_logger
+from VC_summary_store import SessionSummary, WATERMARK_MESSAGES, find_watermark, message_fingerprint, summary_store
+from VC_startup import startup
+from VC_metrics import graph_callbacks, graph_duration, router_decisions, routes, timed_node
+from VC_prompt_cache import DEFAULT_CACHE_CONTROL, PROMPT_CACHE_CONTROL, agent_messages, add_cache_control, prompt_cache_usage
 from langchain_core.messages import (
     BaseMessage,
     HumanMessage,
+    SystemMessage,
     trim_messages,
 )
 from typing import Annotated
@@ -40,6 +54,9 @@ GOOGLE_DOC_ID = os.getenv("GOOGLE_DOC_ID")
 
 # OpenRouter LLM class
 class ChatOpenRouter(ChatOpenAI):
+    # Breakpoint hint after the static system prompt (see VC_prompt_cache); None sends no hint
+    cache_control: Optional[dict] = Field(default_factory=lambda: dict(DEFAULT_CACHE_CONTROL) if PROMPT_CACHE_CONTROL else None)
+
     @property
     def lc_secrets(self) -> dict[str, str]:
         return {"openai_api_key": "OPENROUTER_API"}
@@ -48,12 +65,24 @@ class ChatOpenRouter(ChatOpenAI):
                  openai_api_key: Optional[str] = None,
                  **kwargs):
         openai_api_key = openai_api_key or os.environ.get("OPENROUTER_API")
-        super().__init__(base_url="https://openrouter.ai/api/v1", openai_api_key=openai_api_key, **kwargs)
+        # Usage (with cached prompt tokens) also on streamed responses, counted by prompt_cache_usage
+        kwargs.setdefault("stream_usage", True)
+        kwargs.setdefault("callbacks", [prompt_cache_usage])
+        super().__init__(base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"), openai_api_key=openai_api_key, **kwargs)
+
+    def _get_request_payload(self, input_, *, stop=None, **kwargs) -> dict:
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        return add_cache_control(payload, self.cache_control) if self.cache_control else payload
 
 ####### Router output parser #######
 class RouterOutput(TypedDict):
     query_type: Annotated[str, "The agent to be routed to"]
 
+####### Fused context + router output parser #######
+class ContextRouterOutput(TypedDict):
+    context_summary: Annotated[str, "The extracted conversation context, in the context tracking output format"]
+    query_type: Annotated[str, "The agent to be routed to"]
+
 # --- Configure Logging ---
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO) # Adjust level as needed
@@ -64,8 +93,7 @@ if not log.handlers:
     handler.setFormatter(formatter)
     log.addHandler(handler)
 
-# Shared LLM instances (reused across all agents to save memory)
-print("Initializing shared LLMs...")
+# Shared LLM instances (reused across all agents to save memory), created on first use
 _shared_llm_gemini = None
 _shared_llm_kimi = None
 
@@ -92,6 +120,35 @@ class AgentState(TypedDict):
     general_agent_check: bool
     reasoning_validated_check: bool
     output: str
+    route: str           # Agent picked by the router (set by the answer cache lookup)
+    cache_hit: bool      # Answer served from the answer cache, agents skipped
+    agent_failed: bool   # Agent hit an error; its answer must not be cached
+
+
+
+################## AGENT REGISTRY ##################
+# The ReAct agents are compiled on first use (or in warm_up), not on import
+AGENT_FACTORIES = {
+    "general": lambda: create_react_agent(get_shared_llm_gemini(), vc_tools.general_tools, prompt=vc_systemprompts.GENERAL_SYSTEM_PROMPT),
+    "ranking": lambda: create_react_agent(get_shared_llm_gemini(), vc_tools.ranking_tools, prompt=vc_systemprompts.RANKING_SYSTEM_PROMPT),
+    "reasoning": lambda: create_react_agent(get_shared_llm_gemini(), vc_tools.reasoning_tools, prompt=reasoning_prompt),
+    "reasoning_validator": lambda: create_react_agent(get_shared_llm_gemini(), vc_tools.reasoning_tools, prompt=vc_systemprompts.REASONING_VALIDATOR_SYSTEM_PROMPT),
+    "prediction": lambda: create_react_agent(get_shared_llm_gemini(), vc_tools.prediction_tools, prompt=vc_systemprompts.PREDICTION_SYSTEM_PROMPT),
+    "final": lambda: create_react_agent(get_shared_llm_kimi(), tools=vc_tools.final_tools, prompt=vc_systemprompts.FINAL_SYSTEM_PROMPT),
+}
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+def get_agent(name: str):
+    agent = _agents.get(name)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(name)
+            if agent is None:
+                with startup.phase(f"agent:{name}"):
+                    agent = _agents[name] = AGENT_FACTORIES[name]()
+    return agent
 
 
 ################## AGENT MEMORY LIMITER ##################
@@ -108,7 +165,64 @@ def trim_chat_history(state: AgentState, config: RunnableConfig):
 
 ################## CONTEXT SUMMARIZER ##################
 
-def run_context_summarizer(state: AgentState, config: RunnableConfig):
+def message_role_content(msg) -> tuple[str, str]:
+    role = "User" if isinstance(msg, HumanMessage) else "Assistant"
+    content = msg.content if hasattr(msg, 'content') else str(msg)
+    return role, content
+
+def build_conversation_text(chat_history: list[BaseMessage], current_input: str) -> str:
+    """Transcript of the history plus the current input, as the summarizer reads it"""
+    conversation_text = ""
+    for msg in chat_history:
+        role, content = message_role_content(msg)
+        conversation_text += f"{role}: {content}\n\n"
+
+    conversation_text += f"User (current): {current_input}"
+    return conversation_text
+
+def minimal_context_summary(current_input: str) -> str:
+    """Context for a conversation with no history; needs no LLM call"""
+    return f"CONSTRAINTS: None specified yet\nSECTOR: Not established\nENTITIES: None\nINTENT: {current_input[:200]}"
+
+def conversation_fingerprints(chat_history: list[BaseMessage], current_input: str = None) -> list[str]:
+    fingerprints = [message_fingerprint(*message_role_content(msg)) for msg in chat_history]
+    if current_input is not None:
+        fingerprints.append(message_fingerprint("User", current_input))
+    return fingerprints
+
+async def build_summarizer_request(state: AgentState, config: RunnableConfig, instruction: str) -> tuple[str, Optional[SessionSummary]]:
+    """
+    Text the summarizer analyzes this turn. With a stored summary whose watermark is
+    still in the history, only the messages after it are sent, next to that summary;
+    otherwise the whole transcript is.
+    """
+    chat_history = state.get("chat_history", [])
+    current_input = state["input"]
+    session_id = config.get("configurable", {}).get("thread_id")
+    previous = await summary_store.get(session_id) if session_id else None
+    if previous is not None:
+        start = find_watermark(conversation_fingerprints(chat_history), previous.watermark)
+        if start is not None:
+            new_text = build_conversation_text(chat_history[start:], current_input)
+            return (f"{instruction} Update the previous context with the new messages; keep every constraint "
+                    f"that still applies.\n\n[PREVIOUS CONTEXT]\n{previous.context_summary}\n\n[NEW MESSAGES]\n{new_text}"), previous
+    return f"{instruction}\n\n{build_conversation_text(chat_history, current_input)}", None
+
+def save_context_summary(state: AgentState, config: RunnableConfig, context_summary: str, previous: Optional[SessionSummary]):
+    """Remember the summary, watermarked at the current input, for the next turn"""
+    session_id = config.get("configurable", {}).get("thread_id")
+    if not session_id:
+        return
+    chat_history = state.get("chat_history", [])
+    fingerprints = conversation_fingerprints(chat_history, state["input"])
+    if previous is not None:
+        start = find_watermark(conversation_fingerprints(chat_history), previous.watermark)
+        messages_covered = previous.messages_covered + len(chat_history) - start + 1
+    else:
+        messages_covered = len(fingerprints)
+    summary_store.put(session_id, SessionSummary(context_summary, fingerprints[-WATERMARK_MESSAGES:], messages_covered))
+
+async def run_context_summarizer(state: AgentState, config: RunnableConfig):
     """Extract key constraints and context from the conversation history to pass to all agents"""
     print("\033[95m📋 Running CONTEXT SUMMARIZER\033[0m")
     
@@ -117,29 +231,26 @@ def run_context_summarizer(state: AgentState, config: RunnableConfig):
     
     # If no history, create a minimal context from just the current input
     if not chat_history or len(chat_history) == 0:
-        return {"context_summary": f"CONSTRAINTS: None specified yet\nSECTOR: Not established\nENTITIES: None\nINTENT: {current_input[:200]}"}
-    
-    # Build conversation string for the summarizer
-    conversation_text = ""
-    for msg in chat_history:
-        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-        content = msg.content if hasattr(msg, 'content') else str(msg)
-        conversation_text += f"{role}: {content}\n\n"
+        context_summary = minimal_context_summary(current_input)
+        save_context_summary(state, config, context_summary, None)
+        return {"context_summary": context_summary}
     
-    conversation_text += f"User (current): {current_input}"
+    # Only the messages the stored summary doesn't cover yet
+    request_text, previous = await build_summarizer_request(state, config, "Analyze this conversation and extract the key context:")
     
     # Use the fast LLM to extract context
     summarizer_llm = get_shared_llm_gemini()
     
     messages = [
-        vc_systemprompts.CONTEXT_SUMMARIZER_SYSTEM_PROMPT,
-        HumanMessage(content=f"Analyze this conversation and extract the key context:\n\n{conversation_text}")
+        SystemMessage(content=vc_systemprompts.CONTEXT_SUMMARIZER_SYSTEM_PROMPT),
+        HumanMessage(content=request_text)
     ]
     
     try:
-        response = summarizer_llm.invoke(messages, config)
+        response = await summarizer_llm.ainvoke(messages, config)
         context_summary = response.content if hasattr(response, 'content') else str(response)
-        print(f"\033[95m📋 Context extracted: {context_summary[:200]}...\033[0m")
+        print(f"\033[95m📋 Context extracted ({'incremental' if previous else 'full'}): {context_summary[:200]}...\033[0m")
+        save_context_summary(state, config, context_summary, previous)
         return {"context_summary": context_summary}
     except Exception as e:
         print(f"Error in context summarizer: {e}")
@@ -151,30 +262,125 @@ def run_context_summarizer(state: AgentState, config: RunnableConfig):
 # -----------CONVERTED TO LANGGRAPH REACT AGENT --------------
 
 #router_agent = create_react_agent(router_llm, tools=, prompt=vc_systemprompts.ROUTER_SYSTEM_PROMPT)
-def run_router_model(state: AgentState, config: RunnableConfig):
-    print("\033[94m🧭 Running ROUTER agent\033[0m")
+async def run_llm_router(state: AgentState, config: RunnableConfig) -> RouterOutput:
     router_llm = get_shared_llm_gemini().with_structured_output(RouterOutput)
-    context_msg = HumanMessage(content=f"[CONVERSATION CONTEXT]\n{state.get('context_summary', '')}\n\n[CURRENT QUERY]\n{state['input']}")
-    messages = [vc_systemprompts.ROUTER_SYSTEM_PROMPT, context_msg] + state["chat_history"]
+    messages = [SystemMessage(content=vc_systemprompts.ROUTER_SYSTEM_PROMPT)] + agent_messages(state["chat_history"], "CONVERSATION CONTEXT", state.get("context_summary", ""), state["input"])
     # Router just classifies - no tools needed
     router_config = {**config, "configurable": {**config.get("configurable", {}), "recursion_limit": 1}}
-    response = router_llm.invoke(messages, router_config)
+    return await router_llm.ainvoke(messages, router_config)
+
+async def run_router_model(state: AgentState, config: RunnableConfig):
+    print("\033[94m🧭 Running ROUTER agent\033[0m")
+    session_id = config.get("configurable", {}).get("thread_id")
+    loop = asyncio.get_running_loop()
+
+    # Confident local classification skips the LLM round trip
+    local_router = get_local_router()
+    if local_router is not None and not state["general_agent_check"]:
+        query_type, confidence = local_router.predict(state["input"], state.get("context_summary", ""))
+        if confidence >= LOCAL_ROUTER_THRESHOLD:
+            print(f"\033[94m🧭 Local router: {query_type} ({confidence:.2f})\033[0m")
+            router_decisions.inc(source="local")
+            loop.run_in_executor(None, vc_database.save_router_decision, session_id, state["input"], state.get("context_summary", ""), query_type, "local", confidence)
+            return {"output": {"query_type": query_type}}
+
+    response = await run_llm_router(state, config)
+    router_decisions.inc(source="llm")
+    # Logged in the background as training data for the local router
+    loop.run_in_executor(None, vc_database.save_router_decision, session_id, state["input"], state.get("context_summary", ""), response["query_type"], "llm")
     return {"output": response}
 
 
+# ------------------------------------------------------------
+# -------------- FUSED CONTEXT + ROUTER ----------------------
+# ------------------------------------------------------------
+# Optional replacement for context_summarizer -> router: one structured-output
+# call returns both the context summary and the route. Enable with
+# FUSED_CONTEXT_ROUTER=true.
+
+USE_FUSED_CONTEXT_ROUTER = os.getenv("FUSED_CONTEXT_ROUTER", "false").lower() == "true"
+
+async def run_two_call_context_router(state: AgentState, config: RunnableConfig):
+    """The original summarizer then router sequence, as one state update"""
+    summary_update = await run_context_summarizer(state, config)
+    route_update = await run_router_model({**state, **summary_update}, config)
+    return {**summary_update, **route_update}
+
+async def run_context_router(state: AgentState, config: RunnableConfig):
+    print("\033[95m📋🧭 Running CONTEXT ROUTER\033[0m")
+    chat_history = state.get("chat_history", [])
+    current_input = state["input"]
+
+    # No-history fast path: the summary is built locally, only the routing call goes out
+    if not chat_history:
+        return await run_two_call_context_router(state, config)
+
+    context_router_llm = get_shared_llm_gemini().with_structured_output(ContextRouterOutput)
+    request_text, previous = await build_summarizer_request(state, config, "Analyze this conversation, extract the key context and classify the current query:")
+    messages = [
+        SystemMessage(content=vc_systemprompts.CONTEXT_ROUTER_SYSTEM_PROMPT),
+        HumanMessage(content=request_text)
+    ]
+    try:
+        response = await context_router_llm.ainvoke(messages, config)
+        print(f"\033[95m📋 Context extracted ({'incremental' if previous else 'full'}): {response['context_summary'][:200]}...\033[0m")
+        save_context_summary(state, config, response["context_summary"], previous)
+        router_decisions.inc(source="fused")
+        asyncio.get_running_loop().run_in_executor(None, vc_database.save_router_decision, config.get("configurable", {}).get("thread_id"), current_input, response["context_summary"], response["query_type"], "llm")
+        return {"context_summary": response["context_summary"], "output": {"query_type": response["query_type"]}}
+    except Exception as e:
+        print(f"Error in context router, falling back to two calls: {e}")
+        return await run_two_call_context_router(state, config)
+
+
+# ------------------------------------------------------------
+# -------------- ANSWER CACHE --------------------------------
+# ------------------------------------------------------------
+# Once the context is resolved and the query routed, a cached answer for the
+# same question (exact or semantically close) skips the agent and final
+# nodes. Fresh answers are stored after the final node. Disable with
+# ANSWER_CACHE=false.
+
+async def run_answer_cache_lookup(state: AgentState, config: RunnableConfig):
+    route = router_function(state)
+    if state["general_agent_check"] or route not in CACHEABLE_ROUTES:
+        return {"route": route, "cache_hit": False}
+    try:
+        answer = await get_answer_cache().lookup(state.get("context_summary", ""), state["input"], route)
+    except Exception as e:
+        print(f"Error in answer cache lookup: {e}")
+        answer = None
+    if answer is None:
+        return {"route": route, "cache_hit": False}
+    print("\033[92m⚡ Answer served from cache\033[0m")
+    return {"route": route, "cache_hit": True, "output": HumanMessage(content=answer)}
+
+async def run_answer_cache_store(state: AgentState, config: RunnableConfig):
+    if state.get("route") not in CACHEABLE_ROUTES or state["general_agent_check"] or state.get("agent_failed"):
+        return {}
+    answer = getattr(state.get("output"), "content", None)
+    if answer:
+        try:
+            await get_answer_cache().store(state.get("context_summary", ""), state["input"], state["route"], answer)
+        except Exception as e:
+            print(f"Error storing answer in cache: {e}")
+    return {}
+
+def answer_cache_function(state: AgentState):
+    return "END" if state.get("cache_hit") else state["route"]
+
+
 # ------------------------------------------------------------
 # -------------- GENERAL AGENT CHAIN -------------------------
 # -----------CONVERTED TO LANGGRAPH REACT AGENT --------------
 
-general_agent = create_react_agent(get_shared_llm_gemini(), vc_tools.general_tools)
 
-def run_general_model(state: AgentState, config: RunnableConfig):
+async def run_general_model(state: AgentState, config: RunnableConfig):
     print("\033[94m🤖 Running GENERAL agent\033[0m")
-    context_msg = HumanMessage(content=f"[CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS]\n{state.get('context_summary', '')}\n\n[CURRENT QUERY]\n{state['input']}")
-    messages = [vc_systemprompts.GENERAL_SYSTEM_PROMPT, context_msg] + state["chat_history"]
+    messages = agent_messages(state["chat_history"], "CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS", state.get("context_summary", ""), state["input"])
     # General agent: 1-2 web searches + datetime
     general_config = {**config, "configurable": {**config.get("configurable", {}), "recursion_limit": 3}}
-    response = general_agent.invoke({"messages": messages}, general_config)
+    response = await get_agent("general").ainvoke({"messages": messages}, general_config)
     return {"output": response["messages"][-1]}
 
 
@@ -182,15 +388,13 @@ def run_general_model(state: AgentState, config: RunnableConfig):
 # -------------- RANKING AGENT CHAIN -------------------------
 # -----------CONVERTED TO LANGGRAPH REACT AGENT --------------
 
-ranking_agent = create_react_agent(get_shared_llm_gemini(), vc_tools.ranking_tools)
 
-def run_ranking_model(state: AgentState, config: RunnableConfig):
+async def run_ranking_model(state: AgentState, config: RunnableConfig):
     print("\033[94m📊 Running RANKING agent\033[0m")
-    context_msg = HumanMessage(content=f"[CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS]\n{state.get('context_summary', '')}\n\n[CURRENT QUERY]\n{state['input']}")
-    messages = [vc_systemprompts.RANKING_SYSTEM_PROMPT, context_msg] + state["chat_history"]
+    messages = agent_messages(state["chat_history"], "CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS", state.get("context_summary", ""), state["input"])
     # Ranking agent: get sectors/subsectors + call ranking tool
     ranking_config = {**config, "configurable": {**config.get("configurable", {}), "recursion_limit": 4}}
-    response = ranking_agent.invoke({"messages": messages}, ranking_config)
+    response = await get_agent("ranking").ainvoke({"messages": messages}, ranking_config)
     return {"output": response["messages"][-1]}
 print(type(vc_tools.ranking_tools))
 
@@ -199,14 +403,22 @@ print(type(vc_tools.ranking_tools))
 # -------------- REASONING AGENT CHAIN -----------------------
 # -----------CONVERTED TO LANGGRAPH REACT AGENT --------------
 
-reasoning_agent = create_react_agent(get_shared_llm_gemini(), vc_tools.reasoning_tools, prompt=vc_systemprompts.REASONING_SYSTEM_PROMPT)
 
 
 
-def run_reasoning_model(state: AgentState, config: RunnableConfig):
+def reasoning_prompt(state) -> list[BaseMessage]:
+    """Static instructions, then the generated schema card (both fixed for a dataset version, so the prefix stays cacheable)."""
+    system = [SystemMessage(content=vc_systemprompts.REASONING_SYSTEM_PROMPT)]
+    card = current_schema_card_text()
+    if card:
+        system.append(SystemMessage(content=card))
+    return system + list(state["messages"])
+
+async def run_reasoning_model(state: AgentState, config: RunnableConfig):
     print("\033[94m🧠 Running REASONING agent\033[0m")
-    context_msg = HumanMessage(content=f"[CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS]\n{state.get('context_summary', '')}\n\n[CURRENT QUERY]\n{state['input']}")
-    messages = [context_msg] + state["chat_history"]
+    # Rebuilds the card off the event loop when the dataset version moved; a no-op otherwise
+    await asyncio.get_running_loop().run_in_executor(None, get_schema_card)
+    messages = agent_messages(state["chat_history"], "CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS", state.get("context_summary", ""), state["input"])
     try:
         # Add recursion limit for the reasoning agent specifically
         reasoning_config = {**config, "configurable": {**config.get("configurable", {}), "recursion_limit": 7, "max_concurrency": 2}}
@@ -214,7 +426,7 @@ def run_reasoning_model(state: AgentState, config: RunnableConfig):
         print(f"🔍 REASONING AGENT - Input messages: {len(messages)}")
         print(f"🔍 REASONING AGENT - User input: {state['input']}")
 
-        response = reasoning_agent.invoke({"messages": messages}, reasoning_config)
+        response = await get_agent("reasoning").ainvoke({"messages": messages}, reasoning_config)
 
         print(f"🔍 REASONING AGENT - Response message count: {len(response['messages'])}")
         print(f"🔍 REASONING AGENT - Response types: {[type(msg).__name__ for msg in response['messages']]}")
@@ -239,18 +451,16 @@ def run_reasoning_model(state: AgentState, config: RunnableConfig):
             str(e), 
             {"source": "reasoning_agent", "input": state.get("input", "unknown")}
         )
-        return {"output": HumanMessage(content=f"Analysis encountered an error: {str(e)}")} 
+        return {"output": HumanMessage(content=f"Analysis encountered an error: {str(e)}"), "agent_failed": True}
 
 
-reasoning_validator = create_react_agent(get_shared_llm_gemini(), vc_tools.reasoning_tools)
 
-def run_reasoning_validator(state: AgentState, config: RunnableConfig):
+async def run_reasoning_validator(state: AgentState, config: RunnableConfig):
     print("\033[94m🧠 Running REASONING VALIDATOR agent\033[0m")
-    context_msg = HumanMessage(content=f"[CONVERSATION CONTEXT]\n{state.get('context_summary', '')}\n\n[CURRENT QUERY]\n{state['input']}")
-    messages = [vc_systemprompts.REASONING_VALIDATOR_SYSTEM_PROMPT, context_msg] + state["chat_history"]
+    messages = agent_messages(state["chat_history"], "CONVERSATION CONTEXT", state.get("context_summary", ""), state["input"])
     # Validator just checks output - minimal turns
     validator_config = {**config, "configurable": {**config.get("configurable", {}), "recursion_limit": 2}}
-    response = reasoning_validator.invoke({"messages": messages}, validator_config)
+    response = await get_agent("reasoning_validator").ainvoke({"messages": messages}, validator_config)
     return {"output": response["messages"][-1], "reasoning_validated_check": str("reasoning_validated_check: True") in response["messages"][-1].content}
 
 
@@ -258,17 +468,15 @@ def run_reasoning_validator(state: AgentState, config: RunnableConfig):
 # -------------- PREDICTION AGENT CHAIN ----------------------
 # -----------CONVERTED TO LANGGRAPH REACT AGENT --------------
 
-prediction_agent = create_react_agent(get_shared_llm_gemini(), vc_tools.prediction_tools, prompt=vc_systemprompts.PREDICTION_SYSTEM_PROMPT)
 
-def run_prediction_model(state: AgentState, config: RunnableConfig):
+async def run_prediction_model(state: AgentState, config: RunnableConfig):
     print("\033[94m🔮 Running PREDICTION agent\033[0m")
     # Include context with constraints for prediction agent
-    context_msg = HumanMessage(content=f"[CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS]\n{state.get('context_summary', '')}\n\n[CURRENT QUERY]\n{state['input']}")
-    messages = [context_msg] + state["chat_history"]
+    messages = agent_messages(state["chat_history"], "CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS", state.get("context_summary", ""), state["input"])
     try:
         # Add recursion limit for the prediction agent specifically
         prediction_config = {**config, "configurable": {**config.get("configurable", {}), "recursion_limit": 9, "max_concurrency": 2}}
-        response = prediction_agent.invoke({"messages": messages}, prediction_config)
+        response = await get_agent("prediction").ainvoke({"messages": messages}, prediction_config)
         return {"output": response["messages"][-1]}
     except Exception as e:
         print(f"Error in prediction agent: {e}")
@@ -276,21 +484,20 @@ def run_prediction_model(state: AgentState, config: RunnableConfig):
             str(e), 
             {"source": "prediction_agent", "input": state.get("input", "unknown")}
         )
-        return {"output": HumanMessage(content=f"Prediction analysis encountered an error: {str(e)}")}
+        return {"output": HumanMessage(content=f"Prediction analysis encountered an error: {str(e)}"), "agent_failed": True}
 
 # ------------------------------------------------------------
 # -------------- FINAL AGENT CHAIN -------------------------
 # ------------------------------------------------------------ --------------
 
-final_agent = create_react_agent(get_shared_llm_kimi(), tools=vc_tools.final_tools, prompt=vc_systemprompts.FINAL_SYSTEM_PROMPT)
-def run_final_model(state: AgentState, config: RunnableConfig):
+async def run_final_model(state: AgentState, config: RunnableConfig):
     print("\033[94m🎯 Running FINAL agent\033[0m")
     # Include context with constraints for final presentation
-    context_msg = HumanMessage(content=f"[CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS IN YOUR RESPONSE]\n{state.get('context_summary', '')}\n\n[CURRENT QUERY]\n{state['input']}")
-    messages = [vc_systemprompts.FINAL_SYSTEM_PROMPT, context_msg] + state["chat_history"]
+    # FINAL_SYSTEM_PROMPT is the agent's prompt; it used to be sent a second time here
+    messages = agent_messages(state["chat_history"], "CONVERSATION CONTEXT - MUST RESPECT THESE CONSTRAINTS IN YOUR RESPONSE", state.get("context_summary", ""), state["input"])
     # Final agent should be fast - 4 steps max
     final_config = {**config, "configurable": {**config.get("configurable", {}), "recursion_limit": 2, "max_concurrency": 1}}
-    response = final_agent.invoke({"messages": messages}, final_config)
+    response = await get_agent("final").ainvoke({"messages": messages}, final_config)
 
     # Extract only the final text content, not the full state
     final_message = response["messages"][-1]
@@ -321,6 +528,12 @@ def router_function(state: AgentState):
         else:
             return "general"
 
+def route_function(state: AgentState):
+    """Conditional edge into the agents (or END on an answer cache hit), counted in vc_routes_total."""
+    route = answer_cache_function(state) if ANSWER_CACHE_ENABLED else router_function(state)
+    routes.inc(route="cache" if route == "END" else route)
+    return route
+
 def validator_function(state: AgentState):
     if state["reasoning_validated_check"] == False:
         return "reasoning"
@@ -329,26 +542,48 @@ def validator_function(state: AgentState):
 
 # -------------------CHAIN ASSEMBLY--------------------------
 
-graph_builder.add_node("memory_limiter", trim_chat_history)
-graph_builder.add_node("context_summarizer", run_context_summarizer)
-graph_builder.add_node("router", run_router_model)
-graph_builder.add_node("general", run_general_model)
-graph_builder.add_node("ranking", run_ranking_model)
-graph_builder.add_node("reasoning", run_reasoning_model)
-graph_builder.add_node("prediction", run_prediction_model)
-graph_builder.add_node("reasoning_validator", run_reasoning_validator)
-graph_builder.add_node("final", run_final_model)
+# Every node is timed into vc_node_duration_seconds (VC_metrics)
+def add_timed_node(name: str, func):
+    graph_builder.add_node(name, timed_node(name, func))
+
+add_timed_node("memory_limiter", trim_chat_history)
+if USE_FUSED_CONTEXT_ROUTER:
+    add_timed_node("context_router", run_context_router)
+else:
+    add_timed_node("context_summarizer", run_context_summarizer)
+    add_timed_node("router", run_router_model)
+add_timed_node("general", run_general_model)
+add_timed_node("ranking", run_ranking_model)
+add_timed_node("reasoning", run_reasoning_model)
+add_timed_node("prediction", run_prediction_model)
+add_timed_node("reasoning_validator", run_reasoning_validator)
+add_timed_node("final", run_final_model)
+if ANSWER_CACHE_ENABLED:
+    add_timed_node("answer_cache", run_answer_cache_lookup)
+    add_timed_node("answer_cache_store", run_answer_cache_store)
 graph_builder.add_edge(START, "memory_limiter")
-graph_builder.add_edge("memory_limiter", "context_summarizer")
-graph_builder.add_edge("context_summarizer", "router")
-graph_builder.add_conditional_edges("router", router_function, {"general": "general", "ranking": "ranking", "reasoning": "reasoning", "prediction": "prediction"})
+routed_node = "context_router" if USE_FUSED_CONTEXT_ROUTER else "router"
+if USE_FUSED_CONTEXT_ROUTER:
+    graph_builder.add_edge("memory_limiter", "context_router")
+else:
+    graph_builder.add_edge("memory_limiter", "context_summarizer")
+    graph_builder.add_edge("context_summarizer", "router")
+if ANSWER_CACHE_ENABLED:
+    graph_builder.add_edge(routed_node, "answer_cache")
+    graph_builder.add_conditional_edges("answer_cache", route_function, {"general": "general", "ranking": "ranking", "reasoning": "reasoning", "prediction": "prediction", "END": END})
+else:
+    graph_builder.add_conditional_edges(routed_node, route_function, {"general": "general", "ranking": "ranking", "reasoning": "reasoning", "prediction": "prediction"})
 graph_builder.add_edge("general", "final")
 graph_builder.add_edge("ranking", "final")
 graph_builder.add_edge("reasoning", "final")
 #graph_builder.add_edge("reasoning", "reasoning_validator")
 #graph_builder.add_conditional_edges("reasoning_validator", validator_function, {"END": END, "reasoning": "reasoning"})
 graph_builder.add_edge("prediction", "final")
-graph_builder.add_edge("final", END)
+if ANSWER_CACHE_ENABLED:
+    graph_builder.add_edge("final", "answer_cache_store")
+    graph_builder.add_edge("answer_cache_store", END)
+else:
+    graph_builder.add_edge("final", END)
 
 
 
@@ -359,19 +594,190 @@ graph_builder.add_edge("final", END)
 #checkpointer = PostgresSaver.from_conn_string(os.getenv("POSTGRES_URL"))
 #checkpointer.setup()    
 #graph = graph_builder.compile(checkpointer=checkpointer)
-graph = graph_builder.compile()
+# The mermaid render is a network call to mermaid.ink; opt-in
+RENDER_GRAPH_PNG = os.getenv("RENDER_GRAPH_PNG", "false").lower() == "true"
+
+_graph = None
+_graph_lock = threading.Lock()
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                with startup.phase("graph"):
+                    _graph = graph_builder.compile()
+    return _graph
+
+def render_graph_png(path: str = "vc_chain_graph.png"):
+    """Mermaid render of the graph (calls mermaid.ink); only with RENDER_GRAPH_PNG=true."""
+    try:
+        png_bytes = get_graph().get_graph().draw_mermaid_png()
+        with open(path, "wb") as f:
+            f.write(png_bytes)
+    except Exception:
+        # This requires some extra dependencies and is optional
+        pass
 
-try:
-    png_bytes = graph.get_graph().draw_mermaid_png()
-    with open("vc_chain_graph.png", "wb") as f:
-        f.write(png_bytes)
-except Exception:
-    # This requires some extra dependencies and is optional
-    pass
 
+# -----------------------------------------------------------------------
+# -------------- WARM-UP ------------------------------------------------
+# -----------------------------------------------------------------------
+# Importing this module builds nothing expensive. warm_up() builds it all
+# once, timed per phase: in the gunicorn master (preload_app) the forked
+# workers inherit the results; post_fork only resets the DB pools.
+# A phase that fails is logged and left to be built on first use.
 
+def _warm_phase(name: str, func):
+    try:
+        with startup.phase(name):
+            func()
+    except Exception as e:
+        log.warning("Warm-up phase %s failed: %s", name, e)
+
+def warm_up():
+    """Build every lazy resource now instead of on the first request. Does not start the background loop."""
+    _warm_phase("dataset", vc_database.prepare_dataset)
+    if CREATE_HISTORY_INDEX:
+        _warm_phase("history_index", ensure_history_index)
+    _warm_phase("llm_clients", lambda: (get_shared_llm_gemini(), get_shared_llm_kimi()))
+    for name in AGENT_FACTORIES:
+        # get_agent times itself as agent:<name>
+        try:
+            get_agent(name)
+        except Exception as e:
+            log.warning("Warm-up of agent %s failed: %s", name, e)
+    try:
+        get_graph()
+    except Exception as e:
+        log.warning("Warm-up of graph failed: %s", e)
+    _warm_phase("vocabulary", get_vocabulary)
+    _warm_phase("schema_card", get_schema_card)
+    _warm_phase("ranking_snapshot", ranking_engine.snapshot)
+    _warm_phase("local_router", get_local_router)
+    if RENDER_GRAPH_PNG:
+        _warm_phase("graph_png", render_graph_png)
+    log.info(startup.report())
 
-def get_assistant_response(user_input: str, session_id: str, general_agent_check: bool, chat_history: list[BaseMessage]):
+
+
+# -----------------------------------------------------------------------
+# -------------- SYNC ENTRY POINTS (WSGI) -------------------------------
+# -----------------------------------------------------------------------
+# The graph nodes are async. The sync Flask worker drives them on one
+# long-lived background loop so the async HTTP clients of the shared LLMs
+# keep their pooled connections between requests.
+
+# Sync tools (SQL lookups) run in the loop's default executor; this bounds how many run at once
+TOOL_THREADS = int(os.getenv("TOOL_THREADS", 32))
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+def configure_event_loop(loop: asyncio.AbstractEventLoop):
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="graph-tool"))
+
+def _get_background_loop():
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            configure_event_loop(_background_loop)
+            threading.Thread(target=_background_loop.run_forever, name="graph-event-loop", daemon=True).start()
+    return _background_loop
+
+def run_sync(coro):
+    """Run a coroutine on the background loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+def iterate_sync(async_iterator):
+    """Iterate an async generator from sync code, one item at a time."""
+    loop = _get_background_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        # Client went away mid-stream: cancel the remaining graph run
+        asyncio.run_coroutine_threadsafe(async_iterator.aclose(), loop).result()
+
+
+# Status line shown to the user when each top-level node starts
+NODE_STATUS_MESSAGES = {
+    "memory_limiter": "Loading conversation...",
+    "context_summarizer": "Analyzing your query...",
+    "router": "Routing to appropriate agent...",
+    "context_router": "Analyzing your query...",
+    "general": "Searching the web...",
+    "ranking": "Ranking VCs...",
+    "reasoning": "Querying database...",
+    "prediction": "Running predictions...",
+    "final": "Generating response...",
+}
+
+# Only tokens produced inside this node are forwarded to the client
+STREAMED_TOKEN_NODE = "final"
+
+
+async def astream_assistant_response(user_input: str, session_id: str, general_agent_check: bool, chat_history: list[BaseMessage]):
+    """
+    Run the graph and yield events as they happen:
+      - node_start / node_end for every top-level node (with a status line on start)
+      - token for every text chunk produced by the final agent
+      - response with the complete answer once the graph finishes
+    Inner ReAct-agent steps are not reported individually.
+    """
+    state = {
+        "input": user_input,
+        "chat_history": chat_history,
+        "general_agent_check": general_agent_check,
+        "context_summary": ""
+    }
+    config = {"configurable": {"thread_id": session_id, "recursion_limit": 12, "max_concurrency": 2}, "callbacks": graph_callbacks()}
+    final_state = {}
+    started = time.perf_counter()
+    try:
+        async for namespace, mode, chunk in get_graph().astream(state, config, stream_mode=["tasks", "messages", "values"], subgraphs=True):
+            if mode == "messages":
+                message_chunk, metadata = chunk
+                checkpoint_ns = metadata.get("langgraph_checkpoint_ns", "")
+                if not checkpoint_ns.startswith(f"{STREAMED_TOKEN_NODE}:"):
+                    continue
+                if isinstance(message_chunk.content, str) and message_chunk.content:
+                    yield {"type": "token", "node": STREAMED_TOKEN_NODE, "message": message_chunk.content}
+            elif namespace:
+                # Task and value events from inside the ReAct subgraphs
+                continue
+            elif mode == "tasks":
+                node = chunk["name"]
+                if "result" in chunk:
+                    yield {"type": "node_end", "node": node, "error": chunk.get("error") is not None}
+                else:
+                    yield {"type": "node_start", "node": node}
+                    if node in NODE_STATUS_MESSAGES:
+                        yield {"type": "status", "node": node, "message": NODE_STATUS_MESSAGES[node]}
+            elif mode == "values":
+                final_state = chunk
+        graph_duration.observe(time.perf_counter() - started, mode="stream")
+
+        ai_message = final_state.get("output")
+        if hasattr(ai_message, 'content') and ai_message.content:
+            interaction_logger.log(session_id, user_input, ai_message.content)
+            yield {"type": "response", "message": ai_message.content}
+        else:
+            yield {"type": "response", "message": "I've completed the analysis, but the response content is not available."}
+    except Exception as e:
+        print(f"Error in astream_assistant_response: {e}")
+        VC_email_utils.send_error_notification(
+            str(e),
+            {"source": "astream_assistant_response", "input": user_input, "session_id": session_id}
+        )
+        yield {"type": "error", "message": "I apologize, but I encountered an error processing your request. Please try again."}
+
+
+async def aget_assistant_response(user_input: str, session_id: str, general_agent_check: bool, chat_history: list[BaseMessage]):
     state = {
         "input": user_input, 
         "chat_history": chat_history, 
@@ -379,24 +785,32 @@ def get_assistant_response(user_input: str, session_id: str, general_agent_check
         "context_summary": ""  # Will be populated by context_summarizer node
     }
     try:
-        response = graph.invoke(state, {"configurable": {"thread_id": session_id, "recursion_limit": 12, "max_concurrency": 2}})
+        started = time.perf_counter()
+        response = await get_graph().ainvoke(state, {"configurable": {"thread_id": session_id, "recursion_limit": 12, "max_concurrency": 2},
+                                                     "callbacks": graph_callbacks()})
+        graph_duration.observe(time.perf_counter() - started, mode="invoke")
 
         # Extract clean text content from the response
         ai_message = response["output"]
         if hasattr(ai_message, 'content') and ai_message.content:
+            # Queued for the background writer; adds no latency to the turn
+            interaction_logger.log(session_id, user_input, ai_message.content)
             return ai_message.content
         else:
             # Fallback for cases where content might be empty
             return "I've completed the analysis, but the response content is not available."
     except Exception as e:
-        print(f"Error in get_assistant_response: {e}")
+        print(f"Error in aget_assistant_response: {e}")
         VC_email_utils.send_error_notification(
             str(e), 
-            {"source": "get_assistant_response", "input": user_input, "session_id": session_id}
+            {"source": "aget_assistant_response", "input": user_input, "session_id": session_id}
         )
         return "I apologize, but I encountered an error processing your request. Please try again."
 
 
+def get_assistant_response(user_input: str, session_id: str, general_agent_check: bool, chat_history: list[BaseMessage]):
+    return run_sync(aget_assistant_response(user_input, session_id, general_agent_check, chat_history))
 
 
-
+def stream_assistant_response(user_input: str, session_id: str, general_agent_check: bool, chat_history: list[BaseMessage]):
+    return iterate_sync(astream_assistant_response(user_input, session_id, general_agent_check, chat_history))
@@ -126,6 +126,20 @@ You are an Maya, a routing assistant. Classify the user's request into exactly o
 }}
 """
 
+CONTEXT_ROUTER_SYSTEM_PROMPT = f"""You do two jobs in a single pass and return a JSON object with exactly two keys:
+- "context_summary": the conversation context, written as the CONTEXT TRACKING section asks (use its OUTPUT FORMAT)
+- "query_type": the bucket for the CURRENT user query, chosen as the ROUTING section asks
+
+Classify the current query in the light of the context you extracted (a follow-up like "what about fintech?" keeps the bucket of the request it follows up on).
+
+=== CONTEXT TRACKING ===
+{CONTEXT_SUMMARIZER_SYSTEM_PROMPT}
+
+=== ROUTING ===
+(Ignore the single-key response format below; return both keys.)
+{ROUTER_SYSTEM_PROMPT}
+"""
+
 
 RANKING_SYSTEM_PROMPT = """You are John, an expert ranking assistant that ranks vcs using the tools you have.
 Your goal is to figure out the metrics and the sector/subsector for the query
@@ -193,11 +207,8 @@ IMPORTANT: When displaying monetary amounts in your final output, always format
 
 
 Given A Query:
-Plan: see available tables. Get fields from available tables. Execute query accordingly.
-Action: get_available_tables()
-Observation: tables: startup_profile, funding_rounds_v2, vc_sector_based_raw, vc_overall_raw, vc_market_cagr
-Action: get_available_fields(table)
-Observation: fields: org_name, announced_on, money_raised_usd, investors, round_name, categories, lead_investors, website, num_funding_rounds and more and so on etc etc.
+Plan: read the DATABASE SCHEMA section below (tables, column types, row counts, common values and value ranges). Write the query directly from it.
+Only call get_available_tables() / get_available_fields(table) when the schema section is missing or does not cover a table you need.
 
 IMPORTANT TABLE PRIORITY:
 - ALWAYS prefer funding_rounds_v2 table for startup searches and queries
@@ -470,6 +481,28 @@ METRIC_EXPR = {
     "CAGR":
         'CAST(REPLACE(vc."CAGR", \'%\', \'\') AS NUMERIC)'
 }
+
+# Raw table (and the alias METRIC_EXPR uses for it) each metric is parsed from
+METRIC_SOURCE = {
+    "AUM":                             ("vc_overall_raw",      "vo"),
+    "Ticket Size":                     ("vc_overall_raw",      "vo"),
+    "Follow on Index":                 ("vc_overall_raw",      "vo"),
+    "Total Exits / Total Investments": ("vc_overall_raw",      "vo"),
+    "Sector specific Investment":      ("vc_sector_based_raw", "vs"),
+    "Sector specific exit":            ("vc_sector_based_raw", "vs"),
+    "Sector specific exit/investment": ("vc_sector_based_raw", "vs"),
+    "Current Market Size":             ("vc_market_cagr",      "vc"),
+    "CAGR":                            ("vc_market_cagr",      "vc"),
+}
+
+# Numeric column written at ingest with the value of METRIC_EXPR (see VC_chain_database.normalize_vc_metrics)
+METRIC_NUMERIC_COLUMN = {metric: f"{metric}__num" for metric in METRIC_EXPR}
+
+# What the ranking queries sort and filter on: the indexed numeric column, already aliased
+METRIC_COLUMN = {
+    metric: f'{METRIC_SOURCE[metric][1]}."{METRIC_NUMERIC_COLUMN[metric]}"'
+    for metric in METRIC_EXPR
+}
 ### MIGHT DELETE LATER
 
 CLEANER_SYSTEM_PROMPT = """You are an expert at understanding and refining user queries based on conversation history.
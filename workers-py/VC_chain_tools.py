@@ -1,5 +1,6 @@
 # Prediction is a tool that takes in a VC_name and a sector as input. sector input can be empty. It will return a table with columns (startup, sector(optional), coinvestors, last funding date))
 
+import os
 import datetime
 import re
 from typing import List, Dict, Any, Type
@@ -9,15 +10,29 @@ from sqlalchemy import text
 from langchain_community.tools import TavilySearchResults
 import VC_chain_database as vc_database
 import logging
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_google_vertexai import ChatVertexAI
 from sqlalchemy.dialects.postgresql import ARRAY, TEXT
 from sqlalchemy import text, bindparam
 from sqlalchemy.types import Numeric
 import VC_chain_systemprompts as vc_systemprompts
+from VC_ranking_engine import ranking_engine
+from VC_sector_matcher import SIM_THRESHOLD
+from VC_vocabulary import get_vocabulary, get_sector_matcher
+from VC_tool_cache import cached_tool
+from VC_sql_guard import QueryRejected, run_guarded
+from VC_sql_rewriter import rewrite_cache
+from VC_result_encoder import compact_result, encode_rows
+from VC_metrics import record_tool_rows
+from VC_schema_card import get_schema_card
 log = logging.getLogger(__name__)
 
 engine = vc_database.engine
+# Free-form agent SQL runs on its own pool so a runaway query cannot starve the ranking tools
+agent_sql_engine = vc_database.agent_sql_engine
+
+# Tables behind the cached tools, so a sheet sync only drops the results it can change
+VC_RANKING_TABLES = ("vc_sector_based_raw", "vc_overall_raw", "vc_market_cagr")
+FUNDING_TABLES = ("funding_rounds_v2", "funding_round_investors", "funding_round_categories")
 
 # VC ranking tools suite
 class BaseRankingInput(BaseModel):
@@ -32,7 +47,74 @@ def result_clean(result):
         return row
     else:
         return [{"error": "No results found"}]
+
+# Table / column listings only change with a schema migration
+SCHEMA_TOOL_CACHE_TTL = 24 * 3600
+
+def ranking_columns(metric: str, **_) -> list[str]:
+    """VCRankingTool rows carry every column of three tables; the agent needs these."""
+    return ["Top Tier", "Sector", metric, "metric_val", "sim"]
+
+# Serve VCRankingTool from the in-process NumPy engine; "false" forces the SQL path
+USE_RANKING_ENGINE = os.getenv("USE_RANKING_ENGINE", "true").lower() == "true"
+
+def vc_ranking_sql(metric_expr: str, count: int, sector_matches: list = None):
+    """
+    SQL implementation of VCRankingTool; used when the in-memory engine is disabled or fails.
+    `sector_matches` are (canonical sector, similarity) pairs from the sector matcher, so the
+    filter is plain equality on vs."Sector" and similarity only drives the ordering.
+    """
+    if sector_matches is not None:
+        # With sector filtering
+        sql = f"""
+        WITH matched AS (
+            SELECT *
+            FROM   unnest(CAST(:sectors AS text[]), CAST(:sims AS float8[])) AS m(sector, sim)
+        )
+        SELECT
+            vs.*,
+            vo.*,
+            vc.*,
+            m.sim,
+            {metric_expr}                       AS metric_val
+        FROM   matched m
+        JOIN   vc_sector_based_raw vs ON vs."Sector"   = m.sector
+        JOIN   vc_overall_raw      vo ON vo."Top Tier" = vs."Top Tier"
+        JOIN   vc_market_cagr      vc ON vc."Sector"   = vs."Sector"
+        WHERE  {metric_expr} IS NOT NULL               -- filter blanks
+        ORDER  BY m.sim DESC, metric_val DESC NULLS LAST
+        LIMIT  :limit;
+        """
+        params = {
+            "sectors": [name for name, _ in sector_matches],
+            "sims":    [sim for _, sim in sector_matches],
+            "limit":   count,
+        }
+    else:
+        # Without sector filtering - rank across all sectors
+        sql = f"""
+        SELECT DISTINCT
+            vs.*,
+            vo.*,
+            vc.*,
+            {metric_expr} AS metric_val
+        FROM   vc_sector_based_raw vs
+        JOIN   vc_overall_raw      vo ON vo."Top Tier" = vs."Top Tier"
+        JOIN   vc_market_cagr      vc ON vc."Sector"   = vs."Sector"
+        WHERE  {metric_expr} IS NOT NULL               -- filter blanks
+        ORDER  BY metric_val DESC NULLS LAST
+        LIMIT  :limit;
+        """
+        params = {
+            "limit":  count,
+        }
+
+    with engine.begin() as conn:
+        return conn.execute(text(sql), params).fetchall()
+
 @tool
+@compact_result(columns=ranking_columns)
+@cached_tool(casefold=("sector",), tables=VC_RANKING_TABLES)
 def VCRankingTool(
     metric: str,
     count: int = 5,
@@ -40,69 +122,40 @@ def VCRankingTool(
 ) -> List[Dict[str, Any]]:
     """
     Rank venture-capital firms by `metric`, optionally filtered by `sector`.
-    If sector is provided, uses pg_trgm word_similarity for fuzzy sector matching.
+    If sector is provided, it is fuzzy-matched (pg_trgm word_similarity) to the known sectors.
     """
     try:
-        SIM_THRESHOLD = 0.30
         log.info("VCRankingTool: sector=%s  metric=%s  count=%d",
                  sector, metric, count)
 
         # ── 1.  Sanitize / look-up  ────────────────────────────────
+        # Typed numeric column precomputed at ingest (VC_chain_database.normalize_vc_metrics),
+        # or the text-parsing expression when the columns failed the parity check
+        typed = vc_database.typed_metrics_usable()
         try:
-            metric_expr = vc_systemprompts.METRIC_EXPR[metric]
+            metric_expr = (vc_systemprompts.METRIC_COLUMN if typed else vc_systemprompts.METRIC_EXPR)[metric]
         except KeyError:
             return [{"error": f"Unknown metric '{metric}'"}]
 
-        # ── 2.  Build the SQL with *metric_expr* spliced in  ───────
+        # ── 2.  Resolve the sector to canonical names in process  ──
+        # Same word_similarity as pg_trgm, scored against the cached sector trigram index
+        sector_matches = None
         if sector:
-            # With sector filtering
             sector_clean = re.sub(r"[^a-z0-9 ]", " ", sector.lower()).strip()
-            sql = f"""
-            WITH ranked AS (
-                SELECT
-                    vs.*,
-                    vo.*,
-                    vc.*,
-                    word_similarity(lower(vs."Sector"), :q) AS sim,
-                    {metric_expr}                       AS metric_val
-                FROM   vc_sector_based_raw vs
-                JOIN   vc_overall_raw      vo ON vo."Top Tier" = vs."Top Tier"
-                JOIN   vc_market_cagr      vc ON vc."Sector"   = vs."Sector"
-                WHERE  {metric_expr} IS NOT NULL               -- filter blanks
-            )
-            SELECT *
-            FROM   ranked
-            WHERE  sim >= :sim_th
-            ORDER  BY sim DESC, metric_val DESC NULLS LAST
-            LIMIT  :limit;
-            """
-            params = {
-                "q":      sector_clean,
-                "sim_th": SIM_THRESHOLD,
-                "limit":  count,
-            }
-        else:
-            # Without sector filtering - rank across all sectors
-            sql = f"""
-            SELECT DISTINCT
-                vs.*,
-                vo.*,
-                vc.*,
-                {metric_expr} AS metric_val
-            FROM   vc_sector_based_raw vs
-            JOIN   vc_overall_raw      vo ON vo."Top Tier" = vs."Top Tier"
-            JOIN   vc_market_cagr      vc ON vc."Sector"   = vs."Sector"
-            WHERE  {metric_expr} IS NOT NULL               -- filter blanks
-            ORDER  BY metric_val DESC NULLS LAST
-            LIMIT  :limit;
-            """
-            params = {
-                "limit":  count,
-            }
+            sector_matches = get_sector_matcher().resolve(sector_clean, SIM_THRESHOLD)
+
+        # ── 3.  In-memory engine, same rows as the SQL below  ──────
+        rows = None
+        if USE_RANKING_ENGINE and typed:
+            try:
+                sector_similarity = dict(sector_matches) if sector_matches is not None else None
+                rows = ranking_engine.rank(metric, count, sector_similarity, SIM_THRESHOLD)
+            except Exception:
+                log.exception("VCRankingTool: in-memory engine failed, falling back to SQL")
 
-        # ── 3.  Execute  ───────────────────────────────────────────
-        with engine.begin() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
+        # ── 4.  SQL with *metric_expr* spliced in  ─────────────────
+        if rows is None:
+            rows = vc_ranking_sql(metric_expr, count, sector_matches)
 
         log.info("VCRankingTool: returned %d rows", len(rows))
         if not rows:
@@ -118,25 +171,32 @@ def VCRankingTool(
         log.exception("VCRankingTool failed")
         return [{"error": str(exc)}]
 
+# Output columns of the subsector query that it can be ordered by (the "Subsector Metrics" of the prompt)
+SUBSECTOR_METRICS = ("Subsector specific investment", "Series #")
+
 @tool
+@compact_result()
+@cached_tool(casefold=("sector",), tables=FUNDING_TABLES)
 def VCSubsectorRankingTool(sector: str, metric: str, count: int = 5):
     """Ranks VCs by subsector activity using funding rounds data. Requires subsector, metric, count."""
     try:
         log.info(f"Starting Subsector ranking with parameters - Subsector: '{sector}', Metric: '{metric}', Count: {count}")
-        
+
+        # The metric is spliced in as a column name: only the known columns get through
+        order_column = next((name for name in SUBSECTOR_METRICS if name.lower() == str(metric).strip().lower()), None)
+        if order_column is None:
+            return [{"error": f"Unknown metric '{metric}'. Use one of: {', '.join(SUBSECTOR_METRICS)}"}]
+
         query = f"""
             WITH exploded AS (
                 SELECT
-                    TRIM(firm_el)::text            AS venture_capital_firm,
-                    TRIM(sector_el)::text          AS sector,
+                    fi.investor                    AS venture_capital_firm,
+                    fc.category                    AS sector,
                     fr.round_name                  AS series_raw
-                FROM funding_rounds_v2 AS fr
-                CROSS JOIN LATERAL unnest(string_to_array(COALESCE(fr.investors, ''),  ',')) AS firm_el
-                CROSS JOIN LATERAL unnest(string_to_array(COALESCE(fr.categories, ''),  ',')) AS sector_el
-                WHERE
-                    TRIM(firm_el)   <> '' AND
-                    TRIM(sector_el) <> '' AND
-                    firm_el         <> '#NAME? ()'
+                FROM funding_round_categories AS fc
+                JOIN funding_round_investors  AS fi ON fi.round_id = fc.round_id
+                JOIN funding_rounds_v2        AS fr ON fr.round_id = fc.round_id
+                WHERE LOWER(fc.category) LIKE LOWER(:sector_pattern)
             ),
 
             series_typed AS (
@@ -187,13 +247,16 @@ def VCSubsectorRankingTool(sector: str, metric: str, count: int = 5):
 
             SELECT *
             FROM   cleaned
-            WHERE  LOWER("Sector") LIKE LOWER('%{sector}%')
-            ORDER  BY "{metric}" DESC
-            LIMIT  {count};
+            ORDER  BY "{order_column}" DESC
+            LIMIT  :limit;
             """
+        params = {
+            "sector_pattern": f"%{sector}%",
+            "limit":          count,
+        }
         log.debug("Executing Subsector SQL query")
         with engine.connect() as conn:
-            rows = conn.execute(text(query)).fetchall()
+            rows = conn.execute(text(query), params).fetchall()
         log.info(f"Returned {len(rows)} rows")
         return rows or [{"warning": "No results found"}]
 
@@ -211,74 +274,70 @@ def execute_query(query: str) -> List[Dict[str, Any]]:
     """Executes a SQL query with automatic fuzzy matching for category names."""
     print("execute_query result: ", query)
 
-    # Auto-correct common category terms using fuzzy matching
-    corrected_query = query
-
-    # Replace exact ILIKE patterns with fuzzy similarity
-    import re
-
-    # Find ILIKE patterns for any field and replace with similarity-based matching
-    ilike_pattern = r"(\w+)\s+ILIKE\s+'%([^%']+)%'"
-    matches = re.findall(ilike_pattern, corrected_query, re.IGNORECASE)
-
-    for field, term in matches:
-        # Replace ILIKE with similarity check for any field
-        old_pattern = f"{field} ILIKE '%{term}%'"
-        new_pattern = f"(word_similarity(lower({field}), lower('{term}')) > 0.5 OR {field} ILIKE '%{term}%')"
-        corrected_query = corrected_query.replace(old_pattern, new_pattern)
-
-        # Also handle case variations
-        old_pattern_lower = f"{field} ILIKE '%{term.lower()}%'"
-        corrected_query = corrected_query.replace(old_pattern_lower, new_pattern)
-
-    print("Corrected query:", corrected_query)
-
-    with engine.connect() as conn:
-        result = conn.execute(text(corrected_query))
-        rows = result.fetchall()
-        if len(rows) > 0:
-            return rows
-        else:
-            return [{"error": "No results found"}]
+    # Parse, enforce read-only, cap the LIMIT and make fuzzy predicates index-friendly (VC_sql_rewriter)
+    try:
+        rewritten = rewrite_cache.rewrite(query)
+    except QueryRejected as e:
+        return [{"error": str(e)}]
+    corrected_query = rewritten.sql
+    if rewritten.changes:
+        print("Corrected query:", corrected_query, rewritten.changes)
+
+    # EXPLAIN-gated, read-only, statement timeout and row cap (VC_sql_guard)
+    try:
+        guarded = run_guarded(agent_sql_engine, corrected_query)
+    except QueryRejected as e:
+        return [{"error": str(e)}]
+    record_tool_rows("execute_query", len(guarded.rows))
+    # Predicate rewrites and suggestions from the rewriter, so the agent knows what actually ran
+    notes = " ".join(rewritten.notes)
+    if not guarded.rows:
+        return [{"error": f"No results found. {notes}" if notes else "No results found"}]
+    rows = encode_rows(guarded.rows, more_available=guarded.truncated)
+    return f"{notes}\n{rows}" if notes else rows
 
 @tool
+@compact_result()
+@cached_tool(ttl=SCHEMA_TOOL_CACHE_TTL)
 def get_available_tables() -> List[str]:
     """Get a list of all available tables"""
-    
+    # The schema card in the reasoning prompt already lists these; this is the fallback
+    card = get_schema_card()
+    if card.tables:
+        return list(card.tables)
     query = """SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"""
     with engine.connect() as conn:
         result = conn.execute(text(query))
         return result_clean(result)
 
 @tool
+@compact_result()
+@cached_tool(ttl=SCHEMA_TOOL_CACHE_TTL)
 def get_available_fields(table: str) -> List[str]:
     """Get a list of all available fields for a table"""
-    query = f"""SELECT column_name FROM information_schema.columns WHERE table_name = '{table}'"""
+    fields = get_schema_card().table_fields(table)
+    if fields:
+        return [{"field": field} for field in fields]
+    query = """SELECT column_name, data_type FROM information_schema.columns WHERE table_schema = 'public' AND table_name = :table ORDER BY ordinal_position"""
     with engine.connect() as conn:
-        result = conn.execute(text(query))
+        result = conn.execute(text(query), {"table": table})
         return result_clean(result)
 
 #prediction tool suite
 @tool
+@compact_result()
 def get_available_metrics() -> List[str]:
     """Get a list of all available metrics"""
     print("get_available_metrics result: ", list(vc_systemprompts.METRIC_EXPR.keys()))
     return list(vc_systemprompts.METRIC_EXPR.keys())
 
 @tool
+@compact_result(max_rows=100)
 def get_available_subsectors() -> List[str]:
     """Get a list of all available subsectors"""
-    query = text("""WITH sectors_exploded as (
-        SELECT TRIM(sector_split.value) AS sector 
-        FROM funding_rounds_v2 fr 
-        CROSS JOIN LATERAL string_to_array(COALESCE(fr.categories, ''), ',') AS sector_split(value) 
-        WHERE TRIM(sector_split.value) <> '' 
-        AND TRIM(sector_split.value) <> '#NAME? ()'
-    )
-    SELECT DISTINCT sector FROM sectors_exploded ORDER BY RANDOM() LIMIT 100""")
-    with engine.connect() as conn:
-        result = conn.execute(query)
-        return result_clean(result)
+    # Random sample drawn from the vocabulary's precomputed reservoir
+    subsectors = get_vocabulary().sample_subsectors(100)
+    return subsectors or [{"error": "No results found"}]
 
 
 
@@ -299,6 +358,8 @@ search_tool = TavilySearchResults(max_results=5)
 
 
 @tool
+@compact_result()
+@cached_tool(casefold=("startup",), tables=FUNDING_TABLES)
 def sector_lookup_tool(startup: str) -> List[Dict[str, Any]]:
     """Looks up the sector of a startup."""
     query = text("""
@@ -318,6 +379,8 @@ def sector_lookup_tool(startup: str) -> List[Dict[str, Any]]:
 
 
 @tool
+@compact_result()
+@cached_tool(casefold=("startup",), tables=FUNDING_TABLES)
 def investor_lookup_tool(startup: str) -> List[Dict[str, Any]]:
     """Looks up the investors of a startup."""
     query = text("""
@@ -335,6 +398,8 @@ def investor_lookup_tool(startup: str) -> List[Dict[str, Any]]:
         return result_clean(result)
 
 @tool
+@compact_result()
+@cached_tool(casefold=("startup",), tables=FUNDING_TABLES)
 def debug_startup_search(startup: str) -> List[Dict[str, Any]]:
     """Debug tool to find startups with similar names."""
     query = text("""
@@ -354,6 +419,7 @@ def debug_startup_search(startup: str) -> List[Dict[str, Any]]:
         return rows if rows else [{"info": f"No startups found matching '{startup}'"}]
 
 @tool
+@compact_result()
 def list_sample_startups() -> List[Dict[str, Any]]:
     """Get a sample of startup names from the database."""
     query = text("""
@@ -368,28 +434,33 @@ def list_sample_startups() -> List[Dict[str, Any]]:
         return result.fetchall()
 
 @tool
+@compact_result()
+@cached_tool(casefold=("sector", "VC_name"), tables=FUNDING_TABLES)
 def VC_coinvestor_tool(sector: str, VC_name: str) -> List[Dict[str, Any]]:
     """Looks up the coinvestors of a VC in a sector."""
     query = text("""
-    WITH coinvestor_exploded AS (
+    WITH vc_rounds AS (
+        SELECT DISTINCT round_id
+        FROM funding_round_investors
+        WHERE investor ILIKE :vc_pattern
+    ),
+    coinvestor_exploded AS (
         SELECT DISTINCT
-            TRIM(firm.value)  AS venture_capital_firm,
-            TRIM(sec.value)   AS sector,
-            fr.org_name || ' - ' || fr.round_name AS series_company,
-            fr.announced_on          AS announced_date,
-            fr.money_raised_usd    AS total_funding_amount
-        FROM funding_rounds_v2 fr
-        CROSS JOIN LATERAL unnest(string_to_array(fr.investors, ',')) AS firm(value)
-        CROSS JOIN LATERAL unnest(string_to_array(fr.categories, ',')) AS sec(value)
-        WHERE fr.investors ILIKE :vc_pattern
-        AND lower(trim(sec.value)) ILIKE ANY(:sectors)
+            fi.investor              AS venture_capital_firm,
+            fc.category              AS sector,
+            fr.org_name || ' - ' || fr.round_name AS series_company
+        FROM vc_rounds vr
+        JOIN funding_rounds_v2        fr ON fr.round_id = vr.round_id
+        JOIN funding_round_investors  fi ON fi.round_id = vr.round_id
+        JOIN funding_round_categories fc ON fc.round_id = vr.round_id
+        WHERE lower(fc.category) ILIKE ANY(:sectors)
       )
     SELECT
         venture_capital_firm AS "Coinvestor",
         sector               AS "Sector",
         COUNT(DISTINCT series_company) AS "Total Coinvestments"
     FROM coinvestor_exploded
-    WHERE venture_capital_firm <> :vc_pattern
+    WHERE venture_capital_firm NOT ILIKE :vc_pattern
     GROUP BY venture_capital_firm, sector
     ORDER BY "Total Coinvestments" DESC
     LIMIT 5;
@@ -407,28 +478,20 @@ def VC_coinvestor_tool(sector: str, VC_name: str) -> List[Dict[str, Any]]:
             log.error(f"Error in VC_coinvestor_tool - Sector: '{sector}', VC_name: '{VC_name}': {str(e)}", exc_info=True)
             return [{"error": f"PostgreSQL query error: {str(e)}"}]
 @tool
+@compact_result(max_rows=1000)
 def get_available_sectors() -> List[str]:
     """Get a list of all available general ranking sectors"""
-    query = text("""SELECT DISTINCT vc."Sector" FROM vc_sector_based_raw vc""")
-    with engine.connect() as conn:
-        result = conn.execute(query)
-        return result_clean(result)
+    return get_vocabulary().sectors or [{"error": "No results found"}]
 @tool 
+@compact_result(columns=("Top Tier", "Sector"))
 def get_vc_available_sectors(VC_name: str) -> List[Dict[str, Any]]:
     """Looks up the available sectors of a VC."""
-    query = text("""
-    SELECT DISTINCT "Top Tier", "Sector"
-    FROM vc_sector_based_raw
-    WHERE "Top Tier" ILIKE :VC_name
-    """)
-    params = {
-        "VC_name":      f"%{VC_name}%"
-    }
-    with engine.connect() as conn:
-        result = conn.execute(query, params)
-        return result_clean(result)
+    # Same match as "Top Tier" ILIKE '%VC_name%', served from the cached vocabulary
+    return get_vocabulary().vc_available_sectors(VC_name) or [{"error": "No results found"}]
 
 @tool
+@compact_result()
+@cached_tool(casefold=("VC_name",), tables=FUNDING_TABLES + ("vc_sector_based_raw",))
 def vc_best_sector_tool(VC_name: str) -> List[Dict[str, Any]]:
     """Looks up the best sector of a VC."""
     query = text("""
@@ -447,27 +510,18 @@ def vc_best_sector_tool(VC_name: str) -> List[Dict[str, Any]]:
         return result_clean(result)
 
 @tool
+@compact_result()
+@cached_tool(casefold=("VC_name",), tables=FUNDING_TABLES)
 def vc_best_sector_tool_2(VC_name: str) -> List[Dict[str, Any]]:
     """Looks up the best sector of a VC."""
     query = text("""
-        WITH sectors_exploded AS (
-            SELECT
-                TRIM(s.sector) AS sector,
-                fr.org_name,
-                fr.org_name || ' - ' || fr.round_name AS series_company
-            FROM   funding_rounds_v2 fr
-            -- turn "A, B, C" → ['A','B','C'] and explode to rows
-            CROSS  JOIN LATERAL unnest(
-                    string_to_array(COALESCE(fr.categories, ''), ',')
-                ) AS s(sector)
-            WHERE  fr.investors ILIKE :vc_name
-            AND  TRIM(s.sector) <> ''
-            AND  TRIM(s.sector) <> '#NAME? ()'
-        )
-        SELECT   sector,
-                COUNT(DISTINCT org_name) AS "Total Coinvestments"
-        FROM     sectors_exploded
-        GROUP BY sector
+        SELECT   fc.category AS sector,
+                 COUNT(DISTINCT fr.org_name) AS "Total Coinvestments"
+        FROM     funding_round_investors  fi
+        JOIN     funding_round_categories fc ON fc.round_id = fi.round_id
+        JOIN     funding_rounds_v2        fr ON fr.round_id = fi.round_id
+        WHERE    fi.investor ILIKE :vc_name
+        GROUP BY fc.category
         ORDER BY "Total Coinvestments" DESC
         LIMIT 1;
         """)
@@ -479,29 +533,31 @@ def vc_best_sector_tool_2(VC_name: str) -> List[Dict[str, Any]]:
         return result_clean(result)
 
 @tool
+@compact_result()
+@cached_tool(casefold=("sector", "VC_name"), tables=FUNDING_TABLES)
 def coinvestor_startup_tool(sector: str, VC_name: str, coinvestor_vcs: List[str]) -> List[Dict[str, Any]]:
     """Looks up the startups that VC_Name hasn't invested in yet, but the coinvestors have."""
     query = text("""
     WITH coinvestor_exploded AS (
         SELECT
-            TRIM(firm.value) AS venture_capital_firm,
-            TRIM(sec.value)  AS sector,
-            fr.org_name                AS startup,
-            fr.round_name                 AS series,
+            fi.investor                 AS venture_capital_firm,
+            fc.category                 AS sector,
+            fr.org_name                 AS startup,
+            fr.round_name               AS series,
             fr.org_name || ' - ' || fr.round_name       AS series_company,
-            fr.announced_on         AS announced_date,
-            fr.money_raised_usd   AS total_funding_amount
-        FROM funding_rounds_v2 fr
-        -- one row per investor
-        CROSS JOIN LATERAL unnest(
-            string_to_array(coalesce(fr.investors, ''), ',')
-        ) AS firm(value)
-        -- one row per sector
-        CROSS JOIN LATERAL unnest(
-            string_to_array(coalesce(fr.categories, ''), ',')
-        ) AS sec(value)
-        WHERE fr.investors NOT ILIKE :vc_pattern
-        AND sec.value          ILIKE :sector_pattern
+            fr.announced_on             AS announced_date
+        FROM funding_round_investors fi
+        JOIN funding_rounds_v2        fr ON fr.round_id = fi.round_id
+        JOIN funding_round_categories fc ON fc.round_id = fi.round_id
+        WHERE fi.investor = ANY(:coinvestor_array)
+        AND fc.category ILIKE :sector_pattern
+        -- skip rounds VC_name already took part in
+        AND NOT EXISTS (
+            SELECT 1
+            FROM funding_round_investors own
+            WHERE own.round_id = fi.round_id
+            AND own.investor ILIKE :vc_pattern
+        )
     ),
 
     coinvestor_score AS (
@@ -550,8 +606,6 @@ def coinvestor_startup_tool(sector: str, VC_name: str, coinvestor_vcs: List[str]
         print("coinvestor_startup_tool result: ", rows)
         return rows
 
-toolkit = vc_database.toolkit
-
 general_tools = [search_tool, CurrentDateTimeTool]
 prediction_tools = [get_available_metrics, get_available_sectors, get_vc_available_sectors, sector_lookup_tool, investor_lookup_tool, VC_coinvestor_tool, coinvestor_startup_tool, VCRankingTool, vc_best_sector_tool, vc_best_sector_tool_2, debug_startup_search, list_sample_startups, search_tool]
 reasoning_tools = [execute_query, get_available_tables, get_available_fields, search_tool]
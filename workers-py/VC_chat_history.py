@@ -0,0 +1,270 @@
+# Chat history loader.
+#
+# Conversations live in "Message_v2" (written by the Ruby frontend), one row
+# per message with its text in a `parts` JSON array. Rows are decoded once into
+# LangChain messages in chronological order, and the decoded tail of each
+# session is cached: a follow-up turn only reads the rows newer than the
+# cached tail. /api/history pages through a conversation with a keyset cursor
+# on ("createdAt", id).
+import os
+import json
+import time
+import base64
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import text
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+import VC_chain_database as vc_database
+
+log = logging.getLogger(__name__)
+
+# Messages kept per cached session, and how many sessions / for how long
+HISTORY_TAIL_SIZE = int(os.getenv("HISTORY_TAIL_SIZE", 50))
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", 5000))
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", 900))
+
+# Newest `limit` rows of a conversation, optionally before a keyset cursor
+HISTORY_PAGE_SQL = """
+    SELECT id, role, parts, "createdAt"
+    FROM   "Message_v2"
+    WHERE  "chatId" = :session_id
+      AND  (CAST(:before_created AS TIMESTAMP) IS NULL OR ("createdAt", id) < (CAST(:before_created AS TIMESTAMP), :before_id))
+    ORDER  BY "createdAt" DESC, id DESC
+    LIMIT  :limit
+"""
+
+# Rows newer than the cached tail
+HISTORY_DELTA_SQL = """
+    SELECT id, role, parts, "createdAt"
+    FROM   "Message_v2"
+    WHERE  "chatId" = :session_id
+      AND  ("createdAt", id) > (CAST(:after_created AS TIMESTAMP), :after_id)
+    ORDER  BY "createdAt", id
+    LIMIT  :limit
+"""
+
+HISTORY_INDEX_DDL = 'CREATE INDEX CONCURRENTLY IF NOT EXISTS message_v2_chat_created_idx ON "Message_v2" ("chatId", "createdAt", id)'
+
+
+# ── Decoding ──
+
+def decode_parts(parts) -> str:
+    """Text of a `parts` value ([{"type": "text", "text": ...}, ...], as JSON or already decoded)."""
+    if isinstance(parts, (bytes, str)):
+        try:
+            parts = json.loads(parts)
+        except ValueError:
+            return parts.decode() if isinstance(parts, bytes) else parts
+    if isinstance(parts, dict):
+        parts = [parts]
+    if not isinstance(parts, list):
+        return "" if parts is None else str(parts)
+    return "\n".join(part.get("text", "") for part in parts if isinstance(part, dict) and part.get("type", "text") == "text")
+
+
+def to_message(role: str, content: str, message_id: str = None) -> BaseMessage:
+    if role == "user":
+        return HumanMessage(content=content, id=message_id)
+    if role == "system":
+        return SystemMessage(content=content, id=message_id)
+    return AIMessage(content=content, id=message_id)
+
+
+def decode_client_history(items) -> list[BaseMessage]:
+    """History sent by a client ([{"role": ..., "content" | "text" | "parts": ...}]) as messages."""
+    messages = []
+    for item in items or []:
+        if isinstance(item, BaseMessage):
+            messages.append(item)
+        elif isinstance(item, dict):
+            content = item.get("content") or item.get("text") or decode_parts(item.get("parts"))
+            messages.append(to_message(item.get("role", "user"), content or ""))
+    return messages
+
+
+def without_current_input(messages: list[BaseMessage], user_message: str) -> list[BaseMessage]:
+    """The frontend stores the user's message before calling us; drop it so the graph sees it once, as input."""
+    if messages and isinstance(messages[-1], HumanMessage) and messages[-1].content.strip() == user_message.strip():
+        return messages[:-1]
+    return messages
+
+
+class HistoryRow:
+    __slots__ = ("id", "role", "text", "created_at")
+
+    def __init__(self, row):
+        self.id = str(row[0])
+        self.role = row[1]
+        self.text = decode_parts(row[2])
+        self.created_at = row[3]
+
+    @property
+    def key(self) -> tuple:
+        return self.created_at, self.id
+
+    def message(self) -> BaseMessage:
+        return to_message(self.role, self.text, self.id)
+
+    def as_json(self) -> dict:
+        return {"id": self.id, "role": self.role, "parts": [{"type": "text", "text": self.text}],
+                "createdAt": self.created_at.isoformat() if self.created_at else None}
+
+
+# ── Keyset cursor ──
+
+def encode_cursor(row: HistoryRow) -> str:
+    return base64.urlsafe_b64encode(f"{row.created_at.isoformat()}|{row.id}".encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> tuple:
+    """(created_at, id) from a cursor, or (None, None) for the first page."""
+    if not cursor:
+        return None, None
+    created_at, _, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+    return datetime.datetime.fromisoformat(created_at), message_id
+
+
+# ── Per-session tail cache ──
+
+class _Tail:
+    __slots__ = ("rows", "loaded_at")
+
+    def __init__(self, rows: list[HistoryRow]):
+        self.rows = rows            # chronological, at most HISTORY_TAIL_SIZE
+        self.loaded_at = time.time()
+
+
+class ChatHistoryCache:
+    def __init__(self, max_sessions: int = HISTORY_CACHE_SESSIONS, ttl: int = HISTORY_CACHE_TTL, tail_size: int = HISTORY_TAIL_SIZE):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.tail_size = tail_size
+        self._tails = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "delta_rows": 0}
+
+    def get(self, session_id: str) -> Optional[_Tail]:
+        with self._lock:
+            tail = self._tails.get(session_id)
+            if tail is None or time.time() - tail.loaded_at > self.ttl:
+                self._tails.pop(session_id, None)
+                return None
+            self._tails.move_to_end(session_id)
+            return tail
+
+    def put(self, session_id: str, tail: _Tail):
+        with self._lock:
+            self._tails[session_id] = tail
+            self._tails.move_to_end(session_id)
+            while len(self._tails) > self.max_sessions:
+                self._tails.popitem(last=False)
+
+    def extend(self, tail: _Tail, new_rows: list[HistoryRow]) -> _Tail:
+        return _Tail((tail.rows + new_rows)[-self.tail_size:])
+
+    def count(self, hit: bool, delta_rows: int = 0):
+        with self._lock:
+            self.stats["hits" if hit else "misses"] += 1
+            self.stats["delta_rows"] += delta_rows
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._tails.pop(session_id, None)
+
+
+history_cache = ChatHistoryCache()
+
+
+def _page_params(session_id: str, limit: int, before: tuple = (None, None)) -> dict:
+    return {"session_id": session_id, "limit": limit, "before_created": before[0], "before_id": before[1]}
+
+def _delta_params(session_id: str, tail: _Tail) -> dict:
+    created_at, message_id = tail.rows[-1].key
+    return {"session_id": session_id, "limit": history_cache.tail_size, "after_created": created_at, "after_id": message_id}
+
+def _serve(session_id: str, tail: _Tail, limit: int) -> list[BaseMessage]:
+    history_cache.put(session_id, tail)
+    return [row.message() for row in tail.rows[-limit:]]
+
+
+def _tail_from_page(rows) -> _Tail:
+    return _Tail([HistoryRow(row) for row in reversed(rows)])
+
+
+def get_chat_history(session_id: str, limit: int = 20) -> list[BaseMessage]:
+    """Last `limit` messages of the conversation, oldest first."""
+    if limit > history_cache.tail_size:
+        return [row.message() for row in fetch_history_page(session_id, limit)[0]]
+    try:
+        tail = history_cache.get(session_id)
+        with vc_database.engine.connect() as conn:
+            if tail is not None and tail.rows:
+                new_rows = [HistoryRow(row) for row in conn.execute(text(HISTORY_DELTA_SQL), _delta_params(session_id, tail))]
+                if len(new_rows) < history_cache.tail_size:
+                    history_cache.count(True, len(new_rows))
+                    return _serve(session_id, history_cache.extend(tail, new_rows), limit)
+            history_cache.count(False)
+            rows = conn.execute(text(HISTORY_PAGE_SQL), _page_params(session_id, history_cache.tail_size)).fetchall()
+        return _serve(session_id, _tail_from_page(rows), limit)
+    except Exception as e:
+        print(f"Failed to get chat history: {e}")
+        return []
+
+
+async def aget_chat_history(session_id: str, limit: int = 20) -> list[BaseMessage]:
+    """Async variant of get_chat_history used by the ASGI app."""
+    if limit > history_cache.tail_size:
+        rows = await afetch_history_rows(session_id, limit)
+        return [HistoryRow(row).message() for row in reversed(rows)]
+    try:
+        tail = history_cache.get(session_id)
+        async with vc_database.async_engine.connect() as conn:
+            if tail is not None and tail.rows:
+                result = await conn.execute(text(HISTORY_DELTA_SQL), _delta_params(session_id, tail))
+                new_rows = [HistoryRow(row) for row in result.fetchall()]
+                if len(new_rows) < history_cache.tail_size:
+                    history_cache.count(True, len(new_rows))
+                    return _serve(session_id, history_cache.extend(tail, new_rows), limit)
+            history_cache.count(False)
+            result = await conn.execute(text(HISTORY_PAGE_SQL), _page_params(session_id, history_cache.tail_size))
+            rows = result.fetchall()
+        return _serve(session_id, _tail_from_page(rows), limit)
+    except Exception as e:
+        print(f"Failed to get chat history: {e}")
+        return []
+
+
+async def afetch_history_rows(session_id: str, limit: int, before: tuple = (None, None)):
+    async with vc_database.async_engine.connect() as conn:
+        result = await conn.execute(text(HISTORY_PAGE_SQL), _page_params(session_id, limit, before))
+        return result.fetchall()
+
+
+def fetch_history_page(session_id: str, limit: int = 20, cursor: Optional[str] = None) -> tuple[list[HistoryRow], Optional[str]]:
+    """
+    One page of the conversation for /api/history: up to `limit` messages older
+    than `cursor` (newest page when None), oldest first, plus the cursor of the
+    next older page (None when this is the first message).
+    """
+    before = decode_cursor(cursor)
+    with vc_database.engine.connect() as conn:
+        rows = conn.execute(text(HISTORY_PAGE_SQL), _page_params(session_id, limit + 1, before)).fetchall()
+    page = [HistoryRow(row) for row in rows[:limit]]
+    page.reverse()
+    next_cursor = encode_cursor(page[0]) if len(rows) > limit else None
+    return page, next_cursor
+
+
+def ensure_history_index():
+    """Index the keyset queries use; built concurrently so the frontend keeps writing."""
+    try:
+        with vc_database.background_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(HISTORY_INDEX_DDL))
+    except Exception as e:
+        print(f"Could not create chat history index: {e}")
+
+# Built by VC_chain_logic.warm_up(), no longer on import
+CREATE_HISTORY_INDEX = os.getenv("CREATE_HISTORY_INDEX", "true").lower() == "true"
@@ -0,0 +1,189 @@
+# Connection pools, one per kind of work.
+#
+# Tool lookups, the agent's free-form SQL and background writes (ingest,
+# logging) used to share one engine of up to 60 connections per process, plus
+# a psycopg2 pool and an async engine on top. Now every purpose gets its own
+# bounded pool with its own statement_timeout, so a runaway agent query can
+# only exhaust the agent pool, and all pools together are sized from one
+# connection budget split across the gunicorn workers.
+#
+# Every pool reports checkout wait time, utilization and connection churn
+# (PoolManager.stats(), served on /health).
+import os
+import time
+import logging
+import threading
+from typing import NamedTuple
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+log = logging.getLogger(__name__)
+
+# Connections this app may hold on the server in total, across all workers
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", 60))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+
+class PoolSpec(NamedTuple):
+    share: float                # fraction of the per-process budget
+    statement_timeout_ms: int
+    pool_timeout: float         # seconds to wait for a free connection
+    is_async: bool = False
+
+
+POOL_SPECS = {
+    # VC tools, vocabulary / ranking snapshots, chat history
+    "interactive": PoolSpec(share=0.40, statement_timeout_ms=15_000, pool_timeout=10),
+    # execute_query and the SQL toolkit: LLM-written SQL
+    "agent_sql":   PoolSpec(share=0.20, statement_timeout_ms=30_000, pool_timeout=5),
+    # Sheet loads, derived-table refreshes, interaction / router-decision logging
+    "background":  PoolSpec(share=0.15, statement_timeout_ms=600_000, pool_timeout=60),
+    # ASGI mode: chat history and conversation summaries on the event loop
+    "async":       PoolSpec(share=0.25, statement_timeout_ms=15_000, pool_timeout=10, is_async=True),
+}
+
+BASE_CONNECT_ARGS = {
+    "prepare_threshold": None,
+    "sslmode": os.getenv("DB_SSLMODE", "require"),     # "disable" for a local Postgres
+}
+
+
+def pool_size_for(name: str, spec: PoolSpec) -> int:
+    """DB_POOL_<NAME>_SIZE, else this pool's share of the per-process budget (at least 2)."""
+    override = os.getenv(f"DB_POOL_{name.upper()}_SIZE")
+    if override:
+        return int(override)
+    per_process = DB_CONNECTION_BUDGET // max(WEB_CONCURRENCY, 1)
+    return max(2, int(per_process * spec.share))
+
+
+class PoolMetrics:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self._lock = threading.Lock()
+        self.pool = None            # set once the engine exists
+        self.checkouts = 0
+        self.peak_checked_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if self.pool is not None:
+                self.peak_checked_out = max(self.peak_checked_out, self.pool.checkedout())
+
+    def snapshot(self) -> dict:
+        checked_out = self.pool.checkedout() if self.pool is not None else 0
+        with self._lock:
+            return {
+                "size": self.size,
+                "checked_out": checked_out,
+                "utilization": checked_out / self.size if self.size else 0.0,
+                "peak_utilization": self.peak_checked_out / self.size if self.size else 0.0,
+                "checkouts": self.checkouts,
+                "wait_avg_ms": 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+                "wait_max_ms": 1000 * self.wait_max,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "closes": self.closes,
+                "invalidations": self.invalidations,
+            }
+
+
+def _metered(pool_class):
+    """Pool subclass that times how long callers wait for a connection."""
+    class MeteredPool(pool_class):
+        metrics = None
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                if self.metrics is not None:
+                    self.metrics.record_wait(0.0, timed_out=True)
+                raise
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started)
+            return connection
+
+    MeteredPool.__name__ = f"Metered{pool_class.__name__}"
+    return MeteredPool
+
+MeteredQueuePool = _metered(QueuePool)
+MeteredAsyncQueuePool = _metered(AsyncAdaptedQueuePool)
+
+
+class PoolManager:
+    def __init__(self, url: str, specs: dict = POOL_SPECS):
+        self.url = url
+        self.specs = specs
+        self.metrics = {}
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def _create(self, name: str):
+        spec = self.specs[name]
+        size = pool_size_for(name, spec)
+        metrics = PoolMetrics(name, size)
+        connect_args = {**BASE_CONNECT_ARGS, "options": f"-c statement_timeout={spec.statement_timeout_ms}",
+                        "application_name": f"capmap-{name}"}
+        factory = create_async_engine if spec.is_async else create_engine
+        engine = factory(
+            self.url,
+            poolclass=MeteredAsyncQueuePool if spec.is_async else MeteredQueuePool,
+            pool_size=size,
+            max_overflow=0,             # hard cap: the budget is the budget
+            pool_timeout=spec.pool_timeout,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+            connect_args=connect_args,
+        )
+        sync_engine = engine.sync_engine if spec.is_async else engine
+        sync_engine.pool.metrics = metrics
+        metrics.pool = sync_engine.pool
+
+        @event.listens_for(sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            metrics.connects += 1
+
+        @event.listens_for(sync_engine, "close")
+        def on_close(dbapi_connection, connection_record):
+            metrics.closes += 1
+
+        @event.listens_for(sync_engine, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            metrics.invalidations += 1
+
+        log.info("DB pool %s: %d connections, statement_timeout %dms", name, size, spec.statement_timeout_ms)
+        self.metrics[name] = metrics
+        return engine
+
+    def engine(self, name: str):
+        """The engine for one purpose ("interactive", "agent_sql", "background", "async"), created on first use."""
+        if name not in self._engines:
+            with self._lock:
+                if name not in self._engines:
+                    self._engines[name] = self._create(name)
+        return self._engines[name]
+
+    def dispose(self):
+        """Drop pooled connections, e.g. in a freshly forked worker."""
+        for engine in self._engines.values():
+            (engine.sync_engine if hasattr(engine, "sync_engine") else engine).dispose(close=False)
+
+    def stats(self) -> dict:
+        return {name: metrics.snapshot() for name, metrics in self.metrics.items()}
@@ -0,0 +1,149 @@
+# Write-behind logger for the interactions table.
+#
+# Turns are queued in memory and a background thread writes them in batches
+# with one multi-row INSERT, so logging never waits on Postgres inside a user
+# turn. The queue is bounded: when the database falls behind, new rows are
+# dropped and counted rather than growing memory. Gunicorn's worker_exit hook
+# (gunicorn.conf.py) flushes whatever is still queued.
+import os
+import re
+import time
+import queue
+import atexit
+import logging
+import datetime
+import threading
+from typing import Optional
+from sqlalchemy import text
+import VC_chain_database as vc_database
+
+log = logging.getLogger(__name__)
+
+INTERACTION_LOG_QUEUE_SIZE = int(os.getenv("INTERACTION_LOG_QUEUE_SIZE", 10000))
+INTERACTION_LOG_BATCH_SIZE = int(os.getenv("INTERACTION_LOG_BATCH_SIZE", 200))
+INTERACTION_LOG_FLUSH_INTERVAL = float(os.getenv("INTERACTION_LOG_FLUSH_INTERVAL", 1.0))
+INTERACTION_LOG_RETRIES = 3
+
+INTERACTION_COLUMNS = ("session_id", "user_input", "assistant_reply", "timestamp", "markdown_table")
+
+_TABLE_LINE_RE = re.compile(r"^\s*\|.*\|\s*$")
+_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{3,}")
+
+
+def extract_markdown_table(reply: str) -> Optional[str]:
+    """First markdown table in a reply (header, separator and rows), if any."""
+    block = []
+    for line in reply.splitlines() + [""]:
+        if _TABLE_LINE_RE.match(line):
+            block.append(line)
+            continue
+        if len(block) >= 2 and _SEPARATOR_RE.match(block[1]):
+            return "\n".join(block)
+        block = []
+    return None
+
+
+def build_insert(batch_size: int) -> str:
+    """One INSERT with a VALUES tuple per row (:session_id_0, ... :markdown_table_N)."""
+    rows = ",\n".join(
+        "(" + ", ".join(f":{column}_{i}" for column in INTERACTION_COLUMNS) + ")"
+        for i in range(batch_size)
+    )
+    return f"INSERT INTO interactions ({', '.join(INTERACTION_COLUMNS)}) VALUES\n{rows}"
+
+
+class InteractionLogger:
+    def __init__(self, queue_size: int = INTERACTION_LOG_QUEUE_SIZE, batch_size: int = INTERACTION_LOG_BATCH_SIZE,
+                 flush_interval: float = INTERACTION_LOG_FLUSH_INTERVAL):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    def _ensure_started(self):
+        # Started lazily per process: with preload_app the module is imported before gunicorn forks
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="interaction-logger", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def log(self, session_id: str, user_input: str, assistant_reply: str, markdown_table: Optional[str] = None):
+        """Queue one turn; never blocks. Dropped (and counted) when the queue is full."""
+        self._ensure_started()
+        if markdown_table is None and assistant_reply:
+            markdown_table = extract_markdown_table(assistant_reply)
+        row = (session_id, user_input, assistant_reply, datetime.datetime.now(), markdown_table)
+        try:
+            self._queue.put_nowait(row)
+            self.counters["enqueued"] += 1
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def _drain(self, first=None) -> list:
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list):
+        params = {f"{column}_{i}": value for i, row in enumerate(batch) for column, value in zip(INTERACTION_COLUMNS, row)}
+        delay = 1.0
+        for attempt in range(INTERACTION_LOG_RETRIES):
+            try:
+                with vc_database.background_engine.begin() as conn:
+                    conn.execute(text(build_insert(len(batch))), params)
+                self.counters["written"] += len(batch)
+                self.counters["batches"] += 1
+                return
+            except Exception as e:
+                if attempt + 1 == INTERACTION_LOG_RETRIES:
+                    log.error("InteractionLogger: dropping batch of %d rows after %d attempts: %s", len(batch), INTERACTION_LOG_RETRIES, e)
+                    self.counters["failed"] += len(batch)
+                    return
+                # Background thread: backing off here delays logging, not users
+                time.sleep(delay)
+                delay *= 2
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._write(self._drain(first))
+        # Shutdown: write everything still queued
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+
+    def close(self, timeout: float = 10.0):
+        """Stop the writer thread after it has flushed the queue."""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.warning("InteractionLogger: %d rows still queued after %.0fs", self._queue.qsize(), timeout)
+
+    def stats(self) -> dict:
+        depth = self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+        return {"queue_depth": depth, "queue_size": self.queue_size, **self.counters}
+
+
+interaction_logger = InteractionLogger()
+atexit.register(interaction_logger.close)
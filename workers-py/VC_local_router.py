@@ -0,0 +1,165 @@
+# Local query router.
+#
+# run_router_model spends a full LLM round trip to pick one of four labels.
+# This is a small linear classifier over hashed n-gram features of the query
+# (and the resolved context summary), trained offline with
+# train_local_router.py from the routing decisions the LLM router has made.
+# When its top probability reaches LOCAL_ROUTER_THRESHOLD the router node uses
+# it and skips the LLM; otherwise the LLM decides as before.
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+LOCAL_ROUTER_ENABLED = os.getenv("LOCAL_ROUTER", "true").lower() == "true"
+LOCAL_ROUTER_PATH = os.getenv("LOCAL_ROUTER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "local_router.npz"))
+LOCAL_ROUTER_THRESHOLD = float(os.getenv("LOCAL_ROUTER_THRESHOLD", 0.90))
+
+# Same buckets router_function understands; anything unrecognised routes to general
+LABELS = ("general_agent_query", "ranking_agent_query", "reasoning_agent_query", "prediction_agent_query")
+
+FEATURE_BITS = 18
+
+
+def canonical_label(query_type: str) -> str:
+    """Map a raw router output onto LABELS the way router_function reads it."""
+    for label in ("prediction_agent_query", "ranking_agent_query", "reasoning_agent_query"):
+        if label in (query_type or ""):
+            return label
+    return "general_agent_query"
+
+
+def _tokens(value: str) -> list[str]:
+    return "".join(ch if ch.isalnum() else " " for ch in value.lower()).split()
+
+
+def _bucket(feature: str, feature_bits: int) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little") & ((1 << feature_bits) - 1)
+
+
+def featurize(query: str, context_summary: str = "", feature_bits: int = FEATURE_BITS) -> tuple[np.ndarray, np.ndarray]:
+    """Sparse L2-normalized hashed features: query words, word bigrams and character trigrams, plus context words."""
+    words = _tokens(query)
+    features = [f"w:{word}" for word in words]
+    features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    features += [f"x:{word}" for word in _tokens(context_summary)]
+    features.append("bias")
+
+    counts = {}
+    for feature in features:
+        index = _bucket(feature, feature_bits)
+        counts[index] = counts.get(index, 0.0) + 1.0
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return indices, values / np.linalg.norm(values)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class LocalRouter:
+    def __init__(self, weights: np.ndarray, labels: tuple = LABELS, feature_bits: int = FEATURE_BITS, metadata: dict = None):
+        self.weights = weights            # (2**feature_bits, len(labels)) float32
+        self.labels = tuple(labels)
+        self.feature_bits = feature_bits
+        self.metadata = metadata or {}
+
+    def predict_proba(self, query: str, context_summary: str = "") -> np.ndarray:
+        indices, values = featurize(query, context_summary, self.feature_bits)
+        return _softmax(values @ self.weights[indices])
+
+    def predict(self, query: str, context_summary: str = "") -> tuple[str, float]:
+        """(label, probability) of the most likely bucket."""
+        proba = self.predict_proba(query, context_summary)
+        best = int(np.argmax(proba))
+        return self.labels[best], float(proba[best])
+
+    def save(self, path: str = LOCAL_ROUTER_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            labels=np.array(self.labels),
+            feature_bits=np.array(self.feature_bits),
+            metadata=np.array(json.dumps(self.metadata)),
+        )
+
+    @classmethod
+    def load(cls, path: str = LOCAL_ROUTER_PATH) -> "LocalRouter":
+        with np.load(path) as artifact:
+            return cls(
+                weights=artifact["weights"],
+                labels=tuple(str(label) for label in artifact["labels"]),
+                feature_bits=int(artifact["feature_bits"]),
+                metadata=json.loads(str(artifact["metadata"])),
+            )
+
+
+def train_local_router(examples: list[tuple[str, str, str]], epochs: int = 30, learning_rate: float = 2.0,
+                       l2: float = 1e-6, batch_size: int = 32, feature_bits: int = FEATURE_BITS, seed: int = 0) -> LocalRouter:
+    """
+    Multinomial logistic regression by minibatch SGD on sparse hashed features.
+    `examples` are (query, context_summary, query_type) triples.
+    """
+    rng = np.random.default_rng(seed)
+    label_index = {label: i for i, label in enumerate(LABELS)}
+    rows = [featurize(query, context, feature_bits) for query, context, _ in examples]
+    targets = np.array([label_index[canonical_label(query_type)] for _, _, query_type in examples], dtype=np.int64)
+    weights = np.zeros((1 << feature_bits, len(LABELS)), dtype=np.float32)
+
+    for epoch in range(epochs):
+        order = rng.permutation(len(rows))
+        step = learning_rate / (1.0 + 0.1 * epoch)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            indices = np.concatenate([rows[i][0] for i in batch])
+            values = np.concatenate([rows[i][1] for i in batch])
+            owners = np.repeat(np.arange(len(batch)), [len(rows[i][0]) for i in batch])
+
+            # Logits for the batch, gathered from the touched weight rows only
+            logits = np.zeros((len(batch), len(LABELS)), dtype=np.float32)
+            np.add.at(logits, owners, values[:, None] * weights[indices])
+            error = _softmax(logits)
+            error[np.arange(len(batch)), targets[batch]] -= 1.0
+
+            gradient = values[:, None] * error[owners] / len(batch)
+            if l2:
+                gradient += l2 * weights[indices]
+            np.add.at(weights, indices, -step * gradient)
+
+    return LocalRouter(weights, LABELS, feature_bits, {"trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "examples": len(examples), "epochs": epochs})
+
+
+_local_router = None
+_local_router_loaded = False
+_local_router_lock = threading.Lock()
+
+def get_local_router() -> Optional[LocalRouter]:
+    """The persisted router, or None when disabled or no artifact has been trained yet."""
+    global _local_router, _local_router_loaded
+    if not LOCAL_ROUTER_ENABLED:
+        return None
+    if not _local_router_loaded:
+        with _local_router_lock:
+            if not _local_router_loaded:
+                try:
+                    _local_router = LocalRouter.load(LOCAL_ROUTER_PATH)
+                    log.info("Local router loaded from %s (%s)", LOCAL_ROUTER_PATH, _local_router.metadata)
+                except FileNotFoundError:
+                    log.info("No local router at %s; every query goes to the LLM router", LOCAL_ROUTER_PATH)
+                except Exception:
+                    log.exception("Could not load local router from %s", LOCAL_ROUTER_PATH)
+                _local_router_loaded = True
+    return _local_router
@@ -0,0 +1,309 @@
+# Pipeline metrics, served in Prometheus text format on /metrics.
+#
+# The run_*_model functions only printed which node was running, so a slow
+# answer could not be broken down. Every graph run now records:
+#
+#   vc_node_duration_seconds{node}             wall time per graph node (timed_node)
+#   vc_llm_call_duration_seconds{node,model}   per LLM call, plus vc_llm_tokens{node,model,kind}
+#                                              for prompt / completion / cached prompt tokens
+#   vc_tool_duration_seconds{node,tool}        per tool call, plus vc_tool_rows{tool}
+#   vc_routes_total{route}                     route distribution (vc_router_decisions_total{source})
+#
+# LLM and tool calls are timed by pipeline_metrics, a callback handler passed
+# in the graph config, so calls inside the ReAct subgraphs are attributed to
+# the top-level node that ran them. Cache hit counters and pool gauges are
+# read from the existing stats() at scrape time (register_collector).
+# Values are per worker process; a restarted worker starts from zero.
+import os
+import time
+import logging
+import threading
+import functools
+import inspect
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+log = logging.getLogger(__name__)
+
+PIPELINE_METRICS = os.getenv("PIPELINE_METRICS", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ── Metric types ──
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def samples(self) -> Iterable[tuple[str, dict, float]]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}         # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterable[tuple[str, dict, float]]:
+        with self._lock:
+            series_items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in series_items:
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, series):
+                yield self.name + "_bucket", {**labels, "le": format_number(float(bound))}, count
+            yield self.name + "_bucket", {**labels, "le": "+Inf"}, series[-1]
+            yield self.name + "_sum", labels, series[-2]
+            yield self.name + "_count", labels, series[-1]
+
+    def summary(self) -> dict:
+        """{label values joined by "/": {"count", "avg"}} for /health."""
+        with self._lock:
+            return {"/".join(key) or "all": {"count": series[-1], "avg": round(series[-2] / series[-1], 4) if series[-1] else 0.0}
+                    for key, series in self._series.items()}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def reset(self):
+        """Clear every recorded series (benchmarks measure one phase at a time)."""
+        for metric in self._metrics:
+            metric.reset()
+
+    def register_collector(self, func: Callable[[], Iterable[tuple]]):
+        """
+        `func()` yields (name, kind, help, [(labels, value), ...]) at scrape time,
+        for values other modules already count (cache hits, pool usage).
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines += [f"{name}{format_labels(labels)} {format_number(value)}" for name, labels, value in metric.samples()]
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                log.warning("Metrics collector %s failed: %s", getattr(collector, "__name__", collector), e)
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines += [f"{name}{format_labels(labels)} {format_number(value)}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+node_duration = metrics.histogram("vc_node_duration_seconds", "Wall time of one graph node run.", ("node",))
+node_errors = metrics.counter("vc_node_errors_total", "Graph node runs that raised.", ("node",))
+graph_duration = metrics.histogram("vc_graph_duration_seconds", "Wall time of one full graph run.", ("mode",))
+llm_duration = metrics.histogram("vc_llm_call_duration_seconds", "Wall time of one LLM call.", ("node", "model"))
+llm_tokens = metrics.histogram("vc_llm_tokens", "Tokens per LLM call (kind: prompt, completion, cached).", ("node", "model", "kind"), TOKEN_BUCKETS)
+llm_errors = metrics.counter("vc_llm_errors_total", "LLM calls that raised.", ("node", "model"))
+tool_duration = metrics.histogram("vc_tool_duration_seconds", "Wall time of one tool call.", ("node", "tool"))
+tool_rows = metrics.histogram("vc_tool_rows", "Rows a tool returned (before encoding and truncation).", ("tool",), ROW_BUCKETS)
+tool_errors = metrics.counter("vc_tool_errors_total", "Tool calls that raised.", ("node", "tool"))
+routes = metrics.counter("vc_routes_total", "Turns per route picked for the agent step (cache: answer cache hit).", ("route",))
+router_decisions = metrics.counter("vc_router_decisions_total", "Router decisions by source (local, llm, fused).", ("source",))
+
+
+# ── Graph nodes ──
+
+def timed_node(name: str, func):
+    """Wrap a graph node (sync or async) so each run is recorded in vc_node_duration_seconds."""
+    if not PIPELINE_METRICS:
+        return func
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                node_errors.inc(node=name)
+                raise
+            finally:
+                node_duration.observe(time.perf_counter() - started, node=name)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                node_errors.inc(node=name)
+                raise
+            finally:
+                node_duration.observe(time.perf_counter() - started, node=name)
+    return wrapper
+
+
+def record_tool_rows(tool: str, rows: int):
+    if PIPELINE_METRICS:
+        tool_rows.observe(rows, tool=tool)
+
+
+# ── LLM and tool calls ──
+
+def top_level_node(metadata: Optional[dict]) -> str:
+    """Graph node a callback belongs to: the first segment of the LangGraph checkpoint namespace."""
+    metadata = metadata or {}
+    namespace = metadata.get("langgraph_checkpoint_ns") or ""
+    if namespace:
+        return namespace.split("|", 1)[0].split(":", 1)[0]
+    return metadata.get("langgraph_node") or "none"
+
+
+class PipelineMetrics(BaseCallbackHandler):
+    """Times LLM and tool calls by run_id and records token usage; pass it in the graph config callbacks."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}           # run_id -> (started, node, model or tool name)
+
+    def _start(self, run_id, node: str, name: str):
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), node, name)
+
+    def _finish(self, run_id) -> Optional[tuple]:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        started, node, name = run
+        return time.perf_counter() - started, node, name
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, top_level_node(metadata), (metadata or {}).get("ls_model_name") or "unknown")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, top_level_node(metadata), (metadata or {}).get("ls_model_name") or "unknown")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._finish(run_id)
+        if run is None:
+            return
+        seconds, node, model = run
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if getattr(message, "usage_metadata", None):
+                    usage = message.usage_metadata
+                    model = (message.response_metadata or {}).get("model_name") or model
+        llm_duration.observe(seconds, node=node, model=model)
+        if usage:
+            llm_tokens.observe(usage.get("input_tokens", 0), node=node, model=model, kind="prompt")
+            llm_tokens.observe(usage.get("output_tokens", 0), node=node, model=model, kind="completion")
+            llm_tokens.observe((usage.get("input_token_details") or {}).get("cache_read") or 0, node=node, model=model, kind="cached")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._finish(run_id)
+        if run is not None:
+            seconds, node, model = run
+            llm_duration.observe(seconds, node=node, model=model)
+            llm_errors.inc(node=node, model=model)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, top_level_node(metadata), kwargs.get("name") or (serialized or {}).get("name") or "unknown")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        run = self._finish(run_id)
+        if run is not None:
+            seconds, node, tool = run
+            tool_duration.observe(seconds, node=node, tool=tool)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        run = self._finish(run_id)
+        if run is not None:
+            seconds, node, tool = run
+            tool_duration.observe(seconds, node=node, tool=tool)
+            tool_errors.inc(node=node, tool=tool)
+
+
+pipeline_metrics = PipelineMetrics()
+
+
+def graph_callbacks() -> list:
+    """Callbacks to put in a graph run's config."""
+    return [pipeline_metrics] if PIPELINE_METRICS else []
@@ -0,0 +1,98 @@
+# Provider prompt-prefix caching.
+#
+# Every agent call resends a long static system prompt plus the tool schemas.
+# Providers (through OpenRouter) cache a request prefix they have seen
+# recently, but only when the prefix is byte-identical, so the layout is fixed
+# to: tool schemas, static system prompt, chat history (which only grows
+# between turns), and the dynamic context and query last.
+# ChatOpenRouter marks the end of the system prompt with a cache_control
+# breakpoint (add_cache_control) and prompt_cache_usage counts the cached
+# prompt tokens providers report back.
+import os
+import copy
+import logging
+import threading
+from collections import defaultdict
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, HumanMessage
+
+log = logging.getLogger(__name__)
+
+PROMPT_CACHE_CONTROL = os.getenv("PROMPT_CACHE_CONTROL", "true").lower() == "true"
+DEFAULT_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+# ── Message layout ──
+
+def context_message(header: str, context_summary: str, user_input: str) -> HumanMessage:
+    return HumanMessage(content=f"[{header}]\n{context_summary}\n\n[CURRENT QUERY]\n{user_input}")
+
+
+def agent_messages(chat_history: list[BaseMessage], header: str, context_summary: str, user_input: str) -> list[BaseMessage]:
+    """Prefix-stable agent input: history first, this turn's context and query last (the system prompt is the agent's `prompt`)."""
+    return list(chat_history) + [context_message(header, context_summary, user_input)]
+
+
+# ── Cache-control hints ──
+
+def add_cache_control(payload: dict, cache_control: dict = DEFAULT_CACHE_CONTROL) -> dict:
+    """
+    Put a cache_control breakpoint on the last text part of the leading system
+    message(s) of an OpenAI-style chat payload, so the provider caches tools +
+    system prompt. String content becomes a single text part.
+    """
+    messages = payload.get("messages") or []
+    last_system = None
+    for message in messages:
+        if message.get("role") not in ("system", "developer"):
+            break
+        last_system = message
+    if last_system is None:
+        return payload
+    content = last_system.get("content")
+    if isinstance(content, str):
+        last_system["content"] = [{"type": "text", "text": content, "cache_control": dict(cache_control)}]
+    elif isinstance(content, list) and content:
+        parts = [copy.copy(part) for part in content]
+        for part in reversed(parts):
+            if isinstance(part, dict) and part.get("type") == "text":
+                part["cache_control"] = dict(cache_control)
+                break
+        last_system["content"] = parts
+    return payload
+
+
+# ── Cached-token reporting ──
+
+class PromptCacheUsage(BaseCallbackHandler):
+    """Counts prompt and cached prompt tokens per model from usage_metadata."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models = defaultdict(lambda: {"calls": 0, "input_tokens": 0, "cached_tokens": 0})
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                model = (message.response_metadata or {}).get("model_name", "unknown")
+                cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+                with self._lock:
+                    entry = self.models[model]
+                    entry["calls"] += 1
+                    entry["input_tokens"] += usage.get("input_tokens", 0)
+                    entry["cached_tokens"] += cached
+                log.debug("Prompt cache: %s %d/%d input tokens cached", model, cached, usage.get("input_tokens", 0))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                model: {**entry, "cached_ratio": round(entry["cached_tokens"] / entry["input_tokens"], 3) if entry["input_tokens"] else 0.0}
+                for model, entry in self.models.items()
+            }
+
+
+prompt_cache_usage = PromptCacheUsage()
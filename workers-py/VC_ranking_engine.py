@@ -0,0 +1,133 @@
+# In-memory ranking engine for VCRankingTool.
+#
+# The three VC tables are small and only change on a sheet reload, so instead
+# of joining and sorting them in Postgres on every call we keep the join in
+# process as NumPy columns and answer metric × sector top-k with vectorized
+# filtering. The snapshot is rebuilt when the dataset version moves and the
+# change log says one of the three tables changed.
+import threading
+import time
+import logging
+import numpy as np
+from sqlalchemy import text
+import VC_chain_database as vc_database
+import VC_chain_systemprompts as vc_systemprompts
+
+log = logging.getLogger(__name__)
+
+VC_TABLES = [
+    ("vc_sector_based_raw", "vs"),
+    ("vc_overall_raw",      "vo"),
+    ("vc_market_cagr",      "vc"),
+]
+
+# Same join VCRankingTool runs in SQL
+VC_JOIN_SQL = """
+    SELECT vs.*, vo.*, vc.*
+    FROM   vc_sector_based_raw vs
+    JOIN   vc_overall_raw      vo ON vo."Top Tier" = vs."Top Tier"
+    JOIN   vc_market_cagr      vc ON vc."Sector"   = vs."Sector"
+"""
+
+
+class VCRankingSnapshot:
+    """The joined VC rows for one dataset version, plus column arrays for ranking."""
+
+    def __init__(self, version: int, columns: list[str], rows: list[tuple]):
+        self.version = version
+        self.columns = columns
+        self.records = [dict(zip(columns, row)) for row in rows]
+
+        # Sector codes: similarity is computed once per distinct sector, then broadcast to rows
+        sector_values = [record["Sector"] or "" for record in self.records]
+        self.sector_names, self.sector_codes = np.unique(np.array(sector_values, dtype=object), return_inverse=True)
+
+        self.metrics = {}
+        for metric, column in vc_systemprompts.METRIC_NUMERIC_COLUMN.items():
+            self.metrics[metric] = np.array(
+                [np.nan if record.get(column) is None else float(record[column]) for record in self.records],
+                dtype=np.float64,
+            )
+
+        # SELECT DISTINCT semantics for the all-sector ranking
+        seen = set()
+        self.distinct = np.zeros(len(rows), dtype=bool)
+        for i, row in enumerate(rows):
+            if row not in seen:
+                seen.add(row)
+                self.distinct[i] = True
+
+
+def top_k_desc(values: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the k largest values, largest first."""
+    if k <= 0 or len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(values):
+        part = np.argpartition(-values, k - 1)[:k]
+    else:
+        part = np.arange(len(values))
+    return part[np.argsort(-values[part], kind="stable")]
+
+
+class VCRankingEngine:
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _load(self, version: int) -> VCRankingSnapshot:
+        started = time.time()
+        with vc_database.engine.connect() as conn:
+            # Qualify column names that appear in more than one table ("Top Tier", "Sector", ...)
+            columns = []
+            for table, alias in VC_TABLES:
+                for name in conn.execute(text(f"SELECT * FROM {table} LIMIT 0")).keys():
+                    columns.append(name if name not in columns else f"{alias}.{name}")
+            rows = [tuple(row) for row in conn.execute(text(VC_JOIN_SQL)).fetchall()]
+        snapshot = VCRankingSnapshot(version, columns, rows)
+        log.info("VCRankingEngine: loaded %d rows for dataset version %s in %.3fs", len(rows), version, time.time() - started)
+        return snapshot
+
+    def snapshot(self) -> VCRankingSnapshot:
+        version = vc_database.get_dataset_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    if snapshot is not None and vc_database.tables_unchanged(snapshot.version, version, [t for t, _ in VC_TABLES]):
+                        # Only other tables changed: keep the rows, retag the version
+                        snapshot.version = version
+                    else:
+                        self._snapshot = snapshot = self._load(version)
+        return snapshot
+
+    def rank(self, metric: str, count: int, sector_similarity: dict = None, sim_threshold: float = 0.30) -> list[dict]:
+        """
+        Top `count` rows by `metric`. With `sector_similarity` ({sector: similarity}) rows are kept
+        when their sector reaches `sim_threshold` and ordered by similarity, then metric, like the SQL path.
+        """
+        snapshot = self.snapshot()
+        values = snapshot.metrics[metric]
+        valid = ~np.isnan(values)
+
+        if sector_similarity is None:
+            candidates = np.flatnonzero(valid & snapshot.distinct)
+            order = candidates[top_k_desc(values[candidates], count)]
+            sims = None
+        else:
+            sim_by_code = np.array([sector_similarity.get(name, 0.0) for name in snapshot.sector_names], dtype=np.float64)
+            sims = sim_by_code[snapshot.sector_codes]
+            candidates = np.flatnonzero(valid & (sims >= sim_threshold))
+            order = candidates[np.lexsort((-values[candidates], -sims[candidates]))][:count]
+
+        results = []
+        for i in order:
+            record = dict(snapshot.records[i])
+            if sims is not None:
+                record["sim"] = float(sims[i])
+            record["metric_val"] = record[vc_systemprompts.METRIC_NUMERIC_COLUMN[metric]]
+            results.append(record)
+        return results
+
+
+ranking_engine = VCRankingEngine()
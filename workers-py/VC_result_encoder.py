@@ -0,0 +1,215 @@
+# Compact encoding of tool results for the agents.
+#
+# Tools used to hand LangChain lists of SQLAlchemy Rows, which end up in the
+# ReAct transcript as their repr: every column of every joined table, full
+# precision Decimals, datetime reprs, and no column names. Every step after a
+# tool call pays for those tokens again. @compact_result turns a result into
+#
+#   columns: Top Tier | Sector | AUM | metric_val
+#   Sequoia Capital | Fintech | $9,200,000,000 | 9200000000
+#   ...
+#   (+15 more rows available; filter or aggregate to see them)
+#
+# projected to the columns the tool names, numbers rounded, long cells cut,
+# and records how many tokens that saved per tool.
+#
+#   @tool
+#   @compact_result(columns=("VC", "Sector"))
+#   @cached_tool(...)
+#   def some_tool(...): ...
+import os
+import json
+import decimal
+import logging
+import inspect
+import datetime
+import functools
+import threading
+from collections import defaultdict
+from typing import Callable, Optional, Sequence, Union
+from VC_metrics import record_tool_rows
+
+log = logging.getLogger(__name__)
+
+TOOL_RESULT_MAX_ROWS = int(os.getenv("TOOL_RESULT_MAX_ROWS", 50))
+TOOL_RESULT_MAX_CELL_CHARS = int(os.getenv("TOOL_RESULT_MAX_CELL_CHARS", 200))
+TOOL_RESULT_DECIMALS = int(os.getenv("TOOL_RESULT_DECIMALS", 2))
+COMPACT_TOOL_RESULTS = os.getenv("COMPACT_TOOL_RESULTS", "true").lower() == "true"
+
+# Single-key messages tools return instead of rows; passed through untouched
+MESSAGE_KEYS = {"error", "warning", "info"}
+
+
+# ── Token counting (for the savings report only) ──
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def count_tokens(value: str) -> int:
+    """cl100k token count when tiktoken and its encoding file are available, else ~4 characters per token."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    _encoding = False
+    if _encoding:
+        return len(_encoding.encode(value, disallowed_special=()))
+    return (len(value) + 3) // 4
+
+
+def transcript_text(result) -> str:
+    """What LangChain's ToolNode puts in the ToolMessage for a non-string result."""
+    if isinstance(result, str):
+        return result
+    try:
+        return json.dumps(result, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return str(result)
+
+
+class EncoderStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tools = defaultdict(lambda: {"calls": 0, "raw_tokens": 0, "encoded_tokens": 0})
+
+    def record(self, tool_name: str, raw_tokens: int, encoded_tokens: int):
+        with self._lock:
+            entry = self.tools[tool_name]
+            entry["calls"] += 1
+            entry["raw_tokens"] += raw_tokens
+            entry["encoded_tokens"] += encoded_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            report = {}
+            for name, entry in self.tools.items():
+                saved = entry["raw_tokens"] - entry["encoded_tokens"]
+                report[name] = {**entry, "saved_tokens": saved,
+                                "saved_ratio": round(saved / entry["raw_tokens"], 3) if entry["raw_tokens"] else 0.0}
+            return report
+
+
+encoder_stats = EncoderStats()
+
+
+# ── Encoding ──
+
+def format_value(value, max_chars: int = TOOL_RESULT_MAX_CELL_CHARS) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (float, decimal.Decimal)):
+        if value != value:     # NaN
+            return ""
+        if value == int(value):
+            return str(int(value))
+        # Whole numbers for large values, two decimals for ordinary ones, two significant digits for small ones
+        if abs(value) >= 1000:
+            return str(round(value))
+        return f"{float(value):.{TOOL_RESULT_DECIMALS}f}" if abs(value) >= 1 else f"{float(value):.2g}"
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M") if (value.hour, value.minute) != (0, 0) else value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        text = ", ".join(format_value(item, max_chars) for item in value)
+    else:
+        text = " ".join(str(value).split())
+    # The separator must stay unambiguous
+    text = text.replace("|", "/")
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+def _columns_and_values(row) -> tuple[Sequence[str], Sequence]:
+    if hasattr(row, "_fields"):                 # sqlalchemy Row
+        return row._fields, tuple(row)
+    if hasattr(row, "keys"):                    # dict, RowMapping
+        keys = list(row.keys())
+        return keys, [row[key] for key in keys]
+    return None, row if isinstance(row, (list, tuple)) else (row,)
+
+
+def is_message_result(result) -> bool:
+    return (isinstance(result, list) and len(result) == 1 and isinstance(result[0], dict)
+            and set(result[0]) <= MESSAGE_KEYS)
+
+
+def encode_rows(rows: list, columns: Optional[Sequence[str]] = None, max_rows: int = TOOL_RESULT_MAX_ROWS,
+                more_available: bool = False) -> str:
+    """
+    Header-plus-rows text for a list of Rows / dicts / tuples / scalars.
+    `columns` projects (and orders) the output; names missing from the rows are
+    skipped (for positional tuples it names the positions). Repeated column
+    names (vs.*, vo.* joins) keep their first value.
+    `more_available` says the rows themselves were already cut off upstream.
+    """
+    if not rows:
+        return "(no rows)"
+    names, _ = _columns_and_values(rows[0])
+    shown = rows[:max_rows]
+    hidden = len(rows) - len(shown)
+
+    if names is None and not isinstance(rows[0], (list, tuple)):
+        # Plain values (sector names, sample lists): one line
+        lines = [", ".join(format_value(row) for row in shown)]
+    elif names is None:
+        # Positional tuples; `columns` names the positions
+        lines = ["columns: " + " | ".join(columns)] if columns else []
+        lines += [" | ".join(format_value(value) for value in row) for row in shown]
+    else:
+        first_index = {}
+        for i, name in enumerate(names):
+            first_index.setdefault(name, i)
+        selected = [name for name in (columns or first_index) if name in first_index]
+        indices = [first_index[name] for name in selected]
+        lines = ["columns: " + " | ".join(selected)]
+        for row in shown:
+            _, values = _columns_and_values(row)
+            lines.append(" | ".join(format_value(values[i]) for i in indices))
+
+    if hidden or more_available:
+        count = f"+{hidden} " if hidden else ""
+        lines.append(f"({count}more rows available; filter or aggregate to see them)")
+    return "\n".join(lines)
+
+
+def compact_result(columns: Union[Sequence[str], Callable[..., Sequence[str]], None] = None, max_rows: int = TOOL_RESULT_MAX_ROWS):
+    """
+    Encode a tool's row results with encode_rows. `columns` is a list of names or
+    a function of the tool's arguments returning one (e.g. the requested metric).
+    Put it between @tool and @cached_tool: the cache keeps raw rows.
+    """
+    def decorator(func):
+        if not COMPACT_TOOL_RESULTS:
+            return func
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            if not isinstance(result, list) or is_message_result(result):
+                return result
+            record_tool_rows(func.__name__, len(result))
+            try:
+                if callable(columns):
+                    bound = signature.bind(*args, **kwargs)
+                    bound.apply_defaults()
+                    projection = columns(**bound.arguments)
+                else:
+                    projection = columns
+                encoded = encode_rows(result, projection, max_rows)
+                raw_tokens, encoded_tokens = count_tokens(transcript_text(result)), count_tokens(encoded)
+            except Exception:
+                log.exception("compact_result: could not encode %s result, passing it through", func.__name__)
+                return result
+            encoder_stats.record(func.__name__, raw_tokens, encoded_tokens)
+            log.info("%s: result %d -> %d tokens", func.__name__, raw_tokens, encoded_tokens)
+            return encoded
+
+        return wrapper
+    return decorator
@@ -0,0 +1,224 @@
+# Generated schema card for the SQL-writing agent.
+#
+# The reasoning agent used to spend two or three ReAct steps on
+# get_available_tables / get_available_fields before writing any SQL, and
+# the hand-written DATABASE_SCHEMA had drifted from the tables it queries.
+# The card is built from the database itself once per dataset version:
+#
+#   funding_rounds_v2 (48210 rows)
+#     org_name text; 31020 distinct
+#     round_name text; 41 distinct: Seed 31%, Series A 18%, ...
+#     money_raised_usd numeric 0..6600000000; 12% null
+#     announced_on date 2005-01-03..2025-06-30
+#
+# and sent as a second system message after REASONING_SYSTEM_PROMPT (stable
+# for a dataset version, so the prompt prefix stays cacheable).
+import os
+import re
+import time
+import logging
+import threading
+from typing import NamedTuple, Optional
+from sqlalchemy import text
+import VC_chain_database as vc_database
+from VC_result_encoder import format_value
+
+log = logging.getLogger(__name__)
+
+SCHEMA_CARD_TABLES = [table.strip() for table in os.getenv(
+    "SCHEMA_CARD_TABLES",
+    "funding_rounds_v2,startup_profile,vc_overall_raw,vc_sector_based_raw,vc_market_cagr,funding_round_investors,funding_round_categories",
+).split(",") if table.strip()]
+# Text columns with at most this many distinct values (or repeating on average 10+ times) list their top values
+SCHEMA_CARD_MAX_CATEGORIES = int(os.getenv("SCHEMA_CARD_MAX_CATEGORIES", 30))
+SCHEMA_CARD_TOP_VALUES = int(os.getenv("SCHEMA_CARD_TOP_VALUES", 5))
+SCHEMA_CARD_VALUE_CHARS = 40
+# A card that failed to build is retried after this many seconds
+SCHEMA_CARD_RETRY_SECONDS = 60
+
+# Comma-separated list columns and the link table holding one row per value
+MULTI_VALUE_COLUMNS = {
+    ("funding_rounds_v2", "investors"): "funding_round_investors.investor",
+    ("funding_rounds_v2", "categories"): "funding_round_categories.category",
+}
+
+JOINS = [
+    'funding_rounds_v2.org_name = startup_profile."Startup"',
+    "funding_round_investors.round_id = funding_rounds_v2.round_id",
+    "funding_round_categories.round_id = funding_rounds_v2.round_id",
+    'vc_sector_based_raw."Top Tier" = vc_overall_raw."Top Tier"',
+    'vc_sector_based_raw."Sector" = vc_market_cagr."Sector"',
+]
+
+NUMERIC_TYPES = {"smallint", "integer", "bigint", "numeric", "real", "double precision"}
+TEMPORAL_TYPES = {"date", "timestamp without time zone", "timestamp with time zone"}
+TEXT_TYPES = {"text", "character varying", "character"}
+SHORT_TYPES = {"character varying": "varchar", "double precision": "float", "timestamp without time zone": "timestamp",
+               "timestamp with time zone": "timestamptz"}
+
+COLUMNS_SQL = """
+    SELECT table_name, column_name, data_type
+    FROM   information_schema.columns
+    WHERE  table_schema = 'public' AND table_name = ANY(:tables)
+    ORDER  BY table_name, ordinal_position
+"""
+
+
+def quote_identifier(name: str) -> str:
+    """Column name as it has to be written in SQL."""
+    return name if re.fullmatch(r"[a-z_][a-z0-9_]*", name) else '"' + name.replace('"', '""') + '"'
+
+
+class ColumnStats(NamedTuple):
+    name: str
+    data_type: str
+    non_null: int
+    distinct: Optional[int] = None          # text columns
+    low: object = None                      # numeric / temporal columns
+    high: object = None
+    top_values: tuple = ()                  # (value, count) for categorical text columns
+
+
+class SchemaCard(NamedTuple):
+    version: int
+    text: str
+    tables: dict                            # table -> [ColumnStats]
+    row_counts: dict
+    built_at: float
+    failed: bool = False
+
+    def table_fields(self, table: str) -> list[str]:
+        """One description line per column of `table` (empty when the card does not cover it)."""
+        return [describe_column(table, column, self.row_counts[table]) for column in self.tables.get(table, [])]
+
+
+# ── Statistics ──
+
+def _table_stats(conn, table: str, columns: list[tuple[str, str]]) -> tuple[int, list[ColumnStats]]:
+    """Row count and per-column stats of one table: one aggregate scan, plus a GROUP BY per categorical column."""
+    select = ["count(*)"]
+    for name, data_type in columns:
+        column = quote_identifier(name)
+        select.append(f"count({column})")
+        if data_type in TEXT_TYPES:
+            select.append(f"count(DISTINCT {column})")
+        elif data_type in NUMERIC_TYPES or data_type in TEMPORAL_TYPES:
+            select += [f"min({column})", f"max({column})"]
+    row = list(conn.execute(text(f"SELECT {', '.join(select)} FROM {table}")).one())
+    row_count = row.pop(0)
+
+    stats = []
+    for name, data_type in columns:
+        non_null = row.pop(0)
+        if data_type in TEXT_TYPES:
+            distinct = row.pop(0)
+            top_values = ()
+            categorical = distinct and (distinct <= SCHEMA_CARD_MAX_CATEGORIES or distinct * 10 <= non_null)
+            if categorical and (table, name) not in MULTI_VALUE_COLUMNS:
+                column = quote_identifier(name)
+                top_values = tuple(tuple(r) for r in conn.execute(text(
+                    f"SELECT {column}, count(*) FROM {table} WHERE {column} IS NOT NULL "
+                    f"GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT {SCHEMA_CARD_TOP_VALUES}"
+                )))
+            stats.append(ColumnStats(name, data_type, non_null, distinct=distinct, top_values=top_values))
+        elif data_type in NUMERIC_TYPES or data_type in TEMPORAL_TYPES:
+            low, high = row.pop(0), row.pop(0)
+            stats.append(ColumnStats(name, data_type, non_null, low=low, high=high))
+        else:
+            stats.append(ColumnStats(name, data_type, non_null))
+    return row_count, stats
+
+
+# ── Rendering ──
+
+def describe_column(table: str, column: ColumnStats, row_count: int) -> str:
+    parts = [f"{quote_identifier(column.name)} {SHORT_TYPES.get(column.data_type, column.data_type)}"]
+    if column.low is not None:
+        parts[0] += f" {format_value(column.low)}..{format_value(column.high)}"
+    details = []
+    link = MULTI_VALUE_COLUMNS.get((table, column.name))
+    if link:
+        details.append(f"comma-separated list, one row per value in {link}")
+    elif column.distinct is not None:
+        top = ""
+        if column.top_values:
+            top = ": " + ", ".join(
+                f"{format_value(value, SCHEMA_CARD_VALUE_CHARS)} {count * 100 // max(column.non_null, 1)}%"
+                for value, count in column.top_values
+            )
+            if column.distinct > len(column.top_values):
+                top += ", ..."
+        details.append(f"{column.distinct} distinct{top}")
+    if row_count and column.non_null < row_count:
+        details.append(f"{(row_count - column.non_null) * 100 // row_count}% null")
+    return "; ".join(parts + details)
+
+
+def render_card(version: int, tables: dict, row_counts: dict) -> str:
+    lines = [f"DATABASE SCHEMA (generated from dataset version {version}; quote mixed-case column names as shown)"]
+    for table, columns in tables.items():
+        lines.append(f"{table} ({row_counts[table]} rows)")
+        lines += [f"  {describe_column(table, column, row_counts[table])}" for column in columns]
+    joins = [join for join in JOINS if all(name in tables for name in re.findall(r"(\w+)\.", join))]
+    if joins:
+        lines.append("Joins:")
+        lines += [f"  {join}" for join in joins]
+    return "\n".join(lines)
+
+
+def build_schema_card(version: int, previous: Optional[SchemaCard] = None) -> SchemaCard:
+    """Card for `version`; stats of tables the change log shows untouched since `previous` are reused."""
+    started = time.time()
+    reused = 0
+    with vc_database.background_engine.connect() as conn:
+        columns = {}
+        for table, name, data_type in conn.execute(text(COLUMNS_SQL), {"tables": SCHEMA_CARD_TABLES}):
+            columns.setdefault(table, []).append((name, data_type))
+        tables, row_counts = {}, {}
+        # Configured order; tables missing from the database are left out
+        for table in SCHEMA_CARD_TABLES:
+            if table not in columns:
+                continue
+            if (previous is not None and not previous.failed and table in previous.tables
+                    and [(c.name, c.data_type) for c in previous.tables[table]] == columns[table]
+                    and vc_database.tables_unchanged(previous.version, version, [table])):
+                row_counts[table], tables[table] = previous.row_counts[table], previous.tables[table]
+                reused += 1
+            else:
+                row_counts[table], tables[table] = _table_stats(conn, table, columns[table])
+    card = SchemaCard(version, render_card(version, tables, row_counts), tables, row_counts, time.time())
+    log.info("Schema card: %d tables (%d reused), %d columns, %d chars for dataset version %s in %.3fs",
+             len(tables), reused, sum(len(c) for c in tables.values()), len(card.text), version, time.time() - started)
+    return card
+
+
+# ── Cache ──
+
+_card = None
+_card_lock = threading.Lock()
+
+def _stale(card: Optional[SchemaCard], version: int) -> bool:
+    return (card is None or card.version != version
+            or (card.failed and time.time() - card.built_at > SCHEMA_CARD_RETRY_SECONDS))
+
+def get_schema_card() -> SchemaCard:
+    """The card for the current dataset version, rebuilt when the version moves. Never raises."""
+    global _card
+    version = vc_database.get_dataset_version()
+    card = _card
+    if _stale(card, version):
+        with _card_lock:
+            if _stale(_card, version):
+                try:
+                    _card = build_schema_card(version, _card)
+                except Exception as e:
+                    # The agent falls back to the discovery tools
+                    log.warning("Schema card: could not build for dataset version %s: %s", version, e)
+                    _card = SchemaCard(version, "", {}, {}, time.time(), failed=True)
+            card = _card
+    return card
+
+def current_schema_card_text() -> str:
+    """Last built card text, without touching the database (for prompt callables on the event loop)."""
+    card = _card
+    return card.text if card is not None else ""
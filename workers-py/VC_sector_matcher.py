@@ -0,0 +1,120 @@
+# In-process fuzzy sector matching with pg_trgm semantics.
+#
+# VCRankingTool used to compute word_similarity(lower(vs."Sector"), :q) for
+# every joined row, which no index can serve. The sector vocabulary is tiny, so
+# we keep its trigrams in memory, score a query against it here with the same
+# algorithm pg_trgm uses, and hand SQL / the ranking engine the canonical
+# names to filter on by plain equality. Matchers for the current dataset
+# version are cached by VC_vocabulary.
+import re
+import struct
+
+# Same threshold VCRankingTool has always used with pg_trgm
+SIM_THRESHOLD = 0.30
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def trigrams(value: str) -> list[str]:
+    """
+    Ordered trigrams of `value` the way pg_trgm builds them: lower-cased, split
+    into alphanumeric words, each word padded with two leading blanks and one
+    trailing blank. Duplicates are kept; order matters for word_similarity.
+    """
+    result = []
+    for word in _WORD_RE.findall(value.lower()):
+        padded = f"  {word} "
+        result.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def _float4(value: float) -> float:
+    # pg_trgm does its arithmetic in float4
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def _calc_sml(count: int, len1: int, len2: int) -> float:
+    return _float4(count / (len1 + len2 - count))
+
+
+def word_similarity_ids(needle_ids: set, haystack_ids: list) -> float:
+    """
+    Port of pg_trgm's iterate_word_similarity (non-strict): best similarity
+    between the needle's trigram set and any continuous extent of the
+    haystack's ordered trigrams. Trigrams are given as ids.
+    """
+    ulen1 = len(needle_ids)
+    if ulen1 == 0:
+        return 0.0
+    lastpos = {}
+    ulen2 = count = 0
+    upper = lower = -1
+    smlr_max = 0.0
+
+    for i, trg in enumerate(haystack_ids):
+        found = trg in needle_ids
+        if lower >= 0 or found:
+            if lastpos.get(trg, -1) < 0:
+                ulen2 += 1
+                if found:
+                    count += 1
+            lastpos[trg] = i
+
+        if not found:
+            continue
+
+        upper = i
+        if lower == -1:
+            lower = i
+            ulen2 = 1
+        smlr_cur = _calc_sml(count, ulen1, ulen2)
+
+        # Try moving the lower bound right for a better extent
+        tmp_count, tmp_ulen2, prev_lower = count, ulen2, lower
+        for tmp_lower in range(lower, upper + 1):
+            smlr_tmp = _calc_sml(tmp_count, ulen1, tmp_ulen2)
+            if smlr_tmp > smlr_cur:
+                smlr_cur, ulen2, lower, count = smlr_tmp, tmp_ulen2, tmp_lower, tmp_count
+            tmp_trg = haystack_ids[tmp_lower]
+            if lastpos.get(tmp_trg, -1) == tmp_lower:
+                tmp_ulen2 -= 1
+                if tmp_trg in needle_ids:
+                    tmp_count -= 1
+
+        smlr_max = max(smlr_max, smlr_cur)
+        for tmp_lower in range(prev_lower, lower):
+            tmp_trg = haystack_ids[tmp_lower]
+            if lastpos.get(tmp_trg, -1) == tmp_lower:
+                lastpos[tmp_trg] = -1
+
+    return smlr_max
+
+
+def word_similarity(needle: str, haystack: str) -> float:
+    """Same result as pg_trgm's word_similarity(needle, haystack)."""
+    return word_similarity_ids(set(trigrams(needle)), trigrams(haystack))
+
+
+class SectorMatcher:
+    """Trigram index over a fixed vocabulary of sector / subsector names."""
+
+    def __init__(self, vocabulary: list[str]):
+        self.vocabulary = sorted({name for name in vocabulary if name})
+        self._trigrams = {name: set(trigrams(name)) for name in self.vocabulary}
+        # Inverted index: only names sharing at least one trigram with the query are scored
+        self._postings = {}
+        for name, name_trigrams in self._trigrams.items():
+            for trg in name_trigrams:
+                self._postings.setdefault(trg, []).append(name)
+
+    def similarities(self, query: str) -> dict[str, float]:
+        """word_similarity(lower(name), query) for every name that shares a trigram with the query."""
+        query_trigrams = trigrams(query)
+        candidates = {name for trg in set(query_trigrams) for name in self._postings.get(trg, ())}
+        return {name: word_similarity_ids(self._trigrams[name], query_trigrams) for name in candidates}
+
+    def resolve(self, query: str, threshold: float = SIM_THRESHOLD) -> list[tuple[str, float]]:
+        """Canonical names matching `query` at or above `threshold`, best first."""
+        matches = [(name, sim) for name, sim in self.similarities(query).items() if sim >= threshold]
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
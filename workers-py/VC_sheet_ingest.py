@@ -0,0 +1,455 @@
+# Sheet ingestion: CSV -> typed staging table (COPY) -> atomic swap.
+#
+# LOAD_SHEETS used to read each sheet whole with pandas, to_sql(if_exists=
+# "replace") it (dropping the live table, then row-batched INSERTs) and fix
+# the types afterwards with ALTER TABLE, so readers saw a missing or
+# half-loaded table for the whole load. Now each source is streamed in
+# chunks: types are coerced per chunk with vectorized pandas, rows go into
+# <table>__staging with COPY, the indexes and the typed VC metric columns
+# (VC_chain_database.write_vc_metric_columns) are built there, and one short
+# transaction renames staging over the live table. Readers keep the old
+# table until that rename, and never see one without its metric columns.
+#
+# Sources are the published Google Sheets CSV exports or local CSV files
+# (ingest_sheets.py --csv / --csv-dir).
+#
+# Differential sync (sync_table, ingest_sheets.py --sync): every load also
+# records a hash of each source row by its natural key (sheet_row_hashes).
+# A sync hashes the new source the same way and applies only the inserted,
+# changed and deleted rows, so indexes, derived columns and caches of
+# untouched tables survive; the changed keys go into the dataset version
+# (VC_chain_database.bump_dataset_version). Anything the diff cannot handle
+# (first load, changed columns, missing or duplicate keys) falls back to a
+# full load of that table.
+import io
+import os
+import json
+import re
+import time
+import logging
+from typing import Iterator, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import VC_chain_database as vc_database
+
+log = logging.getLogger(__name__)
+
+SHEET_CHUNK_ROWS = int(os.getenv("SHEET_CHUNK_ROWS", 50_000))
+# The swap waits at most this long for readers' locks before retrying
+SHEET_SWAP_LOCK_TIMEOUT_MS = int(os.getenv("SHEET_SWAP_LOCK_TIMEOUT_MS", 5000))
+SHEET_SWAP_ATTEMPTS = 5
+
+# Cell values stored as NULL
+NULL_VALUES = ["NO DATA", ""]
+
+
+class SheetSpec(NamedTuple):
+    sheet_env: str                  # env var holding the spreadsheet id
+    gid: int
+    # Declared column types: "date" (parsed with date_format) or "numeric" ($ and , stripped).
+    # Other columns are bigint / double precision when the first chunk is all numbers, else text.
+    column_types: dict = {}
+    date_format: str = "%b %d, %Y"  # "Mon DD, YYYY"
+    indexes: tuple = ()             # column tuples, built on staging before the swap
+    key: tuple = ()                 # natural key (text columns) for differential sync
+
+
+SHEET_SPECS = {
+    "vc_overall_raw":      SheetSpec("VC_FIRMS_SHEET_ID", 0, indexes=(("Top Tier",),), key=("Top Tier",)),
+    "vc_sector_based_raw": SheetSpec("VC_FIRMS_SHEET_ID", 1673702863, indexes=(("Top Tier",), ("Sector",)), key=("Top Tier", "Sector")),
+    "vc_market_cagr":      SheetSpec("VC_FIRMS_SHEET_ID", 1104412318, indexes=(("Sector",),), key=("Sector",)),
+    "funding_rounds":      SheetSpec("FUNDING_ROUNDS_SHEET_ID", 0, column_types={"Announced Date": "date", "Funds Raised": "numeric"},
+                                     key=("Series Company",)),
+    "startup_profile":     SheetSpec("STARTUP_DATA_SHEET_ID", 0, column_types={"Last Funding Date": "date"}, key=("Startup",)),
+}
+
+SYNC_STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS sheet_sync_state (
+        table_name TEXT PRIMARY KEY,
+        columns    JSONB       NOT NULL,    -- source header the hashes were computed over
+        synced_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS sheet_row_hashes (
+        table_name TEXT   NOT NULL,
+        row_key    TEXT   NOT NULL,         -- natural key values joined by KEY_SEPARATOR
+        row_hash   BIGINT NOT NULL,
+        PRIMARY KEY (table_name, row_key)
+    );
+"""
+
+KEY_SEPARATOR = "\x1f"
+
+
+class IngestReport(NamedTuple):
+    table: str
+    rows: int
+    chunks: int
+    column_types: dict
+    nulled: dict                    # column -> values that did not parse as the column type
+    seconds: float
+    hashed: bool = False            # row hashes recorded, the next sync can diff
+
+
+class SyncReport(NamedTuple):
+    table: str
+    mode: str                       # "diff", "unchanged" or "full"
+    rows: int
+    inserted: Optional[list]        # key tuples; None after a full load
+    updated: Optional[list]
+    deleted: Optional[list]
+    seconds: float
+    reason: str = ""                # why a full load was needed
+
+
+def public_csv_url(sheet_id: str, gid: int):
+    return (f"https://docs.google.com/spreadsheets/d/{sheet_id}/"
+            f"export?format=csv&gid={gid}")
+
+def sheet_source(table: str) -> str:
+    spec = SHEET_SPECS[table]
+    sheet_id = os.getenv(spec.sheet_env)
+    if not sheet_id:
+        raise ValueError(f"{spec.sheet_env} is not set; pass a local CSV for {table}")
+    return public_csv_url(sheet_id, spec.gid)
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def index_name(table: str, columns: tuple) -> str:
+    """Same names as VC_chain_database's CREATE INDEX IF NOT EXISTS, so later refreshes find them."""
+    return f"{table}_{re.sub(r'[^a-z0-9]+', '_', '_'.join(columns).lower()).strip('_')}_idx"
+
+
+# ── Type coercion (vectorized, per chunk) ──
+
+def _parse_numeric(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values.str.replace(r"[$,\s]", "", regex=True), errors="coerce")
+
+def infer_column_types(chunk: pd.DataFrame, spec: SheetSpec) -> dict:
+    types = {}
+    for column in chunk.columns:
+        declared = spec.column_types.get(column)
+        if declared:
+            types[column] = declared
+            continue
+        values = chunk[column].dropna()
+        numbers = pd.to_numeric(values, errors="coerce")
+        if values.empty or numbers.isna().any():
+            types[column] = "text"
+        elif (numbers == numbers.round()).all() and numbers.abs().max() < 2 ** 63:
+            types[column] = "bigint"
+        else:
+            types[column] = "double precision"
+    return types
+
+def coerce_chunk(chunk: pd.DataFrame, column_types: dict, spec: SheetSpec, nulled: dict) -> pd.DataFrame:
+    """Chunk with every column converted to its type; unparseable values become NULL and are counted in `nulled`."""
+    out = {}
+    for column, kind in column_types.items():
+        values = chunk[column]
+        if kind == "text":
+            out[column] = values
+            continue
+        if kind == "date":
+            parsed = pd.to_datetime(values, format=spec.date_format, errors="coerce")
+            converted = parsed.dt.strftime("%Y-%m-%d").where(parsed.notna())
+        elif kind == "numeric":
+            converted = _parse_numeric(values)
+        else:
+            converted = pd.to_numeric(values, errors="coerce")
+            if kind == "bigint":
+                converted = converted.round().astype("Int64")
+        failed = int((values.notna() & converted.isna()).sum())
+        if failed:
+            nulled[column] = nulled.get(column, 0) + failed
+        out[column] = converted
+    return pd.DataFrame(out, columns=list(column_types))
+
+
+def read_chunks(source, chunk_rows: int = SHEET_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """CSV in chunks of raw strings; NULL_VALUES and blank cells are None."""
+    reader = pd.read_csv(source, dtype=str, keep_default_na=False, na_values=NULL_VALUES, chunksize=chunk_rows)
+    for chunk in reader:
+        yield chunk.astype(object).where(chunk.notna(), None)
+
+
+# ── Row hashes ──
+
+def row_keys(chunk: pd.DataFrame, key: tuple) -> pd.Series:
+    """Natural key text per row; None where a key column is empty."""
+    parts = chunk[list(key)]
+    filled = parts.fillna("").astype(str)
+    keys = filled.iloc[:, 0]
+    for column in key[1:]:
+        keys = keys + KEY_SEPARATOR + filled[column]
+    return keys.astype(object).where(parts.notna().all(axis=1), None)
+
+def row_hashes(chunk: pd.DataFrame) -> np.ndarray:
+    """64-bit hash of each row's raw source values (before type coercion), as signed BIGINTs."""
+    return pd.util.hash_pandas_object(chunk, index=False).to_numpy().view(np.int64)
+
+def key_problem(keys: pd.Series, seen: set) -> str:
+    if keys.isna().any():
+        return f"{int(keys.isna().sum())} row(s) without a natural key"
+    duplicated = keys[keys.duplicated() | keys.isin(seen)]
+    if not duplicated.empty:
+        return f"duplicate natural key {duplicated.iloc[0]!r}"
+    return ""
+
+
+# ── Staging + swap ──
+
+def _copy_chunk(dbapi_conn, table: str, chunk: pd.DataFrame):
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, header=False, index=False)
+    columns = ", ".join(quote(column) for column in chunk.columns)
+    with dbapi_conn.cursor() as cursor:
+        with cursor.copy(f"COPY {quote(table)} ({columns}) FROM STDIN (FORMAT csv)") as copy:
+            copy.write(buffer.getvalue())
+
+def _replace_row_hashes(conn, table: str, staging_hashes: str, columns: Optional[list]):
+    """Row hashes of the table just swapped in (`columns` is the source header), or none when it could not be keyed."""
+    conn.execute(text(SYNC_STATE_DDL))
+    conn.execute(text("DELETE FROM sheet_row_hashes WHERE table_name = :table"), {"table": table})
+    if columns is None:
+        conn.execute(text("DELETE FROM sheet_sync_state WHERE table_name = :table"), {"table": table})
+    else:
+        conn.execute(text(f"INSERT INTO sheet_row_hashes (table_name, row_key, row_hash) SELECT :table, row_key, row_hash FROM {quote(staging_hashes)}"),
+                     {"table": table})
+        conn.execute(text("""
+            INSERT INTO sheet_sync_state (table_name, columns) VALUES (:table, CAST(:columns AS JSONB))
+            ON CONFLICT (table_name) DO UPDATE SET columns = EXCLUDED.columns, synced_at = now()
+        """), {"table": table, "columns": json.dumps(columns)})
+    conn.execute(text(f"DROP TABLE IF EXISTS {quote(staging_hashes)}"))
+
+def swap_in(table: str, staging: str, indexes: tuple, hashed_columns: Optional[list] = None):
+    """
+    Rename staging over the live table in one short transaction, retrying when
+    readers hold it too long. The table's row hashes are replaced in the same transaction.
+    """
+    old = f"{table}__old"
+    for attempt in range(1, SHEET_SWAP_ATTEMPTS + 1):
+        try:
+            with vc_database.background_engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = {SHEET_SWAP_LOCK_TIMEOUT_MS}"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {quote(old)}"))
+                conn.execute(text(f"ALTER TABLE IF EXISTS {quote(table)} RENAME TO {quote(old)}"))
+                conn.execute(text(f"ALTER TABLE {quote(staging)} RENAME TO {quote(table)}"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {quote(old)}"))
+                for columns in indexes:
+                    conn.execute(text(f"ALTER INDEX {quote(index_name(staging, columns))} RENAME TO {quote(index_name(table, columns))}"))
+                _replace_row_hashes(conn, table, f"{staging}_hashes", hashed_columns)
+            return
+        except OperationalError as e:
+            if getattr(e.orig, "sqlstate", None) != "55P03" or attempt == SHEET_SWAP_ATTEMPTS:
+                raise
+            log.warning("Sheet ingest: %s is busy, swap attempt %d/%d timed out", table, attempt, SHEET_SWAP_ATTEMPTS)
+            time.sleep(attempt)
+
+def ingest_table(table: str, source=None, chunk_rows: int = SHEET_CHUNK_ROWS) -> IngestReport:
+    """Load one sheet (or a local CSV path / file object) into `table` through a staging table."""
+    started = time.time()
+    spec = SHEET_SPECS.get(table, SheetSpec(sheet_env="", gid=0))
+    source = source if source is not None else sheet_source(table)
+    staging = f"{table}__staging"
+    staging_hashes = f"{staging}_hashes"
+    rows = chunks = 0
+    column_types = None
+    nulled = {}
+    # Row hashes for the next differential sync, unless some row has no usable key
+    seen_keys = set()
+    unkeyed = "" if spec.key else "no natural key configured"
+
+    with vc_database.background_engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {quote(staging)}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {quote(staging_hashes)}"))
+        conn.execute(text(f"CREATE TABLE {quote(staging_hashes)} (row_key TEXT, row_hash BIGINT)"))
+        dbapi_conn = conn.connection.driver_connection
+        for chunk in read_chunks(source, chunk_rows):
+            if column_types is None:
+                # Types come from the first chunk; later values that do not fit become NULL (reported)
+                column_types = infer_column_types(chunk, spec)
+                columns = ", ".join(f"{quote(column)} {kind}" for column, kind in column_types.items())
+                conn.execute(text(f"CREATE TABLE {quote(staging)} ({columns})"))
+            if not unkeyed:
+                keys = row_keys(chunk, spec.key) if set(spec.key) <= set(chunk.columns) else None
+                unkeyed = "key columns missing from the source" if keys is None else key_problem(keys, seen_keys)
+                if not unkeyed:
+                    seen_keys.update(keys)
+                    _copy_chunk(dbapi_conn, staging_hashes, pd.DataFrame({"row_key": keys, "row_hash": row_hashes(chunk)}))
+            _copy_chunk(dbapi_conn, staging, coerce_chunk(chunk, column_types, spec, nulled))
+            rows += len(chunk)
+            chunks += 1
+        if column_types is None:
+            raise ValueError(f"{table}: source has no header row")
+        for columns in spec.indexes:
+            conn.execute(text(f"CREATE INDEX {quote(index_name(staging, columns))} ON {quote(staging)} "
+                              f"({', '.join(quote(column) for column in columns)})"))
+        # Typed VC metric columns too: the swapped-in table must be complete without a refresh
+        indexes = spec.indexes + tuple((column,) for column in vc_database.write_vc_metric_columns(conn, table, staging)
+                                       if (column,) not in spec.indexes)
+        conn.execute(text(f"ANALYZE {quote(staging)}"))
+
+    if unkeyed:
+        log.warning("Sheet ingest: %s: %s, the next sync will be a full load", table, unkeyed)
+    swap_in(table, staging, indexes, None if unkeyed else list(column_types))
+    report = IngestReport(table, rows, chunks, column_types, nulled, time.time() - started, hashed=not unkeyed)
+    log.info("Sheet ingest: %s loaded %d rows in %d chunk(s) in %.2fs%s", table, rows, chunks, report.seconds,
+             f" ({sum(nulled.values())} unparseable values set to NULL: {nulled})" if nulled else "")
+    return report
+
+def ingest_sheets(sources: Optional[dict] = None, chunk_rows: int = SHEET_CHUNK_ROWS) -> list[IngestReport]:
+    """Load every table in `sources` ({table: path or None for its sheet}), default all SHEET_SPECS from Google Sheets."""
+    sources = sources if sources is not None else dict.fromkeys(SHEET_SPECS)
+    return [ingest_table(table, source, chunk_rows) for table, source in sources.items()]
+
+
+# ── Differential sync ──
+
+LIVE_COLUMNS_SQL = """
+    SELECT column_name, data_type FROM information_schema.columns
+    WHERE  table_schema = 'public' AND table_name = :table
+"""
+
+def _coercion_kind(data_type: str) -> str:
+    """coerce_chunk kind for a live column type."""
+    if data_type in ("date", "numeric", "bigint", "double precision", "text"):
+        return data_type
+    if data_type in ("integer", "smallint"):
+        return "bigint"
+    if data_type == "real":
+        return "double precision"
+    return "text"
+
+def _load_sync_state(table: str) -> tuple[Optional[list], dict, dict]:
+    """(hashed source columns or None, live column types, {row_key: row_hash})"""
+    with vc_database.background_engine.begin() as conn:
+        conn.execute(text(SYNC_STATE_DDL))
+        columns = conn.execute(text("SELECT columns FROM sheet_sync_state WHERE table_name = :table"), {"table": table}).scalar()
+        live_types = dict(conn.execute(text(LIVE_COLUMNS_SQL), {"table": table}).fetchall())
+        hashes = dict(conn.execute(text("SELECT row_key, row_hash FROM sheet_row_hashes WHERE table_name = :table"), {"table": table}).fetchall())
+    return columns, live_types, hashes
+
+def _split_keys(keys) -> pd.DataFrame:
+    return pd.DataFrame([key.split(KEY_SEPARATOR) for key in keys])
+
+def apply_diff(table: str, key: tuple, columns: list, changed_rows: pd.DataFrame, changed_hashes: pd.DataFrame, removed_keys: list):
+    """
+    One transaction: delete the rows of changed and deleted keys, insert the
+    changed rows, and update their row hashes. Readers see the old or the new rows, never a mix.
+    """
+    with vc_database.background_engine.begin() as conn:
+        dbapi_conn = conn.connection.driver_connection
+        key_columns = ", ".join(f"{quote(column)} TEXT" for column in key)
+        conn.execute(text(f"CREATE TEMP TABLE sync_keys ({key_columns}, row_key TEXT) ON COMMIT DROP"))
+        stale = list(changed_hashes["row_key"]) + removed_keys
+        if stale:
+            stale_frame = _split_keys(stale)
+            stale_frame.columns = list(key)
+            stale_frame["row_key"] = stale
+            _copy_chunk(dbapi_conn, "sync_keys", stale_frame)
+        match = " AND ".join(f"t.{quote(column)} = k.{quote(column)}" for column in key)
+        conn.execute(text(f"DELETE FROM {quote(table)} t USING sync_keys k WHERE {match}"))
+        conn.execute(text("DELETE FROM sheet_row_hashes h USING sync_keys k WHERE h.table_name = :table AND h.row_key = k.row_key"),
+                     {"table": table})
+
+        if not changed_rows.empty:
+            column_list = ", ".join(quote(column) for column in columns)
+            conn.execute(text(f"CREATE TEMP TABLE sync_rows ON COMMIT DROP AS SELECT {column_list} FROM {quote(table)} WITH NO DATA"))
+            _copy_chunk(dbapi_conn, "sync_rows", changed_rows)
+            # Typed VC metric columns of the new rows, computed before they become visible
+            vc_database.write_vc_metric_columns(conn, table, "sync_rows", indexes=False)
+            column_list = ", ".join(quote(column) for column in columns + vc_database.vc_metric_columns(table))
+            conn.execute(text(f"INSERT INTO {quote(table)} ({column_list}) SELECT {column_list} FROM sync_rows"))
+            conn.execute(text("CREATE TEMP TABLE sync_hashes (row_key TEXT, row_hash BIGINT) ON COMMIT DROP"))
+            _copy_chunk(dbapi_conn, "sync_hashes", changed_hashes)
+            conn.execute(text("INSERT INTO sheet_row_hashes (table_name, row_key, row_hash) SELECT :table, row_key, row_hash FROM sync_hashes"),
+                         {"table": table})
+        conn.execute(text("UPDATE sheet_sync_state SET synced_at = now() WHERE table_name = :table"), {"table": table})
+
+def sync_table(table: str, source=None, chunk_rows: int = SHEET_CHUNK_ROWS) -> SyncReport:
+    """
+    Bring `table` in line with its sheet (or a local CSV path) by applying only
+    the rows whose hash changed. Falls back to ingest_table when it cannot diff.
+    `source` must be re-readable (path or URL) for that fallback.
+    """
+    started = time.time()
+    spec = SHEET_SPECS.get(table, SheetSpec(sheet_env="", gid=0))
+    source = source if source is not None else sheet_source(table)
+
+    def full_load(reason: str) -> SyncReport:
+        log.info("Sheet sync: %s needs a full load (%s)", table, reason)
+        report = ingest_table(table, source, chunk_rows)
+        return SyncReport(table, "full", report.rows, None, None, None, time.time() - started, reason)
+
+    hashed_columns, live_types, previous = _load_sync_state(table)
+    if not spec.key:
+        return full_load("no natural key configured")
+    if hashed_columns is None or not live_types:
+        return full_load("no previous load with row hashes")
+    if any(live_types.get(column) != "text" for column in spec.key):
+        return full_load("natural key columns are not text")
+
+    column_types = {column: _coercion_kind(live_types[column]) for column in hashed_columns if column in live_types}
+    if len(column_types) != len(hashed_columns):
+        return full_load("columns missing from the live table")
+    if any(column not in live_types for column in vc_database.vc_metric_columns(table)):
+        return full_load("typed metric columns missing from the live table")
+    seen = set()
+    inserted, updated = [], []
+    changed_rows, changed_hashes = [], []
+    nulled = {}
+    rows = 0
+    for chunk in read_chunks(source, chunk_rows):
+        if list(chunk.columns) != hashed_columns:
+            return full_load("source columns changed")
+        keys = row_keys(chunk, spec.key)
+        problem = key_problem(keys, seen)
+        if problem:
+            return full_load(problem)
+        seen.update(keys)
+        hashes = row_hashes(chunk)
+        old = [previous.get(key) for key in keys]
+        changed = np.array([before != after for before, after in zip(old, hashes)], dtype=bool)
+        if changed.any():
+            for key, before in zip(keys[changed], np.array(old, dtype=object)[changed]):
+                (inserted if before is None else updated).append(key)
+            changed_rows.append(coerce_chunk(chunk[changed], column_types, spec, nulled))
+            changed_hashes.append(pd.DataFrame({"row_key": keys[changed].to_numpy(), "row_hash": hashes[changed]}))
+        rows += len(chunk)
+    if rows == 0:
+        return full_load("empty source")
+    deleted = [key for key in previous if key not in seen]
+
+    def key_tuples(keys):
+        return [tuple(key.split(KEY_SEPARATOR)) for key in keys]
+
+    if not (inserted or updated or deleted):
+        report = SyncReport(table, "unchanged", rows, [], [], [], time.time() - started)
+    else:
+        apply_diff(table, spec.key, hashed_columns,
+                   pd.concat(changed_rows) if changed_rows else pd.DataFrame(columns=hashed_columns),
+                   pd.concat(changed_hashes) if changed_hashes else pd.DataFrame(columns=["row_key", "row_hash"]),
+                   deleted)
+        report = SyncReport(table, "diff", rows, key_tuples(inserted), key_tuples(updated), key_tuples(deleted), time.time() - started)
+    log.info("Sheet sync: %s %s: %d inserted, %d updated, %d deleted of %d rows in %.2fs%s", table, report.mode,
+             len(inserted), len(updated), len(deleted), rows, report.seconds,
+             f" ({sum(nulled.values())} unparseable values set to NULL: {nulled})" if nulled else "")
+    return report
+
+def sync_sheets(sources: Optional[dict] = None, chunk_rows: int = SHEET_CHUNK_ROWS) -> list[SyncReport]:
+    sources = sources if sources is not None else dict.fromkeys(SHEET_SPECS)
+    return [sync_table(table, source, chunk_rows) for table, source in sources.items()]
+
+def dataset_changes(reports: list[SyncReport]) -> dict:
+    """bump_dataset_version `changes` for a sync: changed keys per table, None for tables that were fully reloaded."""
+    changes = {}
+    for report in reports:
+        if report.mode == "full":
+            changes[report.table] = None
+        elif report.mode == "diff":
+            changes[report.table] = {"inserted": report.inserted, "updated": report.updated, "deleted": report.deleted}
+    return changes
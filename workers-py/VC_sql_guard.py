@@ -0,0 +1,184 @@
+# Guard for SQL written by the reasoning agent.
+#
+# execute_query used to run whatever the agent produced with a plain
+# fetchall(). Now a query is EXPLAINed first and rejected when the planner's
+# cost or row estimates are out of bounds; a query that is only expensive
+# because of the size of its result gets a LIMIT and is re-planned. Accepted
+# queries run in a read-only transaction under a per-statement timeout and
+# stream through a server-side cursor capped at SQL_MAX_RESULT_ROWS. Every
+# rejection is a short message telling the agent what to change.
+import os
+import re
+import json
+import time
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+log = logging.getLogger(__name__)
+
+SQL_MAX_PLAN_COST = float(os.getenv("SQL_MAX_PLAN_COST", 1_000_000))
+SQL_MAX_PLAN_ROWS = float(os.getenv("SQL_MAX_PLAN_ROWS", 5_000_000))   # any node not under a Limit
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", 10_000))
+SQL_MAX_RESULT_ROWS = int(os.getenv("SQL_MAX_RESULT_ROWS", 200))
+SQL_FETCH_BATCH = 50
+
+QUERY_CANCELED = "57014"
+
+
+class QueryRejected(Exception):
+    """The query was not run (or was cancelled); the message is meant for the agent."""
+
+
+class GuardedResult:
+    def __init__(self, rows: list, truncated: bool, plan_cost: float, rewritten: bool, elapsed: float):
+        self.rows = rows
+        self.truncated = truncated
+        self.plan_cost = plan_cost
+        self.rewritten = rewritten
+        self.elapsed = elapsed
+
+
+# ── Plan inspection ──
+
+def strip_statement(sql: str) -> str:
+    """One statement without trailing semicolons; several statements are rejected."""
+    statement = sql.strip().rstrip(";").strip()
+    # Semicolons inside string literals are fine; any other one starts a second statement
+    if ";" in re.sub(r"'(?:[^']|'')*'", "''", statement):
+        raise QueryRejected("Only one SQL statement per call. Send each query separately.")
+    if not statement:
+        raise QueryRejected("Empty query.")
+    return statement
+
+
+def with_row_limit(sql: str, limit: int) -> str:
+    return f"SELECT * FROM (\n{sql}\n) AS agent_query LIMIT {limit}"
+
+
+def explain(conn, sql: str) -> dict:
+    """Top node of EXPLAIN (FORMAT JSON); planning only, nothing is executed."""
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def _nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _nodes(child)
+
+
+def max_node_rows(plan: dict) -> float:
+    return max(node.get("Plan Rows", 0) for node in _nodes(plan))
+
+
+def plan_rows(plan: dict) -> float:
+    """
+    Largest row estimate of a node that runs to completion. Nodes under a Limit
+    keep their full estimates but stop once the Limit has its rows, so only the
+    Limit's own estimate counts; a sort below it still shows in its cost.
+    """
+    if plan.get("Node Type") == "Limit":
+        return plan.get("Plan Rows", 0)
+    return max([plan.get("Plan Rows", 0)] + [plan_rows(child) for child in plan.get("Plans", [])])
+
+
+def costliest_node(plan: dict) -> dict:
+    """Node with the highest cost of its own (total minus its children's)."""
+    def own_cost(node):
+        return node.get("Total Cost", 0) - sum(child.get("Total Cost", 0) for child in node.get("Plans", []))
+    return max(_nodes(plan), key=own_cost)
+
+
+def describe_node(node: dict) -> str:
+    label = node.get("Node Type", "?")
+    if node.get("Relation Name"):
+        label += f" on {node['Relation Name']}"
+    return f"{label} (~{node.get('Plan Rows', 0):,.0f} rows)"
+
+
+def looks_like_cross_join(plan: dict) -> bool:
+    node = costliest_node(plan)
+    return node.get("Node Type") == "Nested Loop" and not node.get("Join Filter") and max_node_rows(node) > SQL_MAX_PLAN_ROWS
+
+
+def rejection_hint(plan: dict) -> str:
+    node = costliest_node(plan)
+    if looks_like_cross_join(plan):
+        return "This looks like a missing join condition (cross join): join the tables on a key."
+    if node.get("Node Type") in ("Seq Scan", "Sort", "Hash Join", "Merge Join"):
+        return "Filter earlier with WHERE, aggregate, or select fewer columns / tables."
+    return "Add WHERE filters, aggregate with GROUP BY, or add a LIMIT."
+
+
+def check_plan(plan: dict):
+    """Raise QueryRejected when the plan is over the cost or row budget, or is a cross join."""
+    cost, rows = plan.get("Total Cost", 0), plan_rows(plan)
+    # A LIMIT makes a cross join cheap, but its rows are still garbage
+    if cost <= SQL_MAX_PLAN_COST and rows <= SQL_MAX_PLAN_ROWS and not looks_like_cross_join(plan):
+        return
+    raise QueryRejected(
+        f"Query rejected before running: estimated cost {cost:,.0f} (max {SQL_MAX_PLAN_COST:,.0f}), "
+        f"largest step {describe_node(costliest_node(plan))}. {rejection_hint(plan)}"
+    )
+
+
+def compact_db_error(e: DBAPIError) -> str:
+    """Primary line of a database error, without SQLAlchemy's statement echo and links."""
+    orig = getattr(e, "orig", None)
+    if getattr(orig, "sqlstate", None) == QUERY_CANCELED:
+        return (f"Query cancelled after the {SQL_STATEMENT_TIMEOUT_MS / 1000:.0f}s statement timeout. "
+                f"Add WHERE filters, aggregate, or query fewer tables.")
+    diag = getattr(orig, "diag", None)
+    message = getattr(diag, "message_primary", None) or str(orig or e).splitlines()[0]
+    hint = getattr(diag, "message_hint", None)
+    return f"SQL error: {message}" + (f" Hint: {hint}" if hint else "")
+
+
+# ── Execution ──
+
+def run_guarded(engine, sql: str, max_rows: int = SQL_MAX_RESULT_ROWS) -> GuardedResult:
+    """
+    EXPLAIN, check (rewriting with a LIMIT when only the result size is the
+    problem) and run `sql`, returning at most `max_rows` rows.
+    Raises QueryRejected with an agent-readable message.
+    """
+    statement = strip_statement(sql)
+    started = time.perf_counter()
+    rewritten = False
+    try:
+        with engine.connect() as conn, conn.begin():
+            conn.execute(text("SET TRANSACTION READ ONLY"))
+            conn.execute(text(f"SET LOCAL statement_timeout = {SQL_STATEMENT_TIMEOUT_MS}"))
+
+            plan = explain(conn, statement)
+            try:
+                check_plan(plan)
+            except QueryRejected:
+                # Only max_rows + 1 rows are read anyway: let the planner stop there.
+                # A cross join stays rejected; capping it would just return garbage rows.
+                if looks_like_cross_join(plan):
+                    raise
+                limited = with_row_limit(statement, max_rows + 1)
+                plan = explain(conn, limited)
+                check_plan(plan)
+                statement, rewritten = limited, True
+
+            result = conn.execution_options(stream_results=True, max_row_buffer=SQL_FETCH_BATCH).execute(text(statement))
+            rows = []
+            while len(rows) <= max_rows:
+                batch = result.fetchmany(SQL_FETCH_BATCH)
+                if not batch:
+                    break
+                rows.extend(batch)
+            result.close()
+    except DBAPIError as e:
+        raise QueryRejected(compact_db_error(e)) from None
+
+    truncated = len(rows) > max_rows
+    elapsed = time.perf_counter() - started
+    log.info("Guarded SQL: cost %.0f, %d rows%s%s in %.2fs", plan.get("Total Cost", 0), min(len(rows), max_rows),
+             " (truncated)" if truncated else "", " (LIMIT added)" if rewritten else "", elapsed)
+    return GuardedResult(rows[:max_rows], truncated, plan.get("Total Cost", 0), rewritten, elapsed)
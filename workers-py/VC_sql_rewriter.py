@@ -0,0 +1,254 @@
+# Parser-based rewriting of SQL written by the reasoning agent.
+#
+# execute_query used to regex-replace `field ILIKE '%term%'` with
+# `word_similarity(lower(field), lower('term')) > 0.5 OR ...`, which forced a
+# sequential scan, missed quoted columns like "Sector" and any other
+# formatting. Queries are now parsed with sqlglot and rewritten on the tree:
+#   - only a single read-only query is accepted (no DML, DDL or SELECT INTO);
+#   - the outer query gets a LIMIT (or has its LIMIT lowered) to the row cap;
+#   - a fuzzy match on a column with a known vocabulary (sectors, subsectors)
+#     becomes `col IN (<canonical values>)`, resolved in memory by the sector
+#     matcher; any other `col ILIKE '%term%'` keeps the ILIKE and gains the
+#     pg_trgm similarity operator `col % 'term'`, both of which a trigram GIN
+#     index can serve. An exact `col = 'x'` is only corrected for case; when
+#     no stored value matches, it runs as written and the closest names are
+#     returned to the agent as suggestions.
+# Rewrites that change which rows match are reported to the agent (notes).
+# Rewrites are cached by the query's tokens and dataset version; the query
+# itself is parsed and run as written.
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError, TokenError
+from sqlglot.tokens import TokenType
+import VC_chain_database as vc_database
+from VC_sql_guard import QueryRejected, SQL_MAX_RESULT_ROWS
+from VC_vocabulary import get_vocabulary, ilike_contains
+
+log = logging.getLogger(__name__)
+
+SQL_REWRITE_CACHE_SIZE = int(os.getenv("SQL_REWRITE_CACHE_SIZE", 1000))
+
+# Columns whose values come from a vocabulary: (table, lower-cased column) -> Vocabulary.matcher kind
+CANONICAL_COLUMNS = {
+    ("vc_sector_based_raw", "sector"): "sector",
+    ("vc_market_cagr", "sector"): "sector",
+    ("funding_round_categories", "category"): "subsector",
+}
+
+# At most this many canonical values replace one fuzzy predicate; more falls back to ILIKE / %
+MAX_CANONICAL_VALUES = 50
+# Names quoted back to the agent per predicate (suggestions, values matched)
+MAX_NOTE_VALUES = 5
+
+WRITE_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter, exp.Command, exp.Into, exp.Lock)
+
+
+class RewriteResult(NamedTuple):
+    sql: str
+    changes: tuple          # human-readable notes, logged with the query
+    notes: tuple = ()       # rewrites and suggestions the agent is shown with the result
+
+
+def _quoted(values: list) -> str:
+    shown = ", ".join(f"'{value}'" for value in values[:MAX_NOTE_VALUES])
+    return shown + (f" and {len(values) - MAX_NOTE_VALUES} more" if len(values) > MAX_NOTE_VALUES else "")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Cache key: the query's tokens, so layout, comments and trailing semicolons
+    don't matter while string literals and quoted names stay exact. Only ever a
+    key, never run (a `-- comment` would swallow the rest of a joined line).
+    """
+    try:
+        tokens = sqlglot.tokenize(sql, read="postgres")
+    except TokenError:
+        return sql.strip()
+    while tokens and tokens[-1].token_type == TokenType.SEMICOLON:
+        tokens.pop()
+    return "\x1f".join(f"{token.token_type.name}:{token.text}" for token in tokens)
+
+
+# ── Read-only check ──
+
+def parse_single_query(sql: str) -> exp.Expression:
+    statements = [statement for statement in sqlglot.parse(sql, read="postgres") if statement is not None]
+    if len(statements) != 1:
+        raise QueryRejected("Only one SQL statement per call. Send each query separately.")
+    tree = statements[0]
+    if not isinstance(tree, exp.Query):
+        raise QueryRejected(f"Only read-only SELECT queries are allowed (got {tree.key.upper()}).")
+    write = next(tree.find_all(*WRITE_NODES), None)
+    if write is not None:
+        raise QueryRejected(f"Only read-only SELECT queries are allowed ({write.key.upper()} found).")
+    return tree
+
+
+# ── LIMIT injection ──
+
+def cap_limit(tree: exp.Query, max_rows: int, changes: list) -> exp.Query:
+    """Outer LIMIT of max_rows + 1 (one extra row tells the guard the result was truncated)."""
+    limit = tree.args.get("limit")
+    if limit is None:
+        changes.append(f"added LIMIT {max_rows + 1}")
+        return tree.limit(max_rows + 1)
+    value = limit.expression
+    if isinstance(value, exp.Literal) and not value.is_string and int(value.name) > max_rows + 1:
+        changes.append(f"lowered LIMIT {value.name} to {max_rows + 1}")
+        return tree.limit(max_rows + 1)
+    return tree
+
+
+# ── Fuzzy predicates ──
+
+def _table_aliases(tree: exp.Expression) -> dict:
+    """alias (or name) -> table name, lower-cased, for every table in the query."""
+    return {table.alias_or_name.lower(): table.name.lower() for table in tree.find_all(exp.Table)}
+
+
+def canonical_kind(column: exp.Column, aliases: dict) -> Optional[str]:
+    name = column.name.lower()
+    if column.table:
+        return CANONICAL_COLUMNS.get((aliases.get(column.table.lower(), column.table.lower()), name))
+    # Unqualified: only when exactly one table in the query owns a vocabulary column of that name
+    kinds = {CANONICAL_COLUMNS[(table, name)] for table in set(aliases.values()) if (table, name) in CANONICAL_COLUMNS}
+    return kinds.pop() if len(kinds) == 1 else None
+
+
+def _contains_term(pattern: exp.Expression) -> Optional[str]:
+    """'term' for a '%term%' string literal without inner wildcards, else None."""
+    if not isinstance(pattern, exp.Literal) or not pattern.is_string:
+        return None
+    match = re.fullmatch(r"%([^%_]+)%", pattern.name)
+    return match.group(1).strip() if match else None
+
+
+def _target_column(node: exp.Expression) -> Optional[exp.Column]:
+    """The column of `col` / `lower(col)` / `upper(col)`."""
+    while isinstance(node, (exp.Lower, exp.Upper, exp.Paren)):
+        node = node.this
+    return node if isinstance(node, exp.Column) else None
+
+
+def resolve_canonical(kind: str, term: str) -> list[str]:
+    """Vocabulary values containing `term` or trigram-similar to it (same threshold the tools use)."""
+    vocabulary = get_vocabulary()
+    names = vocabulary.sectors if kind == "sector" else vocabulary.subsectors
+    contains = ilike_contains(term)
+    values = {name for name in names if contains.search(name)}
+    values.update(name for name, _ in vocabulary.matcher(kind).resolve(term))
+    return sorted(values)
+
+
+def rewrite_fuzzy_predicate(node: exp.Expression, aliases: dict, changes: list, notes: list) -> exp.Expression:
+    if not isinstance(node, (exp.ILike, exp.Like, exp.EQ)):
+        return node
+    column = _target_column(node.this)
+    if column is None:
+        return node
+    if isinstance(node, exp.EQ):
+        # "Sector" = 'fintech' on a vocabulary column: case / spelling resolved to the stored names
+        kind = canonical_kind(column, aliases)
+        value = node.expression
+        if kind is None or not isinstance(value, exp.Literal) or not value.is_string:
+            return node
+        names = get_vocabulary().sectors if kind == "sector" else get_vocabulary().subsectors
+        if value.name in names:
+            return node
+        term = value.name
+        exact = [name for name in names if name.casefold() == term.casefold()]
+        if exact:
+            changes.append(f"{column.sql('postgres')} = '{term}' -> '{exact[0]}'")
+            notes.append(f"{column.sql('postgres')} = '{term}' was run as = '{exact[0]}' (stored spelling).")
+            return exp.EQ(this=column.copy(), expression=exp.Literal.string(exact[0]))
+        # An exact comparison stays exact: suggest the stored names instead of widening it
+        suggestions = resolve_canonical(kind, term)
+        if suggestions:
+            changes.append(f"{column.sql('postgres')} = '{term}' has no match, suggested {len(suggestions)}")
+            notes.append(f"No {kind} is stored as '{term}'; close names: {_quoted(suggestions)}. "
+                         f"Compare with one of them, or use ILIKE '%{term}%' for a fuzzy match.")
+        return node
+    else:
+        # LIKE only counts as fuzzy when the column is lower-cased
+        if isinstance(node, exp.Like) and not isinstance(node.this, exp.Lower):
+            return node
+        term = _contains_term(node.expression)
+        if term is None:
+            return node
+        kind = canonical_kind(column, aliases)
+
+    bare = column.copy()
+    if kind is not None:
+        values = resolve_canonical(kind, term)
+        if values and len(values) <= MAX_CANONICAL_VALUES:
+            changes.append(f"{column.sql('postgres')} ~ '{term}' -> {len(values)} canonical value(s)")
+            notes.append(f"{column.sql('postgres')} matching '{term}' was run as IN ({_quoted(values)}).")
+            return exp.In(this=bare, expressions=[exp.Literal.string(value) for value in values])
+    changes.append(f"{column.sql('postgres')} ~ '{term}' -> ILIKE OR pg_trgm %")
+    notes.append(f"{column.sql('postgres')} matching '{term}' also matches similar spellings (pg_trgm %).")
+    return exp.Paren(this=exp.Or(
+        this=exp.ILike(this=bare, expression=exp.Literal.string(f"%{term}%")),
+        expression=exp.Mod(this=bare.copy(), expression=exp.Literal.string(term)),
+    ))
+
+
+# ── Entry point ──
+
+def rewrite_query(sql: str, max_rows: int = SQL_MAX_RESULT_ROWS) -> RewriteResult:
+    """Read-only check, LIMIT cap and fuzzy-predicate rewrite. Raises QueryRejected."""
+    try:
+        tree = parse_single_query(sql)
+    except ParseError as e:
+        # Postgres may accept what sqlglot cannot parse; the guard still runs it read-only and capped
+        log.info("SQL rewriter: could not parse query, running it unchanged: %s", str(e).splitlines()[0])
+        return RewriteResult(sql, ("unparsed",))
+    changes, notes = [], []
+    aliases = _table_aliases(tree)
+    tree = tree.transform(lambda node: rewrite_fuzzy_predicate(node, aliases, changes, notes))
+    tree = cap_limit(tree, max_rows, changes)
+    return RewriteResult(tree.sql(dialect="postgres"), tuple(changes), tuple(notes))
+
+
+class RewriteCache:
+    """LRU of RewriteResult by (normalize_sql key, dataset version); rejections are cached too."""
+
+    def __init__(self, max_entries: int = SQL_REWRITE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def rewrite(self, sql: str) -> RewriteResult:
+        key = (normalize_sql(sql), vc_database.get_dataset_version())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            try:
+                entry = rewrite_query(sql)
+            except QueryRejected as e:
+                entry = e
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if isinstance(entry, QueryRejected):
+            raise entry
+        return entry
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+rewrite_cache = RewriteCache()
@@ -0,0 +1,60 @@
+# Startup profiling.
+#
+# Importing the app used to build every expensive resource as a side effect
+# (Vertex AI client, SQL toolkit with full schema reflection, five ReAct
+# agents, the compiled graph, a remote mermaid render, sheet reloads). Those
+# are now created on first use or in VC_chain_logic.warm_up(), and each step
+# is timed here so a slow cold start or worker recycle shows which phase
+# to blame. The report is logged and served on /health.
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self._lock = threading.Lock()
+        self.phases = []          # (name, seconds, ok) in completion order
+
+    def _record(self, name: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self.phases.append((name, seconds, ok))
+
+    def mark(self, name: str):
+        """Record the time since the previous mark (or process start) as phase `name`."""
+        now = time.perf_counter()
+        self._record(name, now - self._last_mark)
+        self._last_mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._record(name, time.perf_counter() - started, ok)
+            self._last_mark = time.perf_counter()
+
+    def report(self) -> str:
+        width = max((len(name) for name, _, _ in self.phases), default=5)
+        lines = [f"Startup profile (pid {self.pid}):"]
+        lines += [f"  {name:<{width}}  {seconds * 1000:9.1f} ms{'' if ok else '  FAILED'}" for name, seconds, ok in self.phases]
+        lines.append(f"  {'total':<{width}}  {sum(seconds for _, seconds, _ in self.phases) * 1000:9.1f} ms")
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"pid": self.pid, "phases_ms": {name: round(seconds * 1000, 1) for name, seconds, _ in self.phases},
+                    "failed": [name for name, _, ok in self.phases if not ok]}
+
+
+startup = StartupProfile()
@@ -0,0 +1,129 @@
+# Per-session conversation summaries.
+#
+# The context summarizer used to rebuild the whole trimmed transcript and
+# summarize it from scratch every turn. Now the last context_summary of each
+# session is kept together with a watermark (fingerprints of the last messages
+# it covers), and the next turn folds in only the messages after it. Summaries
+# live in memory for the hot path and in Postgres so every worker (and a
+# restarted one) can pick the conversation up.
+import os
+import json
+import hashlib
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from sqlalchemy import text
+import VC_chain_database as vc_database
+
+log = logging.getLogger(__name__)
+
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", 10000))
+
+# Messages fingerprinted at the end of the covered range; two (the last history
+# message and the input the summary was made for) pin the position even when
+# short inputs like "yes" repeat.
+WATERMARK_MESSAGES = 2
+
+CONVERSATION_SUMMARIES_DDL = """
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        session_id       TEXT PRIMARY KEY,
+        context_summary  TEXT        NOT NULL,
+        watermark        JSONB       NOT NULL,   -- fingerprints of the last messages covered
+        messages_covered INT         NOT NULL,
+        updated_at       TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+
+class SessionSummary(NamedTuple):
+    context_summary: str
+    watermark: list[str]
+    messages_covered: int
+
+
+def message_fingerprint(role: str, content: str) -> str:
+    return hashlib.blake2b(f"{role}\x00{content}".encode(), digest_size=8).hexdigest()
+
+
+def find_watermark(fingerprints: list[str], watermark: list[str]) -> Optional[int]:
+    """Index just past the latest occurrence of `watermark` in `fingerprints`, or None if it is gone."""
+    size = len(watermark)
+    for start in range(len(fingerprints) - size, -1, -1):
+        if fingerprints[start:start + size] == watermark:
+            return start + size
+    return None
+
+
+class SummaryStore:
+    def __init__(self, max_sessions: int = SUMMARY_CACHE_SIZE):
+        self.max_sessions = max_sessions
+        self._memory = OrderedDict()   # session_id -> SessionSummary, least recently used first
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._pending_writes = set()
+
+    def _remember(self, session_id: str, summary: SessionSummary):
+        with self._lock:
+            self._memory[session_id] = summary
+            self._memory.move_to_end(session_id)
+            while len(self._memory) > self.max_sessions:
+                self._memory.popitem(last=False)
+
+    async def _ensure_table(self, conn):
+        if not self._table_ready:
+            await conn.execute(text(CONVERSATION_SUMMARIES_DDL))
+            self._table_ready = True
+
+    async def get(self, session_id: str) -> Optional[SessionSummary]:
+        with self._lock:
+            summary = self._memory.get(session_id)
+            if summary is not None:
+                self._memory.move_to_end(session_id)
+                return summary
+        try:
+            async with vc_database.async_engine.begin() as conn:
+                await self._ensure_table(conn)
+                row = (await conn.execute(text("""
+                    SELECT context_summary, watermark, messages_covered
+                    FROM   conversation_summaries
+                    WHERE  session_id = :session_id
+                """), {"session_id": session_id})).first()
+        except Exception as e:
+            print(f"Error loading conversation summary: {e}")
+            return None
+        if row is None:
+            return None
+        watermark = row[1] if isinstance(row[1], list) else json.loads(row[1])
+        summary = SessionSummary(row[0], watermark, row[2])
+        self._remember(session_id, summary)
+        return summary
+
+    async def _write(self, session_id: str, summary: SessionSummary):
+        try:
+            async with vc_database.async_engine.begin() as conn:
+                await self._ensure_table(conn)
+                await conn.execute(text("""
+                    INSERT INTO conversation_summaries (session_id, context_summary, watermark, messages_covered)
+                    VALUES (:session_id, :context_summary, CAST(:watermark AS JSONB), :messages_covered)
+                    ON CONFLICT (session_id) DO UPDATE
+                    SET context_summary  = EXCLUDED.context_summary,
+                        watermark        = EXCLUDED.watermark,
+                        messages_covered = EXCLUDED.messages_covered,
+                        updated_at       = now()
+                """), {"session_id": session_id, "context_summary": summary.context_summary,
+                       "watermark": json.dumps(summary.watermark), "messages_covered": summary.messages_covered})
+        except Exception as e:
+            print(f"Error saving conversation summary: {e}")
+
+    def put(self, session_id: str, summary: SessionSummary):
+        """Update memory now; persist to Postgres in the background."""
+        self._remember(session_id, summary)
+        task = asyncio.get_running_loop().create_task(self._write(session_id, summary))
+        # Keep a reference until the write finishes so the task is not garbage-collected
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+
+summary_store = SummaryStore()
@@ -0,0 +1,193 @@
+# Result cache for the deterministic SQL tools.
+#
+# Most tools in VC_chain_tools are pure functions of their arguments and the
+# loaded data, and ReAct agents call them again with the same arguments within
+# one run and across sessions. @cached_tool memoizes them in one bounded LRU
+# shared by all tools, with a TTL per tool. Results are keyed on the exact
+# arguments (case-folded only where the tool matches case-insensitively):
+# whitespace inside an ILIKE pattern changes what it matches. Concurrent
+# misses on one key make one database call (single-flight); the lock only
+# guards reads and inserts. When the dataset version moves, only the results
+# of tools reading a table the change log (vc_database.get_dataset_changes)
+# lists are dropped; tools that declare no tables, or an unknown change set,
+# drop everything.
+#
+#   @tool
+#   @cached_tool(ttl=3600, casefold=("VC_name",), tables=("vc_sector_based_raw",))
+#   def vc_best_sector_tool(VC_name: str): ...
+import os
+import time
+import inspect
+import logging
+import threading
+import functools
+from collections import OrderedDict, defaultdict
+import VC_chain_database as vc_database
+
+log = logging.getLogger(__name__)
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE", "true").lower() == "true"
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", 5000))
+TOOL_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL", 3600))
+# A caller waiting on another thread's identical call gives up and queries itself after this long
+TOOL_CACHE_WAIT_SECONDS = float(os.getenv("TOOL_CACHE_WAIT_SECONDS", 30))
+
+
+def normalize_argument(value, casefold: bool = False):
+    """Hashable form of a tool argument. Strings are kept exact, lower-cased if asked (the tool uses ILIKE)."""
+    if isinstance(value, str):
+        return value.lower() if casefold else value
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_argument(item, casefold) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalize_argument(item, casefold)) for key, item in value.items()))
+    return value
+
+
+def is_error_result(result) -> bool:
+    """Tools report failures as [{"error": ...}]; those are never cached."""
+    return isinstance(result, list) and len(result) > 0 and isinstance(result[0], dict) and "error" in result[0]
+
+
+class ToolResultCache:
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (tool, args) -> (expires_at, result), least recently used first
+        self._version = None
+        self.tool_tables = {}           # tool -> frozenset of tables it reads (empty: unknown)
+        self._inflight = {}             # key -> Event set when the call computing it finishes
+        self._lock = threading.Lock()
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version: int):
+        """Drop what the change log since the cached version invalidates; the log is read outside the lock."""
+        with self._lock:
+            previous, cached = self._version, bool(self._entries)
+        if version == previous:
+            return
+        changes = vc_database.get_dataset_changes(previous, version) if cached else None
+        with self._lock:
+            if self._version != previous:
+                return                  # another thread already moved to a newer version
+            if self._entries:
+                if changes is None:
+                    stale = list(self._entries)
+                else:
+                    changed = set(changes)
+                    stale = [key for key in self._entries
+                             if not self.tool_tables.get(key[0]) or self.tool_tables[key[0]] & changed]
+                log.info("ToolResultCache: dataset version %s -> %s, dropping %d of %d results",
+                         previous, version, len(stale), len(self._entries))
+                for key in stale:
+                    del self._entries[key]
+                self.invalidations += 1
+            self._version = version
+
+    def get(self, key):
+        """(True, result) on a fresh hit, (False, None) otherwise."""
+        self._check_version(vc_database.get_dataset_version())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.counters[key[0]]["hits"] += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.counters[key[0]]["misses"] += 1
+            return False, None
+
+    def claim(self, key):
+        """None when the caller should compute `key`, else the Event of the call already computing it."""
+        with self._lock:
+            event = self._inflight.get(key)
+            if event is None:
+                self._inflight[key] = threading.Event()
+            return event
+
+    def release(self, key):
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def put(self, key, result, ttl: int):
+        self._check_version(vc_database.get_dataset_version())
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "tools": {name: dict(counts) for name, counts in self.counters.items()},
+            }
+
+
+tool_cache = ToolResultCache()
+
+
+def cached_tool(ttl: int = TOOL_CACHE_TTL, casefold: tuple = (), tables: tuple = ()):
+    """
+    Memoize a tool function. Put it under @tool so the tool schema still comes
+    from the original signature. `casefold` names arguments that the tool
+    matches case-insensitively (ILIKE), so "Sequoia" and "sequoia" share an entry.
+    `tables` lists the tables the tool reads; its results survive dataset
+    versions that changed none of them.
+    """
+    def decorator(func):
+        if not TOOL_CACHE_ENABLED:
+            return func
+        tool_cache.tool_tables[func.__name__] = frozenset(tables)
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__name__, tuple((name, normalize_argument(value, name in casefold)) for name, value in bound.arguments.items()))
+            owner = False
+            try:
+                while True:
+                    hit, result = tool_cache.get(key)
+                    if hit:
+                        log.debug("ToolResultCache: hit %s", key)
+                        return list(result) if isinstance(result, list) else result
+                    event = tool_cache.claim(key)
+                    if event is None:
+                        owner = True
+                        break
+                    # Same call in flight on another thread: use its result once stored (errors are not, so retry)
+                    if not event.wait(TOOL_CACHE_WAIT_SECONDS):
+                        break
+            except Exception:
+                log.exception("ToolResultCache: lookup failed for %s", func.__name__)
+                if owner:
+                    tool_cache.release(key)
+                return func(*args, **kwargs)
+            try:
+                result = func(*args, **kwargs)
+                if not is_error_result(result):
+                    try:
+                        tool_cache.put(key, result, ttl)
+                    except Exception:
+                        log.exception("ToolResultCache: store failed for %s", func.__name__)
+            finally:
+                if owner:
+                    tool_cache.release(key)
+            return list(result) if isinstance(result, list) else result
+
+        return wrapper
+    return decorator
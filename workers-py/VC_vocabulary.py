@@ -0,0 +1,104 @@
+# Sector / subsector vocabulary shared by the API and the tools.
+#
+# Sectors, subsectors and the per-VC sector lists change only when the data is
+# reloaded, so they are read once per dataset version and served from memory.
+import re
+import random
+import threading
+import time
+import logging
+from sqlalchemy import text
+import VC_chain_database as vc_database
+from VC_sector_matcher import SectorMatcher
+
+log = logging.getLogger(__name__)
+
+# Subsectors kept in the sampling reservoir (get_available_subsectors draws from it)
+SUBSECTOR_RESERVOIR_SIZE = 1000
+
+VC_SECTORS_SQL = 'SELECT DISTINCT "Top Tier", "Sector" FROM vc_sector_based_raw'
+SUBSECTORS_SQL = "SELECT DISTINCT category FROM funding_round_categories ORDER BY category"
+VOCABULARY_TABLES = ("vc_sector_based_raw", "funding_round_categories")
+
+
+def ilike_contains(pattern: str):
+    """Compiled equivalent of `value ILIKE '%pattern%'` (LIKE wildcards in `pattern` keep their meaning)."""
+    regex = "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+class Vocabulary:
+    """All sector names for one dataset version."""
+
+    def __init__(self, version: int, vc_sectors: list[tuple], subsectors: list[str], reservoir: list[str]):
+        self.version = version
+        self.vc_sectors = vc_sectors
+        self.sectors = sorted({sector for _, sector in vc_sectors if sector})
+        self.subsectors = subsectors
+        self.subsector_reservoir = reservoir
+        self._matchers = {}
+        self._matchers_lock = threading.Lock()
+
+    def vc_available_sectors(self, vc_name: str) -> list[tuple]:
+        """("Top Tier", "Sector") pairs whose VC name contains `vc_name`, case-insensitive."""
+        matcher = ilike_contains(vc_name)
+        return [(top_tier, sector) for top_tier, sector in self.vc_sectors if top_tier and matcher.search(top_tier)]
+
+    def sample_subsectors(self, count: int = 100) -> list[str]:
+        return random.sample(self.subsector_reservoir, min(count, len(self.subsector_reservoir)))
+
+    def matcher(self, kind: str):
+        """Trigram matcher over "sector" or "subsector" names, built on first use."""
+        if kind not in self._matchers:
+            with self._matchers_lock:
+                if kind not in self._matchers:
+                    self._matchers[kind] = SectorMatcher(self.sectors if kind == "sector" else self.subsectors)
+        return self._matchers[kind]
+
+
+def load_vocabulary(version: int) -> Vocabulary:
+    started = time.time()
+    reservoir = []
+    subsectors = []
+    with vc_database.engine.connect() as conn:
+        vc_sectors = [tuple(row) for row in conn.execute(text(VC_SECTORS_SQL))]
+        # Reservoir sampling (Algorithm R) while streaming the subsectors
+        for i, (subsector,) in enumerate(conn.execute(text(SUBSECTORS_SQL))):
+            subsectors.append(subsector)
+            if i < SUBSECTOR_RESERVOIR_SIZE:
+                reservoir.append(subsector)
+            else:
+                j = random.randint(0, i)
+                if j < SUBSECTOR_RESERVOIR_SIZE:
+                    reservoir[j] = subsector
+    vocabulary = Vocabulary(version, vc_sectors, subsectors, reservoir)
+    log.info("Vocabulary: %d sectors, %d subsectors, %d VC/sector pairs for dataset version %s in %.3fs",
+             len(vocabulary.sectors), len(subsectors), len(vc_sectors), version, time.time() - started)
+    return vocabulary
+
+
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+
+def get_vocabulary() -> Vocabulary:
+    """The vocabulary for the current dataset version, reloaded when the version moves and its tables changed."""
+    global _vocabulary
+    version = vc_database.get_dataset_version()
+    vocabulary = _vocabulary
+    if vocabulary is None or vocabulary.version != version:
+        with _vocabulary_lock:
+            vocabulary = _vocabulary
+            if vocabulary is None or vocabulary.version != version:
+                if vocabulary is not None and vc_database.tables_unchanged(vocabulary.version, version, VOCABULARY_TABLES):
+                    vocabulary.version = version
+                else:
+                    _vocabulary = vocabulary = load_vocabulary(version)
+    return vocabulary
+
+def get_sector_matcher() -> SectorMatcher:
+    """Matcher over the VC ranking sectors (vc_sector_based_raw."Sector")."""
+    return get_vocabulary().matcher("sector")
+
+def get_subsector_matcher() -> SectorMatcher:
+    """Matcher over the funding-round subsectors (funding_round_categories.category)."""
+    return get_vocabulary().matcher("subsector")
@@ -6,11 +6,22 @@ import uuid # For generating unique session IDs
 import json # Import json for safe logging if needed
 from datetime import datetime
 from flask_cors import CORS
-from VC_chain_logic import (get_assistant_response) 
+from VC_chain_logic import (get_assistant_response, stream_assistant_response, warm_up)
 from flask import Flask, render_template, request, jsonify, session
-from VC_chain_database import get_chat_history
-from sqlalchemy import text
-from VC_chain_tools import get_available_sectors, get_available_subsectors
+from VC_chat_history import get_chat_history, fetch_history_page, decode_client_history, without_current_input
+from VC_vocabulary import get_vocabulary
+from VC_interaction_logger import interaction_logger
+import VC_chain_database as vc_database
+from VC_result_encoder import encoder_stats
+from VC_prompt_cache import prompt_cache_usage
+from VC_startup import startup
+from VC_metrics import metrics, node_duration
+from VC_tool_cache import tool_cache
+from VC_answer_cache import ANSWER_CACHE_ENABLED, get_answer_cache
+from VC_sql_rewriter import rewrite_cache
+from VC_chat_history import history_cache
+
+startup.mark("imports")
 
 
 log = logging.getLogger(__name__)
@@ -31,6 +42,11 @@ app = application
 
 log.info("Flask app initialized.")
 
+# Build agents, graph, vocabulary and ranking snapshot before serving. With
+# gunicorn preload_app this runs once in the master and the workers inherit it.
+if os.getenv("WARM_UP", "true").lower() == "true":
+    warm_up()
+
 
 # ===========================================================
 #                 Flask Routes
@@ -56,10 +72,52 @@ def health_check():
         "service": "capmap-backend",
         "version": "2.1.13",
         "timestamp": datetime.utcnow().isoformat(),
-        "endpoints": ["/chat", "/api/vote", "/api/sectors", "/api/history"]
+        "endpoints": ["/chat", "/api/vote", "/api/sectors", "/api/history"],
+        "interaction_logger": interaction_logger.stats(),
+        "db_pools": vc_database.pools.stats(),
+        "tool_results": encoder_stats.stats(),
+        "prompt_cache": prompt_cache_usage.stats(),
+        "nodes": node_duration.summary(),
+        "startup": startup.as_dict()
     }), 200
 
 
+# Counters other modules already keep, exported on every scrape
+@metrics.register_collector
+def cache_and_pool_metrics():
+    tool_stats = tool_cache.stats()["tools"]
+    yield ("vc_tool_cache_requests_total", "counter", "Tool result cache lookups by result.",
+           [({"tool": tool, "result": result}, counts[result + "s"]) for tool, counts in tool_stats.items() for result in ("hit", "miss")])
+    rewrite, history = rewrite_cache.stats(), history_cache.stats
+    lookups = {("sql_rewrite", "hit"): rewrite["hits"], ("sql_rewrite", "miss"): rewrite["misses"],
+               ("chat_history", "hit"): history["hits"], ("chat_history", "miss"): history["misses"]}
+    if ANSWER_CACHE_ENABLED:
+        answer = get_answer_cache().stats
+        lookups.update({("answer", "exact_hit"): answer["exact_hits"], ("answer", "semantic_hit"): answer["semantic_hits"],
+                        ("answer", "miss"): answer["misses"]})
+    yield ("vc_cache_requests_total", "counter", "Cache lookups by cache and result.",
+           [({"cache": cache, "result": result}, count) for (cache, result), count in lookups.items()])
+    encoded = encoder_stats.stats()
+    yield ("vc_tool_result_tokens_total", "counter", "Tool result tokens before (raw) and after (encoded) compact encoding.",
+           [({"tool": tool, "stage": stage}, entry[stage + "_tokens"]) for tool, entry in encoded.items() for stage in ("raw", "encoded")])
+    pool_stats = vc_database.pools.stats()
+    yield ("vc_db_pool_checked_out", "gauge", "Connections checked out per pool.",
+           [({"pool": pool}, entry["checked_out"]) for pool, entry in pool_stats.items()])
+    yield ("vc_db_pool_size", "gauge", "Connections per pool.", [({"pool": pool}, entry["size"]) for pool, entry in pool_stats.items()])
+    yield ("vc_db_pool_timeouts_total", "counter", "Pool checkouts that timed out.",
+           [({"pool": pool}, entry["timeouts"]) for pool, entry in pool_stats.items()])
+    logger_stats = interaction_logger.stats()
+    yield ("vc_interaction_log_queue_depth", "gauge", "Interactions waiting for the background writer.", [({}, logger_stats["queue_depth"])])
+    yield ("vc_startup_phase_seconds", "gauge", "Duration of each startup phase of this worker.",
+           [({"phase": phase}, ms / 1000) for phase, ms in startup.as_dict()["phases_ms"].items()])
+
+
+@application.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint; values are per worker process."""
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
 # TODO SIMPLIFY THIS + MOVE THE LOGIC TO HANDLE THE RESPONSE TO THE FRONTEND
 @application.route('/chat_capmap', methods=['POST'])
 def chat():
@@ -85,7 +143,7 @@ def chat():
             return jsonify({"reply": "Please type a message!", "options_data": None})
 
         general_agent_check = data.get('general_agent_check', False)
-        chat_history = get_chat_history(session_id, 20)
+        chat_history = without_current_input(get_chat_history(session_id, 20), user_message)
         
         log.info(f"[ReqID: {request_id}] Processing message for session {session_id}: '{user_message}'")
         response_text = get_assistant_response(user_message, session_id, general_agent_check, chat_history)
@@ -98,7 +156,6 @@ def chat():
 @application.route('/chat-stream', methods=['POST'])
 def chat_stream():
     """Stream chat responses with real-time status updates"""
-    import time
     from flask import Response
     
     # Ensure session is set up
@@ -133,37 +190,21 @@ def chat_stream():
         return Response(error_body, mimetype='text/plain')
 
     general_agent_check = data.get('general_agent_check', False)
-    chat_history = data.get('chat_history', [])
+    chat_history = decode_client_history(data.get('chat_history', []))
 
     def generate():
         try:
-            # Send status updates with realistic timing
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Analyzing your query...'})}\n\n"
-            time.sleep(0.3)
-            
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Routing to appropriate agent...'})}\n\n"
-            time.sleep(0.4)
-            
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Processing with AI models...'})}\n\n"
-            time.sleep(0.5)
-            
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Querying database...'})}\n\n"
-            time.sleep(0.4)
-            
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Generating response...'})}\n\n"
-            
-            # Get actual response
             log.info(f"[ReqID: {request_id}] Processing streaming message for session {session_id}: '{user_message}'")
-            response_text = get_assistant_response(user_message, session_id, general_agent_check, chat_history)
-            
-            # Send final response
-            yield f"data: {json.dumps({'type': 'response', 'message': response_text})}\n\n"
-            
+            # Events are produced by the graph itself as nodes start/finish and the final agent emits tokens
+            for event in stream_assistant_response(user_message, session_id, general_agent_check, chat_history):
+                yield f"data: {json.dumps(event)}\n\n"
+
         except Exception as e:
             log.exception(f"Error in chat_stream: {e}")
             yield f"data: {json.dumps({'type': 'error', 'message': 'Internal server error'})}\n\n"
 
-    return Response(generate(), mimetype='text/plain')
+    # Disable proxy buffering so nginx forwards each event as soon as it is written
+    return Response(generate(), mimetype='text/plain', headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"})
 
 @application.route('/get_options', methods=['GET'])
 def get_options():
@@ -172,23 +213,29 @@ def get_options():
 
 @application.route('/api/history', methods=['GET'])
 def history():
-    """Endpoint to fetch chat history for the current session."""
+    """
+    Endpoint to fetch chat history for the current session, one page at a time.
+    Messages come oldest first; pass `next_cursor` back as `cursor` for the previous page.
+    """
     # Ensure session exists
     if 'session_id' not in session:
         log.warning("History request received without a Flask session_id")
-        return jsonify([]), 200  # Return empty array if no session
+        return jsonify({"messages": [], "next_cursor": None}), 200  # Return empty page if no session
     
     session_id = session['session_id']
-    limit = int(request.args.get('limit', 20))
+    limit = min(int(request.args.get('limit', 20)), 200)
+    cursor = request.args.get('cursor')
     
     log.info(f"Fetching history for session {session_id} with limit {limit}")
     
     try:
-        history_data = get_chat_history(session_id, limit)
-        return jsonify(history_data), 200
+        rows, next_cursor = fetch_history_page(session_id, limit, cursor)
+        return jsonify({"messages": [row.as_json() for row in rows], "next_cursor": next_cursor}), 200
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
     except Exception as e:
         log.error(f"Error in /api/history endpoint: {e}")
-        return jsonify([]), 500
+        return jsonify({"messages": [], "next_cursor": None}), 500
 
 
 @application.route('/api/vote', methods=['GET', 'PATCH'])
@@ -230,38 +277,14 @@ def api_sectors():
         return jsonify({"error": 'Invalid type parameter. Must be "sectors" or "subsectors"'}), 400
     
     try:
+        # Served from the in-memory vocabulary, reloaded when the dataset version changes
+        vocabulary = get_vocabulary()
         if sector_type == 'sectors':
             log.info("Fetching available sectors via /api/sectors")
-            query = text('SELECT DISTINCT "Sector" FROM vc_sector_based_raw WHERE "Sector" IS NOT NULL ORDER BY "Sector"')
-            
-            with engine.connect() as conn:
-                result = conn.execute(query)
-                rows = result.fetchall()
-                sector_list = [row[0] for row in rows if row[0]]
-            
-            return jsonify({"sectors": sector_list}), 200
+            return jsonify({"sectors": vocabulary.sectors}), 200
         else:
             log.info("Fetching available subsectors via /api/sectors")
-            query = text("""
-            WITH sectors_exploded as (
-                SELECT TRIM(sector_split.value) AS sector 
-                FROM funding_rounds fr 
-                CROSS JOIN LATERAL string_to_array(COALESCE(fr."Sectors", ''), ',') AS sector_split(value) 
-                WHERE TRIM(sector_split.value) <> '' 
-                AND TRIM(sector_split.value) <> '#NAME? ()'
-            )
-            SELECT DISTINCT sector
-            FROM sectors_exploded
-            WHERE sector IS NOT NULL
-            ORDER BY sector
-            """)
-            
-            with engine.connect() as conn:
-                result = conn.execute(query)
-                rows = result.fetchall()
-                subsector_list = [row[0] for row in rows if row[0]]
-            
-            return jsonify({"subsectors": subsector_list}), 200
+            return jsonify({"subsectors": vocabulary.subsectors}), 200
     except Exception as e:
         log.error(f"Error fetching {sector_type}: {e}")
         return jsonify({"error": f"Failed to fetch {sector_type}"}), 500
@@ -0,0 +1,181 @@
+# application_asgi.py
+# Async serving mode: the chat endpoints run the graph on the event loop
+# (graph.ainvoke / graph.astream) instead of holding a worker thread for each
+# request while it waits on OpenRouter and Postgres. Every other route is
+# served by the existing Flask app mounted underneath. Measure it against the
+# sync worker with loadtest.py before relying on it for capacity.
+#
+#   SERVING_MODE=asgi gunicorn -c gunicorn.conf.py
+#   uvicorn application_asgi:application --port 5000      (development)
+import os
+import json
+import uuid
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from application import application as flask_application, ALLOWED_ORIGINS
+from VC_chain_logic import aget_assistant_response, astream_assistant_response, configure_event_loop
+from VC_chat_history import aget_chat_history, decode_client_history, without_current_input
+
+
+log = logging.getLogger(__name__)
+
+# Concurrency knob: graph runs allowed in flight per process. Requests above
+# the limit wait for a slot instead of piling more load onto OpenRouter.
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", 200))
+_chat_slots = asyncio.Semaphore(MAX_CONCURRENT_CHATS)
+
+
+# ===========================================================
+#       Session cookie (shared with the Flask app)
+# ===========================================================
+
+_session_serializer = flask_application.session_interface.get_signing_serializer(flask_application)
+_session_cookie_name = flask_application.config["SESSION_COOKIE_NAME"]
+
+def load_session(request: Request) -> dict:
+    """Decode the Flask session cookie so both serving modes see the same session_id."""
+    cookie = request.cookies.get(_session_cookie_name)
+    if cookie:
+        try:
+            return dict(_session_serializer.loads(cookie))
+        except BadSignature:
+            log.debug("Ignoring session cookie with invalid signature")
+    return {}
+
+def store_session(response, session_data: dict):
+    """Set the session cookie with the attributes Flask's SESSION_COOKIE_* config gives it."""
+    interface = flask_application.session_interface
+    response.set_cookie(
+        _session_cookie_name,
+        _session_serializer.dumps(session_data),
+        domain=interface.get_cookie_domain(flask_application),
+        path=interface.get_cookie_path(flask_application),
+        secure=interface.get_cookie_secure(flask_application),
+        httponly=interface.get_cookie_httponly(flask_application),
+        samesite=interface.get_cookie_samesite(flask_application),
+        partitioned=interface.get_cookie_partitioned(flask_application),
+    )
+    response.headers.append("Vary", "Cookie")
+
+def extract_user_message(data: dict) -> str:
+    raw_msg = data.get("message", "")
+    if isinstance(raw_msg, dict):
+        user_message = raw_msg.get("content") or raw_msg.get("text") or ""
+    else:
+        user_message = str(raw_msg)
+    return user_message.strip()
+
+
+# ===========================================================
+#                 Async Routes
+# ===========================================================
+
+async def chat(request: Request):
+    """Async twin of the Flask /chat_capmap route."""
+    session_data = load_session(request)
+    session_id = session_data.setdefault('session_id', str(uuid.uuid4()))
+    request_id = str(uuid.uuid4())
+    log.info(f"[ReqID: {request_id}] Received chat request for session {session_id}")
+
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data or 'message' not in data:
+            return JSONResponse({"reply": "Invalid request format. 'message' key is missing.", "options_data": None}, status_code=400)
+
+        user_message = extract_user_message(data)
+        if not user_message:
+            return JSONResponse({"reply": "Please type a message!", "options_data": None})
+
+        general_agent_check = data.get('general_agent_check', False)
+        async with _chat_slots:
+            chat_history = without_current_input(await aget_chat_history(session_id, 20), user_message)
+            log.info(f"[ReqID: {request_id}] Processing message for session {session_id}: '{user_message}'")
+            response_text = await aget_assistant_response(user_message, session_id, general_agent_check, chat_history)
+
+        response = JSONResponse({"reply": response_text, "options_data": None}, status_code=200)
+        store_session(response, session_data)
+        return response
+
+    except Exception as e:
+        log.exception(f"!!! [ReqID: {request_id}] Unhandled ERROR during /chat for session {session_id}: {e}")
+        return JSONResponse({"reply": "Sorry, an unexpected internal error occurred while processing your request.", "options_data": None}, status_code=500)
+
+
+async def chat_stream(request: Request):
+    """Async twin of the Flask /chat-stream route."""
+    session_data = load_session(request)
+    session_id = session_data.setdefault('session_id', str(uuid.uuid4()))
+    request_id = str(uuid.uuid4())
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        error_body = f"data: {json.dumps({'type': 'error', 'message': 'Invalid JSON payload'})}\n\n"
+        return StreamingResponse(iter([error_body]), media_type='text/plain')
+
+    if 'message' not in data:
+        error_body = f"data: {json.dumps({'type': 'error', 'message': 'No message field'})}\n\n"
+        return StreamingResponse(iter([error_body]), media_type='text/plain')
+
+    user_message = extract_user_message(data)
+    if not user_message:
+        error_body = f"data: {json.dumps({'type': 'error', 'message': 'Please type a message!'})}\n\n"
+        return StreamingResponse(iter([error_body]), media_type='text/plain')
+
+    general_agent_check = data.get('general_agent_check', False)
+    chat_history = decode_client_history(data.get('chat_history', []))
+
+    async def generate():
+        try:
+            async with _chat_slots:
+                log.info(f"[ReqID: {request_id}] Processing streaming message for session {session_id}: '{user_message}'")
+                async for event in astream_assistant_response(user_message, session_id, general_agent_check, chat_history):
+                    yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            log.exception(f"Error in chat_stream: {e}")
+            yield f"data: {json.dumps({'type': 'error', 'message': 'Internal server error'})}\n\n"
+
+    response = StreamingResponse(generate(), media_type='text/plain', headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"})
+    store_session(response, session_data)
+    return response
+
+
+# ===========================================================
+#                 ASGI App
+# ===========================================================
+
+@asynccontextmanager
+async def lifespan(app):
+    configure_event_loop(asyncio.get_running_loop())
+    log.info(f"ASGI app started (max concurrent chats: {MAX_CONCURRENT_CHATS})")
+    yield
+
+
+application = Starlette(
+    routes=[
+        Route('/chat_capmap', chat, methods=['POST']),
+        Route('/chat-stream', chat_stream, methods=['POST']),
+        # Everything else is still served by the Flask app
+        Mount('/', app=WSGIMiddleware(flask_application)),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=ALLOWED_ORIGINS, allow_credentials=True, allow_methods=["*"], allow_headers=["*"]),
+    ],
+    lifespan=lifespan,
+)
+
+app = application
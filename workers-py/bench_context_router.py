@@ -0,0 +1,155 @@
+# bench_context_router.py
+# Compares the fused context_router node with the two-call
+# context_summarizer -> router path.
+#
+#   python bench_context_router.py latency --turns 50 --llm-latency 0.8
+#       Stubbed model with a fixed per-call latency: shows the round-trip the
+#       fused node saves on turns that have history (and that the no-history
+#       fast path costs a single call either way).
+#
+#   python bench_context_router.py agreement --sessions 100
+#       Replays logged conversations from the interactions table through both
+#       paths with the real model and reports how often they route the same way.
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy import text
+import VC_chain_database as vc_database
+import VC_chain_logic as vc_logic
+
+ROUTES = ["general", "ranking", "reasoning", "prediction"]
+
+
+class StubChatModel:
+    """Stands in for the shared chat model: sleeps `latency` per call and counts calls."""
+
+    def __init__(self, latency: float, schema=None, calls: Counter = None):
+        self.latency = latency
+        self.schema = schema
+        self.calls = calls if calls is not None else Counter()
+
+    def with_structured_output(self, schema):
+        return StubChatModel(self.latency, schema, self.calls)
+
+    async def ainvoke(self, messages, config=None):
+        self.calls["llm"] += 1
+        await asyncio.sleep(self.latency)
+        summary = "ACTIVE CONSTRAINTS: None\nCURRENT SECTOR/TOPIC: AI\nKEY ENTITIES: None\nUSER'S GOAL: ranking"
+        if self.schema is None:
+            return AIMessage(content=summary)
+        output = {"query_type": "ranking_agent_query"}
+        if "context_summary" in self.schema.__annotations__:
+            output["context_summary"] = summary
+        return output
+
+
+def make_state(user_input: str, chat_history: list) -> dict:
+    return {"input": user_input, "chat_history": chat_history, "general_agent_check": False}
+
+
+def route_of(update: dict) -> str:
+    return vc_logic.router_function({"output": update["output"], "general_agent_check": False})
+
+
+# ── Latency (stubbed model) ──
+
+async def bench_latency(turns: int, llm_latency: float, history_turns: int):
+    calls = Counter()
+    vc_logic._shared_llm_gemini = StubChatModel(llm_latency, calls=calls)
+    history = []
+    for i in range(history_turns):
+        history += [HumanMessage(content=f"Top {i + 3} AI VCs by AUM"), AIMessage(content="| VC | AUM |\n|---|---|")]
+    config = {"configurable": {"thread_id": "bench"}}
+
+    rows = []
+    for label, chat_history in [("no history", []), (f"{history_turns} turns of history", history)]:
+        for name, node in [("two-call", vc_logic.run_two_call_context_router), ("fused", vc_logic.run_context_router)]:
+            calls.clear()
+            latencies = []
+            for _ in range(turns):
+                started = time.perf_counter()
+                await node(make_state("What about fintech?", chat_history), config)
+                latencies.append(time.perf_counter() - started)
+            rows.append((label, name, calls["llm"] / turns, statistics.mean(latencies)))
+
+    print(f"{'history':<24} {'path':<10} {'llm calls/turn':>14} {'mean s/turn':>12}")
+    for label, name, calls_per_turn, mean in rows:
+        print(f"{label:<24} {name:<10} {calls_per_turn:>14.1f} {mean:>12.3f}")
+    for i in range(0, len(rows), 2):
+        saved = rows[i][3] - rows[i + 1][3]
+        print(f"{rows[i][0]}: fused saves {saved:.3f}s per turn ({saved / rows[i][3]:.0%})")
+
+
+# ── Routing agreement (logged traffic, real model) ──
+
+def load_logged_turns(sessions: int, history_turns: int) -> list[tuple]:
+    """(user_input, chat_history) for every logged turn of the most recent `sessions` sessions."""
+    with vc_database.engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT session_id, user_input, assistant_reply
+            FROM   interactions
+            WHERE  session_id IN (SELECT session_id FROM interactions
+                                  GROUP BY session_id ORDER BY max(timestamp) DESC LIMIT :sessions)
+            ORDER  BY session_id, timestamp
+        """), {"sessions": sessions}).fetchall()
+
+    turns = []
+    histories = {}
+    for session_id, user_input, assistant_reply in rows:
+        history = histories.setdefault(session_id, [])
+        turns.append((user_input, list(history[-2 * history_turns:])))
+        history += [HumanMessage(content=user_input or ""), AIMessage(content=assistant_reply or "")]
+    return turns
+
+
+async def bench_agreement(sessions: int, history_turns: int, concurrency: int):
+    turns = load_logged_turns(sessions, history_turns)
+    config = {"configurable": {"thread_id": "bench"}}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def compare(user_input, chat_history):
+        async with slots:
+            state = make_state(user_input, chat_history)
+            two_call = await vc_logic.run_two_call_context_router(state, config)
+            fused = await vc_logic.run_context_router(state, config)
+            return route_of(two_call), route_of(fused), bool(chat_history)
+
+    results = await asyncio.gather(*(compare(*turn) for turn in turns))
+    with_history = [(a, b) for a, b, has_history in results if has_history]
+    confusion = Counter((a, b) for a, b, _ in results)
+
+    print(f"turns replayed: {len(results)} ({len(with_history)} with history)")
+    if results:
+        print(f"agreement (all turns):          {sum(a == b for a, b, _ in results) / len(results):.1%}")
+    if with_history:
+        print(f"agreement (turns with history): {sum(a == b for a, b in with_history) / len(with_history):.1%}")
+    corner = "two-call \\ fused"
+    print(f"\n{corner:<18}" + "".join(f"{route:>12}" for route in ROUTES))
+    for a in ROUTES:
+        print(f"{a:<18}" + "".join(f"{confusion[(a, b)]:>12}" for b in ROUTES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fused context_router vs context_summarizer -> router")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    latency = sub.add_parser("latency", help="stubbed model, per-turn latency and LLM calls")
+    latency.add_argument("--turns", type=int, default=20)
+    latency.add_argument("--llm-latency", type=float, default=0.8, help="seconds per stubbed LLM call")
+    latency.add_argument("--history-turns", type=int, default=4)
+    agreement = sub.add_parser("agreement", help="routing agreement on logged traffic, real model")
+    agreement.add_argument("--sessions", type=int, default=50)
+    agreement.add_argument("--history-turns", type=int, default=10, help="history kept per replayed turn")
+    agreement.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.mode == "latency":
+        asyncio.run(bench_latency(args.turns, args.llm_latency, args.history_turns))
+    else:
+        asyncio.run(bench_agreement(args.sessions, args.history_turns, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+# bench_pipeline.py
+# Offline benchmarks for the SQL tools, each graph node and the compiled
+# graph: no OpenRouter, no Google Sheets, no network. The chat model is
+# ScriptedChatModel, which replays a fixed tool-call script per route with a
+# simulated latency, so timings move only when our code or queries do.
+#
+#   python bench_pipeline.py generate --rows 100k
+#       Synthetic funding_rounds_v2, vc_* sheets, startup_profile and
+#       "Message_v2" (10k / 100k / 1M rows) in POSTGRES_URL, loaded through the
+#       sheet ingest and the derived-table refresh. Point POSTGRES_URL at a
+#       local database: existing tables are replaced.
+#
+#   python bench_pipeline.py run --iterations 20 --llm-latency 0.05 --save bench.json
+#       Per-tool, per-node and whole-graph wall time (p50 / p95 / mean) and
+#       peak traced memory; the graph section also breaks each route down by
+#       node and tool (VC_metrics).
+#
+#   python bench_pipeline.py run --compare bench.json --tolerance 0.25
+#       Exits 1 when a case's p50 is more than 25% (and BENCH_NOISE_MS) slower
+#       than in the saved run, e.g. as a pre-deploy check.
+import os
+
+# Before the app modules read them: measure the queries, not the caches, and
+# route with the scripted model instead of the local classifier
+os.environ.setdefault("TOOL_CACHE", "false")
+os.environ.setdefault("ANSWER_CACHE", "false")
+os.environ.setdefault("LOCAL_ROUTER", "false")
+os.environ.setdefault("WARM_UP", "false")
+
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+import tracemalloc
+from collections import Counter
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+import VC_chain_database as vc_database
+from VC_sheet_ingest import _copy_chunk, ingest_sheets, quote
+
+# Below this many milliseconds a slowdown is treated as noise by --compare
+BENCH_NOISE_MS = float(os.getenv("BENCH_NOISE_MS", 2.0))
+SYNTHETIC_MARKER = "synthetic benchmark data (bench_pipeline.py)"
+GENERATE_CHUNK_ROWS = 100_000
+
+SECTORS = ["Fintech", "Healthcare", "AI", "Climate", "Cybersecurity", "Edtech", "Biotech", "Logistics", "Gaming", "Robotics",
+           "Proptech", "Agtech", "Insurtech", "Retail", "Media", "Mobility", "Energy", "SaaS", "Hardware", "Foodtech"]
+SUBSECTOR_KINDS = ["Payments", "Infrastructure", "Analytics", "Marketplaces", "Devices", "Services", "Platforms", "Security"]
+ROUND_NAMES = ["Pre-Seed", "Seed", "Series A", "Series B", "Series C", "Series D", "Angel Round", "Bridge", "Venture Round", "Debt Financing"]
+ROUND_WEIGHTS = [0.08, 0.3, 0.2, 0.12, 0.06, 0.03, 0.06, 0.03, 0.08, 0.04]
+CITIES = ["San Francisco", "New York", "London", "Berlin", "Paris", "Singapore", "Bangalore", "Toronto", "Tel Aviv", "Boston"]
+
+
+def firm_name(i: int) -> str:
+    return f"Firm {i:04d} Capital"
+
+def startup_name(i: int) -> str:
+    return f"Startup {i:06d}"
+
+
+# ── Synthetic dataset ──
+
+def parse_rows(value: str) -> int:
+    """10k, 100k, 1M or a plain number."""
+    value = value.strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value[:-1] if factor > 1 else value) * factor)
+
+
+def dataset_shape(rows: int) -> dict:
+    return {"rounds": rows, "messages": rows, "firms": int(np.clip(rows // 100, 50, 5000)),
+            "startups": max(100, rows // 3), "chats": max(1, rows // 20)}
+
+
+def sheet_frames(shape: dict, rng: np.random.Generator) -> dict:
+    """The sheet tables as the Google Sheets export has them (text metrics, "NO DATA")."""
+    firms = shape["firms"]
+    aum = rng.lognormal(20, 1.5, firms).astype(np.int64)
+    ticket = rng.integers(1, 60, firms)
+    ticket_text = [f"{t}M" if kind == 0 else f"{t}M-{t + 5}M" if kind == 1 else "NO DATA"
+                   for t, kind in zip(ticket, rng.choice(3, firms, p=[0.6, 0.3, 0.1]))]
+    overall = pd.DataFrame({
+        "Top Tier": [firm_name(i) for i in range(firms)],
+        "AUM": [f"${value:,}" for value in aum],
+        "Ticket Size": ticket_text,
+        "Follow on Index": rng.uniform(0, 1, firms).round(3),
+        "Total Exits / Total Investments": rng.uniform(0, 0.6, firms).round(3),
+        "HQ Location": rng.choice(CITIES, firms),
+    })
+
+    pairs = []
+    for i in range(firms):
+        for sector in rng.choice(SECTORS, rng.integers(3, 11), replace=False):
+            investments = int(rng.integers(1, 200))
+            exits = int(rng.integers(0, investments + 1))
+            pairs.append((firm_name(i), sector, investments, exits, f"{exits * 100 / investments:.2f}%"))
+    sector_based = pd.DataFrame(pairs, columns=["Top Tier", "Sector", "Sector specific Investment", "Sector specific exit",
+                                                "Sector specific exit/investment"])
+
+    market = pd.DataFrame({
+        "Sector": SECTORS,
+        "Current Market Size": rng.lognormal(23, 1, len(SECTORS)).astype(np.int64),
+        "CAGR": [f"{value:.2f}%" for value in rng.uniform(2, 35, len(SECTORS))],
+    })
+
+    startups = min(shape["startups"], 50_000)
+    last_funding = pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3650, startups), unit="D")
+    profile = pd.DataFrame({
+        "Startup": [startup_name(i) for i in range(startups)],
+        "Sector": rng.choice(SECTORS, startups),
+        "HQ Location": rng.choice(CITIES, startups),
+        "Last Funding Date": last_funding.strftime("%b %d, %Y"),
+        "Total Funding Amount": rng.lognormal(15, 1.5, startups).astype(np.int64),
+    })
+    return {"vc_overall_raw": overall, "vc_sector_based_raw": sector_based, "vc_market_cagr": market, "startup_profile": profile}
+
+
+FUNDING_ROUNDS_V2_DDL = """
+    CREATE TABLE funding_rounds_v2 (
+        org_name           TEXT,
+        round_name         TEXT,
+        announced_on       DATE,
+        money_raised_usd   NUMERIC,
+        investors          TEXT,
+        categories         TEXT,
+        num_funding_rounds INT,
+        funding_total_usd  NUMERIC
+    )
+"""
+
+MESSAGE_V2_DDL = """
+    CREATE TABLE "Message_v2" (
+        id            TEXT PRIMARY KEY,
+        "chatId"      TEXT NOT NULL,
+        role          TEXT NOT NULL,
+        parts         JSON NOT NULL,
+        attachments   JSON NOT NULL DEFAULT '[]',
+        "createdAt"   TIMESTAMP NOT NULL
+    )
+"""
+
+
+def funding_round_chunks(shape: dict, rng: np.random.Generator):
+    """funding_rounds_v2 in chunks: investors drawn with a skew, so popular firms match many rounds."""
+    firms = shape["firms"]
+    popularity = 1 / np.arange(1, firms + 1) ** 0.8
+    popularity /= popularity.sum()
+    subsectors = [f"{sector} {kind}" for sector in SECTORS for kind in SUBSECTOR_KINDS]
+    for start in range(0, shape["rounds"], GENERATE_CHUNK_ROWS):
+        n = min(GENERATE_CHUNK_ROWS, shape["rounds"] - start)
+        investor_ids = rng.choice(firms, (n, 4), p=popularity)
+        investor_counts = rng.integers(1, 5, n)
+        category_ids = rng.integers(0, len(subsectors), (n, 3))
+        category_counts = rng.integers(1, 4, n)
+        money = rng.lognormal(15, 1.6, n).round()
+        money[rng.random(n) < 0.1] = np.nan
+        yield pd.DataFrame({
+            "org_name": [startup_name(i) for i in rng.integers(0, shape["startups"], n)],
+            "round_name": rng.choice(ROUND_NAMES, n, p=ROUND_WEIGHTS),
+            "announced_on": (pd.Timestamp("2005-01-01") + pd.to_timedelta(rng.integers(0, 7300, n), unit="D")).strftime("%Y-%m-%d"),
+            "money_raised_usd": money,
+            "investors": [", ".join(dict.fromkeys(firm_name(i) for i in row[:count])) for row, count in zip(investor_ids, investor_counts)],
+            "categories": [", ".join(dict.fromkeys(subsectors[i] for i in row[:count])) for row, count in zip(category_ids, category_counts)],
+            "num_funding_rounds": rng.integers(1, 9, n),
+            "funding_total_usd": (np.nan_to_num(money) * rng.uniform(1, 4, n)).round(),
+        })
+
+
+def message_chunks(shape: dict, rng: np.random.Generator):
+    """"Message_v2": alternating user / assistant rows spread over the synthetic chats."""
+    started = datetime.datetime(2025, 1, 1)
+    for start in range(0, shape["messages"], GENERATE_CHUNK_ROWS):
+        n = min(GENERATE_CHUNK_ROWS, shape["messages"] - start)
+        index = np.arange(start, start + n)
+        yield pd.DataFrame({
+            "id": [str(uuid.UUID(int=int(i))) for i in index],
+            "chatId": [f"bench-chat-{c}" for c in rng.integers(0, shape["chats"], n)],
+            "role": np.where(index % 2 == 0, "user", "assistant"),
+            "parts": [json.dumps([{"type": "text", "text": f"Top 5 {SECTORS[i % len(SECTORS)]} VCs by AUM ({i})"}]) for i in index],
+            "attachments": "[]",
+            "createdAt": [(started + datetime.timedelta(seconds=int(i) * 7)).isoformat() for i in index],
+        })
+
+
+def copy_table(table: str, ddl: str, chunks) -> int:
+    rows = 0
+    with vc_database.background_engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {quote(table)} CASCADE"))
+        conn.execute(text(ddl))
+        dbapi_conn = conn.connection.driver_connection
+        for chunk in chunks:
+            _copy_chunk(dbapi_conn, table, chunk)
+            rows += len(chunk)
+        conn.execute(text(f"COMMENT ON TABLE {quote(table)} IS '{SYNTHETIC_MARKER}'"))
+        conn.execute(text(f"ANALYZE {quote(table)}"))
+    return rows
+
+
+def check_target(force: bool):
+    """Refuse to replace a funding_rounds_v2 this script did not generate."""
+    with vc_database.background_engine.connect() as conn:
+        exists = conn.execute(text("SELECT to_regclass('funding_rounds_v2') IS NOT NULL")).scalar()
+        comment = conn.execute(text("SELECT obj_description('funding_rounds_v2'::regclass)")).scalar() if exists else None
+    if exists and comment != SYNTHETIC_MARKER and not force:
+        raise SystemExit(f"{vc_database.engine.url.render_as_string(hide_password=True)} has a real funding_rounds_v2; "
+                         "use a local database or pass --force")
+
+
+def generate(rows: int, seed: int, force: bool):
+    check_target(force)
+    rng = np.random.default_rng(seed)
+    shape = dataset_shape(rows)
+    print(f"Generating {shape} (seed {seed})")
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        sources = {}
+        for table, frame in sheet_frames(shape, rng).items():
+            sources[table] = os.path.join(directory, f"{table}.csv")
+            frame.to_csv(sources[table], index=False)
+        for report in ingest_sheets(sources):
+            print(f"  {report.table:<22} {report.rows:>9} rows  {report.seconds:6.2f}s")
+
+    for table, ddl, chunks in [("funding_rounds_v2", FUNDING_ROUNDS_V2_DDL, funding_round_chunks(shape, rng)),
+                               ("Message_v2", MESSAGE_V2_DDL, message_chunks(shape, rng))]:
+        step = time.perf_counter()
+        print(f"  {table:<22} {copy_table(table, ddl, chunks):>9} rows  {time.perf_counter() - step:6.2f}s")
+
+    step = time.perf_counter()
+    with vc_database.background_engine.begin() as conn:
+        # Link tables of the previous synthetic rounds (round ids restart)
+        conn.execute(text("DROP TABLE IF EXISTS funding_round_investors, funding_round_categories, funding_round_link_sources"))
+    vc_database.refresh_derived_tables()
+    from VC_chat_history import ensure_history_index
+    ensure_history_index()
+    print(f"  derived tables + indexes          {time.perf_counter() - step:6.2f}s")
+    print(f"Dataset version {vc_database.bump_dataset_version()}; generated in {time.perf_counter() - started:.1f}s")
+
+
+# ── Scripted chat model ──
+
+# Tool calls each route's agent makes, in order; an agent only gets the steps
+# whose tool it has. After the last step it answers with FINAL_ANSWER.
+SCRIPTS = {
+    "general": [("CurrentDateTimeTool", {})],
+    "ranking": [
+        ("get_available_sectors", {}),
+        ("VCRankingTool", {"metric": "AUM", "count": 5, "sector": "Fintech"}),
+        ("VCSubsectorRankingTool", {"sector": "payments", "metric": "Subsector specific investment", "count": 5}),
+    ],
+    "reasoning": [
+        ("get_available_fields", {"table": "funding_rounds_v2"}),
+        ("execute_query", {"query": "SELECT round_name, COUNT(*) AS rounds, SUM(money_raised_usd) AS raised FROM funding_rounds_v2 "
+                                    "WHERE announced_on >= DATE '2020-01-01' GROUP BY round_name ORDER BY rounds DESC"}),
+        ("execute_query", {"query": "SELECT fi.investor, COUNT(*) AS deals FROM funding_round_investors fi "
+                                    "JOIN funding_round_categories fc ON fc.round_id = fi.round_id "
+                                    "WHERE fc.category ILIKE '%fintech%' GROUP BY fi.investor ORDER BY deals DESC LIMIT 10"}),
+    ],
+    "prediction": [
+        ("vc_best_sector_tool", {"VC_name": firm_name(3)}),
+        ("vc_best_sector_tool_2", {"VC_name": firm_name(3)}),
+        ("VC_coinvestor_tool", {"sector": "fintech", "VC_name": firm_name(3)}),
+        ("coinvestor_startup_tool", {"sector": "fintech", "VC_name": firm_name(3), "coinvestor_vcs": [firm_name(0), firm_name(1), firm_name(2)]}),
+        ("investor_lookup_tool", {"startup": startup_name(42)}),
+    ],
+}
+ROUTES = list(SCRIPTS)
+FINAL_ANSWER = "| VC | AUM |\n|---|---|\n| " + firm_name(0) + " | $9,200,000,000 |"
+CONTEXT_SUMMARY = "ACTIVE CONSTRAINTS: None\nCURRENT SECTOR/TOPIC: Fintech\nKEY ENTITIES: None\nUSER'S GOAL: benchmark"
+
+# Route the scripted model plays; set per benchmark case
+scenario = {"route": "ranking"}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenRouter: replays SCRIPTS, sleeps `latency` per call, reports token usage."""
+
+    latency: float = 0.0
+    tool_names: frozenset = frozenset()
+    structured: tuple = ()          # output keys when used through with_structured_output
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_names": frozenset(getattr(tool, "name", None) or tool.__name__ for tool in tools)})
+
+    def with_structured_output(self, schema, **kwargs):
+        return self.model_copy(update={"structured": tuple(schema.__annotations__)}) | RunnableLambda(lambda message: json.loads(message.content))
+
+    def _respond(self, messages) -> ChatResult:
+        if self.structured:
+            output = {"query_type": f"{scenario['route']}_agent_query"}
+            if "context_summary" in self.structured:
+                output["context_summary"] = CONTEXT_SUMMARY
+            message = AIMessage(content=json.dumps(output))
+        else:
+            steps = [step for step in SCRIPTS.get(scenario["route"], []) if step[0] in self.tool_names]
+            # Tool results since the current query = steps already taken
+            done = 0
+            for message in reversed(messages):
+                if isinstance(message, HumanMessage):
+                    break
+                done += isinstance(message, ToolMessage)
+            if done < len(steps):
+                name, args = steps[done]
+                message = AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{done}", "type": "tool_call"}])
+            else:
+                # No tools bound: the context summarizer
+                message = AIMessage(content=FINAL_ANSWER if self.tool_names else CONTEXT_SUMMARY)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = len(str(message.content)) // 4 + 1
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        message.response_metadata = {"model_name": "scripted"}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+# ── Measurement ──
+
+class Case:
+    def __init__(self, section: str, name: str):
+        self.section = section
+        self.name = name
+        self.seconds = []
+        self.peak_kib = None
+        self.error = None
+        self.mean_only = None       # (count, mean seconds) read back from a VC_metrics histogram
+
+    def stats(self) -> dict:
+        if self.mean_only is not None:
+            count, mean = self.mean_only
+            return {"n": count, "p50_ms": None, "p95_ms": None, "mean_ms": 1000 * mean, "peak_kib": None, "error": None}
+        ordered = sorted(self.seconds)
+        if not ordered:
+            return {"n": 0, "error": self.error}
+        return {"n": len(ordered), "p50_ms": 1000 * ordered[len(ordered) // 2],
+                "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "mean_ms": 1000 * statistics.mean(ordered), "peak_kib": self.peak_kib, "error": self.error}
+
+
+async def measure(case: Case, call, iterations: int):
+    """One untimed warm-up call, `iterations` timed calls, then one call under tracemalloc for the peak."""
+    try:
+        await call()
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await call()
+            case.seconds.append(time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            await call()
+            case.peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        case.error = f"{type(e).__name__}: {e}"
+    return case
+
+
+def bench_history() -> list[HumanMessage]:
+    history = []
+    for i in range(3):
+        history += [HumanMessage(content=f"Top {i + 3} fintech VCs by AUM"), AIMessage(content=FINAL_ANSWER)]
+    return history
+
+
+def node_state(route: str) -> dict:
+    return {"input": f"Benchmark {route} question about Fintech and {firm_name(3)}", "chat_history": bench_history(),
+            "context_summary": CONTEXT_SUMMARY, "general_agent_check": False, "reasoning_validated_check": True,
+            "output": {"query_type": f"{route}_agent_query"}, "route": route}
+
+
+async def run_benchmarks(iterations: int, llm_latency: float, sections: list[str]) -> list[Case]:
+    import VC_chain_logic as vc_logic
+    import VC_chain_tools as vc_tools
+    from VC_chat_history import fetch_history_page
+    from VC_metrics import graph_callbacks, metrics, node_duration, tool_duration
+
+    model = ScriptedChatModel(latency=llm_latency)
+    vc_logic._shared_llm_gemini = vc_logic._shared_llm_kimi = model
+    vc_logic._agents.clear()
+    vc_logic._graph = None
+    loop = asyncio.get_running_loop()
+    vc_logic.configure_event_loop(loop)
+    cases = []
+
+    if "tools" in sections:
+        tools = {tool.name: tool for tool in vc_tools.general_tools + vc_tools.ranking_tools + vc_tools.reasoning_tools + vc_tools.prediction_tools}
+        seen = Counter()
+        for name, arguments in [step for script in SCRIPTS.values() for step in script]:
+            seen[name] += 1
+            tool = tools[name]
+            label = name if seen[name] == 1 else f"{name} #{seen[name]}"
+            cases.append(await measure(Case("tools", label), lambda tool=tool, arguments=arguments: loop.run_in_executor(None, tool.invoke, arguments), iterations))
+        chat_id = "bench-chat-0"
+        cases.append(await measure(Case("tools", "history page (Message_v2)"), lambda: loop.run_in_executor(None, fetch_history_page, chat_id, 20), iterations))
+
+    if "nodes" in sections:
+        nodes = [("memory_limiter", vc_logic.trim_chat_history, "ranking"), ("context_summarizer", vc_logic.run_context_summarizer, "ranking"),
+                 ("router", vc_logic.run_router_model, "ranking"), ("context_router", vc_logic.run_context_router, "ranking")]
+        nodes += [(route, getattr(vc_logic, f"run_{route}_model"), route) for route in ROUTES]
+        nodes.append(("final", vc_logic.run_final_model, "ranking"))
+        for name, node, route in nodes:
+            config = {"configurable": {"thread_id": f"bench-node-{name}"}, "callbacks": graph_callbacks()}
+
+            async def call(node=node, route=route, config=config):
+                scenario["route"] = route
+                result = node(node_state(route), config)
+                return await result if asyncio.iscoroutine(result) else result
+
+            cases.append(await measure(Case("nodes", name), call, iterations))
+
+    if "graph" in sections:
+        for route in ROUTES:
+            metrics.reset()
+
+            async def call(route=route):
+                scenario["route"] = route
+                state = {"input": f"Benchmark {route} question about Fintech", "chat_history": bench_history(),
+                         "general_agent_check": False, "context_summary": ""}
+                config = {"configurable": {"thread_id": f"bench-graph-{route}", "recursion_limit": 12, "max_concurrency": 2},
+                          "callbacks": graph_callbacks()}
+                await vc_logic.get_graph().ainvoke(state, config)
+
+            cases.append(await measure(Case("graph", route), call, iterations))
+            # Inside-the-graph breakdown from the pipeline metrics of this route's runs
+            for section, histogram in (("graph nodes", node_duration), ("graph tools", tool_duration)):
+                for label, summary in sorted(histogram.summary().items()):
+                    case = Case(section, f"{route}: {label}")
+                    case.mean_only = (summary["count"], summary["avg"])
+                    cases.append(case)
+    return cases
+
+
+# ── Report ──
+
+def print_report(cases: list[Case], baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    section = None
+    for case in cases:
+        if case.section != section:
+            section = case.section
+            print(f"\n{section:<44} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'peak KiB':>9}  {'vs base':>8}")
+        stats = case.stats()
+        if stats["n"] == 0:
+            print(f"  {case.name:<42} FAILED  {case.error}")
+            regressions.append(f"{section}/{case.name}: {case.error}")
+            continue
+        p50, p95, peak = (f"{value:9.1f}" if value is not None else f"{'-':>9}" for value in (stats["p50_ms"], stats["p95_ms"], stats["peak_kib"]))
+        change = ""
+        base = baseline.get(section, {}).get(case.name)
+        if base and base.get("p50_ms") and stats["p50_ms"] is not None:
+            ratio = stats["p50_ms"] / base["p50_ms"] - 1
+            change = f"{ratio:+8.0%}"
+            if ratio > tolerance and stats["p50_ms"] - base["p50_ms"] > BENCH_NOISE_MS:
+                change += " !"
+                regressions.append(f"{section}/{case.name}: p50 {base['p50_ms']:.1f} -> {stats['p50_ms']:.1f} ms")
+        print(f"  {case.name:<42} {stats['n']:>4} {p50} {p95} {stats['mean_ms']:9.1f} {peak}  {change}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks: synthetic dataset, scripted chat model")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    gen = sub.add_parser("generate", help="build the synthetic dataset in POSTGRES_URL")
+    gen.add_argument("--rows", type=parse_rows, default="100k", help="funding rounds and messages: 10k, 100k, 1M, ...")
+    gen.add_argument("--seed", type=int, default=7)
+    gen.add_argument("--force", action="store_true", help="replace tables this script did not generate")
+    run = sub.add_parser("run", help="time tools, nodes and the graph")
+    run.add_argument("--iterations", type=int, default=10)
+    run.add_argument("--llm-latency", type=float, default=0.0, help="seconds per scripted LLM call")
+    run.add_argument("--section", action="append", choices=["tools", "nodes", "graph"], help="repeatable; default all")
+    run.add_argument("--save", help="write the results as JSON")
+    run.add_argument("--compare", help="JSON from an earlier --save; exit 1 on regressions")
+    run.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown for --compare")
+    args = parser.parse_args()
+
+    if args.mode == "generate":
+        generate(args.rows, args.seed, args.force)
+        return
+
+    cases = asyncio.run(run_benchmarks(args.iterations, args.llm_latency, args.section or ["tools", "nodes", "graph"]))
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    regressions = print_report(cases, baseline, args.tolerance)
+    if args.save:
+        results = {}
+        for case in cases:
+            results.setdefault(case.section, {})[case.name] = case.stats()
+        with open(args.save, "w") as f:
+            json.dump({"iterations": args.iterations, "llm_latency": args.llm_latency, "created_at": time.time(), "results": results}, f, indent=1)
+        print(f"\nSaved to {args.save}")
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        if args.compare:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
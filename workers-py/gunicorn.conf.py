@@ -2,8 +2,14 @@
 import os
 import multiprocessing
 
+# Serving mode:
+#   sync - Flask app on a sync worker, one conversation at a time per worker
+#   asgi - application_asgi on uvicorn workers, chats run concurrently on the event loop
+#          (limit with MAX_CONCURRENT_CHATS, tool thread pool with TOOL_THREADS)
+SERVING_MODE = os.getenv("SERVING_MODE", "sync").lower()
+
 # Application module and variable
-wsgi_app = "application:application"
+wsgi_app = "application_asgi:application" if SERVING_MODE == "asgi" else "application:application"
 
 # Server socket - bind to localhost only (nginx will proxy)
 bind = "0.0.0.0:5000"
@@ -11,8 +17,10 @@ backlog = 2048
 
 
 # Worker processes - optimized for AI applications with higher memory usage
-workers = 1  # Single worker to maximize memory per process
-worker_class = "sync"
+# Single worker by default to maximize memory per process; the DB connection
+# budget (DB_CONNECTION_BUDGET) is divided across WEB_CONCURRENCY workers
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+worker_class = "uvicorn.workers.UvicornWorker" if SERVING_MODE == "asgi" else "sync"
 worker_connections = 1000
 timeout = 60  # Increased timeout for AI processing
 keepalive = 2
@@ -42,6 +50,23 @@ max_worker_memory = 800  # MB - increased for AI applications (1GB per worker)
 
 # Graceful shutdown
 graceful_timeout = 30
+
+def post_fork(server, worker):
+    """Drop DB connections inherited from the preloaded master; each worker opens its own."""
+    try:
+        import VC_chain_database as vc_database
+        vc_database.pools.dispose()
+    except Exception as e:
+        server.log.warning(f"Could not reset DB pools after fork: {e}")
+
+def worker_exit(server, worker):
+    """Flush interaction rows still queued in the exiting worker (max_requests restarts, shutdown)."""
+    try:
+        from VC_interaction_logger import interaction_logger
+        interaction_logger.close(timeout=graceful_timeout - 5)
+        server.log.info(f"Interaction logger flushed on worker exit: {interaction_logger.stats()}")
+    except Exception as e:
+        server.log.warning(f"Could not flush interaction logger: {e}")
 proc_name = 'wealt-backend'
 
 # Daemonize the Gunicorn process (detach & run in background)
@@ -0,0 +1,80 @@
+# ingest_sheets.py
+# Reloads the raw sheet tables (VC_sheet_ingest: chunked read, typed COPY
+# into a staging table, atomic swap), then rebuilds what derives from the
+# changed tables and bumps the dataset version with a change log entry per
+# table, so versioned caches only reload what reads a changed table. A sync
+# that changed nothing leaves the version alone. Runs outside the app; the
+# workers keep serving the old tables until each swap.
+#
+#   python ingest_sheets.py                                     # all sheets from Google Sheets
+#   python ingest_sheets.py --table funding_rounds              # one sheet
+#   python ingest_sheets.py --csv funding_rounds=rounds.csv     # local file instead of the sheet
+#   python ingest_sheets.py --csv-dir ./sheets                  # <table>.csv for every table found there
+#   python ingest_sheets.py --sync                              # apply only changed rows (row hashes by natural key)
+import os
+import argparse
+import VC_chain_database as vc_database
+from VC_sheet_ingest import SHEET_CHUNK_ROWS, SHEET_SPECS, dataset_changes, ingest_sheets, sync_sheets
+
+
+def resolve_sources(args) -> dict:
+    """{table: local path, or None for its Google Sheet}"""
+    tables = args.table or list(SHEET_SPECS)
+    sources = dict.fromkeys(tables)
+    if args.csv_dir:
+        sources = {table: os.path.join(args.csv_dir, f"{table}.csv") for table in tables
+                   if os.path.exists(os.path.join(args.csv_dir, f"{table}.csv"))}
+    for mapping in args.csv:
+        table, _, path = mapping.partition("=")
+        if not path:
+            raise SystemExit(f"--csv expects table=path, got {mapping!r}")
+        sources[table] = path
+    if not sources:
+        raise SystemExit("Nothing to load")
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the raw sheet tables through staged COPY and an atomic swap")
+    parser.add_argument("--table", action="append", choices=sorted(SHEET_SPECS), help="load only this table (repeatable)")
+    parser.add_argument("--csv", action="append", default=[], metavar="TABLE=PATH", help="load TABLE from a local CSV (repeatable)")
+    parser.add_argument("--csv-dir", help="load <table>.csv files from this directory instead of the sheets")
+    parser.add_argument("--chunk-rows", type=int, default=SHEET_CHUNK_ROWS)
+    parser.add_argument("--sync", action="store_true", help="differential sync: apply only inserted / changed / deleted rows")
+    parser.add_argument("--no-refresh", action="store_true",
+                        help="skip the derived-table refresh and dataset version bump (the loader types the VC metric columns either way)")
+    args = parser.parse_args()
+    sources = resolve_sources(args)
+
+    if args.sync:
+        reports = sync_sheets(sources, args.chunk_rows)
+        print(f"\n{'table':<22} {'mode':<9} {'rows':>9} {'inserted':>8} {'updated':>8} {'deleted':>8} {'seconds':>8}")
+        for report in reports:
+            counts = [len(keys) if keys is not None else "-" for keys in (report.inserted, report.updated, report.deleted)]
+            print(f"{report.table:<22} {report.mode:<9} {report.rows:>9} {counts[0]:>8} {counts[1]:>8} {counts[2]:>8} {report.seconds:>8.2f}"
+                  + (f"  ({report.reason})" if report.reason else ""))
+        changes = dataset_changes(reports)
+    else:
+        reports = ingest_sheets(sources, args.chunk_rows)
+        print(f"\n{'table':<22} {'rows':>9} {'chunks':>6} {'seconds':>8}  unparseable -> NULL")
+        for report in reports:
+            nulled = ", ".join(f"{column}: {count}" for column, count in report.nulled.items()) or "-"
+            print(f"{report.table:<22} {report.rows:>9} {report.chunks:>6} {report.seconds:>8.2f}  {nulled}")
+        changes = dict.fromkeys(report.table for report in reports)
+
+    if args.no_refresh:
+        return
+    # The loader already typed the VC metric columns: on staging before a swap, or
+    # per row in a diff. Rewriting them here would lock the tables it just swapped in.
+    stale = [table for table, keys in changes.items() if keys is None and not vc_database.vc_metric_columns(table)]
+    if stale and vc_database.refresh_derived_tables(stale):
+        # Link tables rebuilt from funding_rounds_v2: which rows is not tracked
+        changes.update(dict.fromkeys(("funding_rounds_v2", "funding_round_investors", "funding_round_categories")))
+    if changes:
+        print(f"Dataset version {vc_database.bump_dataset_version(changes)}")
+    else:
+        print("No changes; dataset version unchanged")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# loadtest.py
+# Fires concurrent chat requests at one or more running backends and prints
+# throughput and latency for each, e.g. the sync worker vs the ASGI worker:
+#
+#   SERVING_MODE=sync gunicorn -c gunicorn.conf.py -b 0.0.0.0:5000
+#   SERVING_MODE=asgi gunicorn -c gunicorn.conf.py -b 0.0.0.0:5001
+#   python loadtest.py --target sync=http://localhost:5000 --target asgi=http://localhost:5001 \
+#                      --requests 200 --concurrency 50
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+
+async def run_one(url: str, message: str, endpoint: str, timeout: float):
+    started = time.perf_counter()
+    try:
+        # New client per request: own cookie jar, so each request is a new session
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.post(url + endpoint, json={"message": message, "general_agent_check": False})
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return ok, time.perf_counter() - started
+
+
+async def run_target(name: str, url: str, total: int, concurrency: int, message: str, endpoint: str, timeout: float):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def guarded():
+        async with slots:
+            return await run_one(url, message, endpoint, timeout)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(guarded() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for ok, latency in results if ok)
+    errors = sum(1 for ok, _ in results if not ok)
+    return {
+        "target": name,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": statistics.median(latencies) if latencies else float("nan"),
+        "p95_s": latencies[int(0.95 * (len(latencies) - 1))] if latencies else float("nan"),
+    }
+
+
+def print_report(rows: list[dict]):
+    header = f"{'target':<10} {'requests':>8} {'errors':>6} {'elapsed s':>10} {'req/s':>8} {'p50 s':>8} {'p95 s':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['target']:<10} {row['requests']:>8} {row['errors']:>6} {row['elapsed_s']:>10.2f} "
+              f"{row['throughput_rps']:>8.2f} {row['p50_s']:>8.2f} {row['p95_s']:>8.2f}")
+    if len(rows) > 1 and rows[0]["throughput_rps"]:
+        for row in rows[1:]:
+            print(f"{row['target']} vs {rows[0]['target']}: {row['throughput_rps'] / rows[0]['throughput_rps']:.1f}x throughput")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the chat endpoints")
+    parser.add_argument("--target", action="append", required=True, help="name=base_url, may be repeated")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoint", default="/chat_capmap")
+    parser.add_argument("--message", default="Top 5 AI VCs by AUM")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    rows = []
+    for target in args.target:
+        name, _, url = target.partition("=")
+        rows.append(asyncio.run(run_target(name, url.rstrip("/"), args.requests, args.concurrency,
+                                           args.message, args.endpoint, args.timeout)))
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
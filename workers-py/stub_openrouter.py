@@ -0,0 +1,183 @@
+"""
+Local stand-in for the OpenRouter chat completions endpoint, for checking
+prompt-prefix caching without spending tokens.
+
+    python stub_openrouter.py serve --port 8765 --record /tmp/openrouter_requests.jsonl
+    OPENROUTER_BASE_URL=http://127.0.0.1:8765/api/v1 OPENROUTER_API=stub python main.py
+    python stub_openrouter.py report /tmp/openrouter_requests.jsonl
+
+Every request body is appended to the record file. Responses are canned
+(plain text, or arguments filled from the schema for structured output /
+forced tool calls) and report usage the way a provider with prefix caching
+would: cached_tokens is the longest prefix (tools, then messages, at message
+boundaries) already seen in an earlier request.
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A provider only caches prefixes at least this long
+MIN_CACHED_TOKENS = 1024
+
+
+def estimate_tokens(value: str) -> int:
+    return (len(value) + 3) // 4
+
+
+def prefix_boundaries(body: dict) -> list[tuple[str, int]]:
+    """(hash, tokens) of tools + messages[:i] for every message boundary i."""
+    digest = hashlib.sha256(json.dumps(body.get("tools") or [], sort_keys=True).encode())
+    tokens = estimate_tokens(json.dumps(body.get("tools") or []))
+    boundaries = []
+    for message in body.get("messages", []):
+        serialized = json.dumps(message, sort_keys=True)
+        digest.update(serialized.encode())
+        tokens += estimate_tokens(serialized)
+        boundaries.append((digest.copy().hexdigest(), tokens))
+    return boundaries
+
+
+class PrefixCache:
+    def __init__(self):
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def usage(self, body: dict) -> tuple[int, int]:
+        """(prompt_tokens, cached_tokens) for a request, remembering its prefixes."""
+        boundaries = prefix_boundaries(body)
+        with self._lock:
+            cached = max((tokens for digest, tokens in boundaries if digest in self._seen), default=0)
+            self._seen.update(digest for digest, _ in boundaries)
+        prompt_tokens = boundaries[-1][1] if boundaries else 0
+        return prompt_tokens, cached if cached >= MIN_CACHED_TOKENS else 0
+
+
+def sample_value(schema: dict):
+    kind = schema.get("type")
+    if "enum" in schema:
+        return schema["enum"][0]
+    if kind == "object":
+        return {name: sample_value(prop) for name, prop in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        return []
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return "stub"
+
+
+def canned_message(body: dict) -> dict:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"].get("schema", {})
+        return {"role": "assistant", "content": json.dumps(sample_value(schema))}
+    tool_choice = body.get("tool_choice")
+    if isinstance(tool_choice, dict) and tool_choice.get("type") == "function":
+        name = tool_choice["function"]["name"]
+        tool = next(t for t in body.get("tools", []) if t["function"]["name"] == name)
+        arguments = json.dumps(sample_value(tool["function"].get("parameters", {})))
+        return {"role": "assistant", "content": None,
+                "tool_calls": [{"id": "call_stub", "type": "function", "function": {"name": name, "arguments": arguments}}]}
+    return {"role": "assistant", "content": "Stub answer."}
+
+
+def make_handler(record_path: str, cache: PrefixCache):
+    record_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt_tokens, cached_tokens = cache.usage(body)
+            with record_lock, open(record_path, "a") as record:
+                record.write(json.dumps({"received_at": time.time(), "path": self.path, "body": body,
+                                         "prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens}) + "\n")
+            message = canned_message(body)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": 3, "total_tokens": prompt_tokens + 3,
+                     "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+            finish = "tool_calls" if message.get("tool_calls") else "stop"
+            base = {"id": "stub", "created": int(time.time()), "model": body.get("model", "stub")}
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                delta = {key: value for key, value in message.items() if value is not None}
+                if delta.get("tool_calls"):
+                    delta["tool_calls"] = [{"index": 0, **call} for call in delta["tool_calls"]]
+                chunks = [{**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]},
+                          {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]}]
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    chunks.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                return
+            payload = json.dumps({**base, "object": "chat.completion", "usage": usage,
+                                  "choices": [{"index": 0, "message": message, "finish_reason": finish}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+
+def serve(port: int, record_path: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(record_path, PrefixCache()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def has_cache_control(message: dict) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(isinstance(part, dict) and "cache_control" in part for part in content)
+
+
+def report(record_path: str):
+    with open(record_path) as record:
+        requests = [json.loads(line) for line in record if line.strip()]
+    total_prompt = total_cached = 0
+    print(f"{'#':>3}  {'model':<32} {'msgs':>4} {'tools':>5} {'hint':>4} {'prompt':>7} {'cached':>7}")
+    for i, request in enumerate(requests):
+        body = request["body"]
+        messages = body.get("messages", [])
+        hint = any(has_cache_control(message) for message in messages)
+        print(f"{i:>3}  {body.get('model', '?'):<32} {len(messages):>4} {len(body.get('tools') or []):>5} "
+              f"{'yes' if hint else 'no':>4} {request['prompt_tokens']:>7} {request['cached_tokens']:>7}")
+        total_prompt += request["prompt_tokens"]
+        total_cached += request["cached_tokens"]
+    if total_prompt:
+        print(f"\n{len(requests)} requests, {total_cached}/{total_prompt} prompt tokens cached ({total_cached / total_prompt:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--record", default="openrouter_requests.jsonl")
+    report_parser = commands.add_parser("report")
+    report_parser.add_argument("record")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report(args.record)
+        return
+    server = serve(args.port, args.record)
+    print(f"Stub OpenRouter on http://127.0.0.1:{args.port}/api/v1, recording to {args.record}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+# Run from workers-py: python -m pytest tests
+#
+# The modules read POSTGRES_URL at import but only connect on first use, so
+# most tests need no database. Tests taking the `pg` fixture run against
+# TEST_POSTGRES_URL (a scratch database: they create and drop tables) and are
+# skipped when it is not set.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+os.environ["POSTGRES_URL"] = TEST_POSTGRES_URL or "postgresql+psycopg://localhost/vc_test"
+os.environ.setdefault("DB_SSLMODE", "disable")
+
+import pytest
+
+
+@pytest.fixture
+def pg():
+    """Engine for the scratch database."""
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    import VC_chain_database as vc_database
+    return vc_database.background_engine
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+import VC_answer_cache
+import VC_chain_database as vc_database
+from VC_answer_cache import AnswerCache, LocalHashEmbeddings, key_terms
+from VC_vocabulary import Vocabulary
+
+CONTEXT = "ACTIVE CONSTRAINTS: None\nCURRENT SECTOR/TOPIC: None\nKEY ENTITIES: None\nUSER'S GOAL: find investors"
+
+
+@pytest.fixture(autouse=True)
+def vocabulary(monkeypatch):
+    vocabulary = Vocabulary(1, [("Sequoia Capital", "Fintech"), ("Accel", "HealthTech")], ["Insurtech", "Payments"], [])
+    monkeypatch.setattr(VC_answer_cache, "get_vocabulary", lambda: vocabulary)
+    monkeypatch.setattr(vc_database, "get_dataset_version", lambda: 1)
+    return vocabulary
+
+
+def cached(cache: AnswerCache, stored: str, asked: str, stored_context: str = CONTEXT, asked_context: str = CONTEXT):
+    async def run():
+        await cache.store(stored_context, stored, "ranking", "answer")
+        return await cache.lookup(asked_context, asked, "ranking")
+    return asyncio.run(run())
+
+
+def test_exact_match_only_by_default():
+    cache = AnswerCache()
+    assert cache.embedder is None
+    assert cached(cache, "Top 5 AI VCs by AUM", "top 5  ai vcs by aum?") == "answer"
+    assert cached(cache, "Top 5 AI VCs by AUM", "Top 5 AI VCs by total AUM") is None
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("Which VCs are headquartered in Germany", "Which VCs are headquartered in France"),
+    ("top VCs by total investments", "top VCs by total exits"),
+    ("top 5 fintech vcs by aum", "top 5 insurtech vcs by aum"),
+    ("top 5 VCs by AUM", "top 10 VCs by AUM"),
+    ("who invested alongside sequoia capital", "who invested alongside accel"),
+])
+def test_near_misses_are_not_served(stored, asked):
+    assert key_terms(stored, VC_answer_cache.get_vocabulary()) != key_terms(asked, VC_answer_cache.get_vocabulary())
+    assert cached(AnswerCache(embedder=LocalHashEmbeddings()), stored, asked) is None
+
+
+def test_context_terms_must_match():
+    fintech = CONTEXT.replace("TOPIC: None", "TOPIC: Fintech")
+    insurtech = CONTEXT.replace("TOPIC: None", "TOPIC: Insurtech")
+    cache = AnswerCache(embedder=LocalHashEmbeddings())
+    assert cached(cache, "top 5 VCs by AUM", "top 5 VCs by AUM", fintech, insurtech) is None
+
+
+def test_paraphrase_with_same_terms_is_served():
+    cache = AnswerCache(embedder=LocalHashEmbeddings(), query_similarity=0.8)
+    assert cached(cache, "top 5 fintech VCs by AUM", "the top 5 fintech VCs by AUM please") == "answer"
+    assert cache.stats["semantic_hits"] == 1
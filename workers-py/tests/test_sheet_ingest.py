@@ -0,0 +1,17 @@
+import io
+from sqlalchemy import text
+from VC_sheet_ingest import ingest_table
+
+VC_OVERALL_CSV = """Top Tier,AUM,Ticket Size,Follow on Index,Total Exits / Total Investments
+Alpha Ventures,"$9,200,000,000",1M-3M,0.5,0.2
+Beta Capital,NO DATA,23M,0.1,0.3
+"""
+
+
+def test_swapped_in_vc_table_has_typed_metric_columns(pg):
+    ingest_table("vc_overall_raw", io.StringIO(VC_OVERALL_CSV))
+    with pg.connect() as conn:
+        rows = conn.execute(text('SELECT "Top Tier", "AUM__num", "Ticket Size__num" FROM vc_overall_raw ORDER BY 1')).fetchall()
+        indexes = set(conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'vc_overall_raw'")).scalars())
+    assert [tuple(row) for row in rows] == [("Alpha Ventures", 9_200_000_000, 2_000_000), ("Beta Capital", None, 23_000_000)]
+    assert {"vc_overall_raw_aum_num_idx", "vc_overall_raw_ticket_size_num_idx", "vc_overall_raw_top_tier_idx"} <= indexes
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import text
+import VC_sql_guard
+import VC_chain_database as vc_database
+from VC_sql_guard import QueryRejected, check_plan, plan_rows, run_guarded
+from VC_sql_rewriter import rewrite_query
+
+BIG_SCAN = {"Node Type": "Seq Scan", "Relation Name": "big", "Plan Rows": 50_000_000, "Total Cost": 900_000}
+
+
+def limit(child: dict, rows: int = 201) -> dict:
+    return {"Node Type": "Limit", "Plan Rows": rows, "Total Cost": 4, "Plans": [child]}
+
+
+def test_rows_under_a_limit_do_not_count():
+    assert plan_rows(BIG_SCAN) == 50_000_000
+    assert plan_rows(limit(BIG_SCAN)) == 201
+    check_plan(limit(BIG_SCAN))
+    with pytest.raises(QueryRejected):
+        check_plan(BIG_SCAN)
+
+
+def test_cross_join_is_rejected_under_a_limit():
+    cross = {"Node Type": "Nested Loop", "Plan Rows": 2.5e15, "Total Cost": 3e13,
+             "Plans": [BIG_SCAN, {**BIG_SCAN, "Total Cost": 1}]}
+    with pytest.raises(QueryRejected, match="cross join"):
+        check_plan(limit(cross))
+
+
+@pytest.fixture
+def big_table(pg, monkeypatch):
+    monkeypatch.setattr(vc_database, "get_dataset_version", lambda: 1)
+    monkeypatch.setattr(VC_sql_guard, "SQL_MAX_PLAN_ROWS", 1_000)
+    with pg.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS guard_test_big"))
+        conn.execute(text("CREATE TABLE guard_test_big AS SELECT g AS id, md5(g::text) AS name FROM generate_series(1, 20000) g"))
+        conn.execute(text("ANALYZE guard_test_big"))
+    yield pg
+    with pg.begin() as conn:
+        conn.execute(text("DROP TABLE guard_test_big"))
+
+
+def test_rewritten_scan_of_a_big_table_runs(big_table):
+    sql = rewrite_query("SELECT id, name FROM guard_test_big").sql
+    result = run_guarded(big_table, sql)
+    assert len(result.rows) == 200 and result.truncated and not result.rewritten
+
+
+def test_unlimited_scan_gets_a_limit(big_table):
+    result = run_guarded(big_table, "SELECT id, name FROM guard_test_big")
+    assert len(result.rows) == 200 and result.truncated and result.rewritten
+
+
+def test_rewritten_cross_join_is_rejected(big_table):
+    sql = rewrite_query("SELECT a.id, b.id FROM guard_test_big a, guard_test_big b").sql
+    with pytest.raises(QueryRejected, match="cross join"):
+        run_guarded(big_table, sql)
@@ -0,0 +1,76 @@
+import pytest
+import sqlglot
+from sqlglot.errors import ParseError
+import VC_chain_database as vc_database
+import VC_sql_rewriter
+from VC_sql_rewriter import RewriteCache, normalize_sql
+from VC_vocabulary import Vocabulary
+
+
+@pytest.fixture(autouse=True)
+def vocabulary(monkeypatch):
+    vocabulary = Vocabulary(1, [("a16z", "Fintech"), ("Accel", "Fintech & Payments"), ("Sequoia", "HealthTech")],
+                            ["Generative AI", "Payments"], [])
+    monkeypatch.setattr(VC_sql_rewriter, "get_vocabulary", lambda: vocabulary)
+    monkeypatch.setattr(vc_database, "get_dataset_version", lambda: 1)
+    return vocabulary
+
+
+def test_comment_line_does_not_swallow_the_query():
+    sql = "SELECT a -- the a column\nFROM t\nWHERE b = 1"
+    tree = sqlglot.parse_one(RewriteCache().rewrite(sql).sql, read="postgres")
+    assert tree.args["from"].sql() == "FROM t"
+    assert tree.args["where"].sql() == "WHERE b = 1"
+
+
+def test_literal_whitespace_is_kept():
+    cache = RewriteCache()
+    one = cache.rewrite("SELECT a FROM t WHERE name ILIKE '%a  b%'")
+    two = cache.rewrite("SELECT a FROM t WHERE name ILIKE '%a b%'")
+    assert "'%a  b%'" in one.sql and "'%a b%'" in two.sql
+    assert cache.stats()["misses"] == 2
+
+
+def test_layout_and_comments_share_a_cache_entry():
+    cache = RewriteCache()
+    cache.rewrite("SELECT a FROM t WHERE b = 1;")
+    cache.rewrite("SELECT a\n  FROM t -- only b\n WHERE b = 1")
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+    assert normalize_sql("SELECT a FROM t WHERE c = 'x  y'") != normalize_sql("SELECT a FROM t WHERE c = 'x y'")
+
+
+def test_unparsed_query_passes_through_unchanged(monkeypatch):
+    def unparsable(sql):
+        raise ParseError("unsupported syntax")
+    monkeypatch.setattr(VC_sql_rewriter, "parse_single_query", unparsable)
+    sql = "SELECT a -- note\nFROM t"
+    result = VC_sql_rewriter.rewrite_query(sql)
+    assert (result.sql, result.changes) == (sql, ("unparsed",))
+
+
+def _where(sql: str) -> str:
+    return sqlglot.parse_one(sql, read="postgres").args["where"].sql()
+
+
+def test_exact_sector_without_match_stays_exact():
+    result = VC_sql_rewriter.rewrite_query('SELECT * FROM vc_sector_based_raw WHERE "Sector" = \'Fintec\'')
+    assert _where(result.sql) == "WHERE \"Sector\" = 'Fintec'"
+    assert len(result.notes) == 1 and "'Fintech'" in result.notes[0]
+
+
+def test_exact_sector_case_is_corrected_and_reported():
+    result = VC_sql_rewriter.rewrite_query('SELECT * FROM vc_sector_based_raw WHERE "Sector" = \'fintech\'')
+    assert _where(result.sql) == "WHERE \"Sector\" = 'Fintech'"
+    assert "'Fintech'" in result.notes[0]
+
+
+def test_stored_sector_is_untouched():
+    result = VC_sql_rewriter.rewrite_query('SELECT * FROM vc_sector_based_raw WHERE "Sector" = \'HealthTech\'')
+    assert _where(result.sql) == "WHERE \"Sector\" = 'HealthTech'"
+    assert result.notes == ()
+
+
+def test_fuzzy_sector_rewrite_is_reported():
+    result = VC_sql_rewriter.rewrite_query('SELECT * FROM vc_sector_based_raw WHERE "Sector" ILIKE \'%fintech%\'')
+    assert _where(result.sql) == "WHERE \"Sector\" IN ('Fintech', 'Fintech & Payments')"
+    assert "IN ('Fintech', 'Fintech & Payments')" in result.notes[0]
@@ -0,0 +1,91 @@
+import threading
+import time
+import pytest
+import VC_tool_cache
+import VC_chain_database as vc_database
+from VC_tool_cache import ToolResultCache, cached_tool
+
+
+@pytest.fixture(autouse=True)
+def tool_cache(monkeypatch):
+    monkeypatch.setattr(vc_database, "get_dataset_version", lambda: 1)
+    cache = ToolResultCache()
+    monkeypatch.setattr(VC_tool_cache, "tool_cache", cache)
+    return cache
+
+
+def test_whitespace_in_patterns_is_part_of_the_key():
+    calls = []
+
+    @cached_tool(casefold=("pattern",))
+    def search(pattern: str):
+        calls.append(pattern)
+        return [pattern]
+
+    assert search("%New York%") == ["%New York%"]
+    assert search("%NewYork%") == ["%NewYork%"]
+    assert search("%New  York%") == ["%New  York%"]
+    assert search("%new york%") == ["%New York%"]
+    assert calls == ["%New York%", "%NewYork%", "%New  York%"]
+
+
+def test_concurrent_misses_make_one_call():
+    calls = []
+    started = threading.Event()
+
+    @cached_tool()
+    def slow(name: str):
+        calls.append(name)
+        started.set()
+        time.sleep(0.2)
+        return [name]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow("Accel"))) for _ in range(5)]
+    threads[0].start()
+    started.wait(1)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert calls == ["Accel"]
+    assert results == [["Accel"]] * 5
+
+
+def test_waiters_retry_after_an_error_result():
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    @cached_tool()
+    def flaky(name: str):
+        calls.append(name)
+        if len(calls) == 1:
+            started.set()
+            release.wait(1)
+            return [{"error": "timeout"}]
+        return [name]
+
+    first = threading.Thread(target=flaky, args=("Accel",))
+    first.start()
+    started.wait(1)
+    second = []
+    waiter = threading.Thread(target=lambda: second.append(flaky("Accel")))
+    waiter.start()
+    release.set()
+    first.join(5)
+    waiter.join(5)
+    assert second == [["Accel"]]
+    assert len(calls) == 2
+
+
+def test_lock_is_free_during_the_call(tool_cache):
+    seen = []
+
+    @cached_tool()
+    def probe(name: str):
+        seen.append(tool_cache._lock.acquire(blocking=False))
+        tool_cache._lock.release()
+        return [name]
+
+    probe("Accel")
+    assert seen == [True]
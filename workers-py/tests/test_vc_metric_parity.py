@@ -0,0 +1,93 @@
+from decimal import Decimal
+import pytest
+from sqlalchemy import text
+import VC_chain_database as vc_database
+import VC_chain_systemprompts as vc_systemprompts
+
+# Raw sheet text as the VC tables hold it ("NO DATA" in text-only columns, NULL where ingest nulled it)
+FIXTURES = {
+    "vc_overall_raw": (
+        ("Top Tier", "AUM", "Ticket Size", "Follow on Index", "Total Exits / Total Investments"),
+        [("Alpha", "$9,200,000,000", "1M-3M", "0.5", "0.25"),
+         ("Beta", "$77,000,000", "23M", "1.2", "0.1"),
+         ("Gamma", None, "NO DATA", None, "0.4"),
+         ("Delta", "$450,000", "447K", "0.05", None),
+         ("Epsilon", "$1,000,000,000", "2.5M - 500K", "0", "0"),
+         ("Zeta", "$0", "1.5B", "3", "1")],
+    ),
+    "vc_sector_based_raw": (
+        ("Top Tier", "Sector", "Sector specific Investment", "Sector specific exit", "Sector specific exit/investment"),
+        [("Alpha", "Fintech", "120", "45", "37.46%"),
+         ("Beta", "Fintech", "80", "10", "12.5%"),
+         ("Gamma", "HealthTech", "15", "0", "0%"),
+         ("Delta", "HealthTech", None, None, None)],
+    ),
+    "vc_market_cagr": (
+        ("Sector", "Current Market Size", "CAGR"),
+        [("Fintech", "340000000000", "9.47%"), ("HealthTech", "120000000000", "17.2%"), ("AI", None, None)],
+    ),
+}
+
+# What each fixture string must parse to, by the table's key
+EXPECTED = {
+    "AUM": {"Alpha": 9_200_000_000, "Beta": 77_000_000, "Gamma": None, "Delta": 450_000, "Epsilon": 1_000_000_000, "Zeta": 0},
+    # Ranges are the midpoint; only K and M suffixes are understood ("1.5B" stays NULL)
+    "Ticket Size": {"Alpha": 2_000_000, "Beta": 23_000_000, "Gamma": None, "Delta": 447_000, "Epsilon": 1_500_000, "Zeta": None},
+    "Follow on Index": {"Alpha": "0.5", "Beta": "1.2", "Gamma": None, "Delta": "0.05", "Epsilon": 0, "Zeta": 3},
+    "Total Exits / Total Investments": {"Alpha": "0.25", "Beta": "0.1", "Gamma": "0.4", "Delta": None, "Epsilon": 0, "Zeta": 1},
+    "Sector specific Investment": {("Alpha", "Fintech"): 120, ("Beta", "Fintech"): 80, ("Gamma", "HealthTech"): 15, ("Delta", "HealthTech"): None},
+    "Sector specific exit": {("Alpha", "Fintech"): 45, ("Beta", "Fintech"): 10, ("Gamma", "HealthTech"): 0, ("Delta", "HealthTech"): None},
+    "Sector specific exit/investment": {("Alpha", "Fintech"): "37.46", ("Beta", "Fintech"): "12.5", ("Gamma", "HealthTech"): 0,
+                                        ("Delta", "HealthTech"): None},
+    "Current Market Size": {"Fintech": 340_000_000_000, "HealthTech": 120_000_000_000, "AI": None},
+    "CAGR": {"Fintech": "9.47", "HealthTech": "17.2", "AI": None},
+}
+
+
+@pytest.fixture
+def vc_tables(pg):
+    with pg.begin() as conn:
+        for table, (columns, rows) in FIXTURES.items():
+            conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+            conn.execute(text(f'CREATE TABLE "{table}" ({", ".join(f"{chr(34)}{column}{chr(34)} TEXT" for column in columns)})'))
+            names = [f"c{i}" for i in range(len(columns))]
+            conn.execute(text(f'INSERT INTO "{table}" VALUES ({", ".join(":" + name for name in names)})'),
+                         [dict(zip(names, row)) for row in rows])
+    vc_database.normalize_vc_metrics()
+    yield pg
+    vc_database._parity_failed_version = None
+
+
+@pytest.mark.parametrize("metric", list(vc_systemprompts.METRIC_EXPR))
+def test_typed_column_holds_the_parsed_value(vc_tables, metric):
+    table, _ = vc_systemprompts.METRIC_SOURCE[metric]
+    keys = vc_database.VC_JOIN_KEY_INDEXES[table]
+    key_list = ", ".join(f'"{column}"' for column in keys)
+    with vc_tables.connect() as conn:
+        rows = conn.execute(text(f'SELECT {key_list}, "{vc_systemprompts.METRIC_NUMERIC_COLUMN[metric]}" FROM {table}')).fetchall()
+    stored = {(tuple(row[:-1]) if len(keys) > 1 else row[0]): row[-1] for row in rows}
+    assert stored == {key: None if value is None else Decimal(str(value)) for key, value in EXPECTED[metric].items()}
+
+
+def test_ranking_on_typed_column_orders_by_parsed_value(vc_tables):
+    with vc_tables.connect() as conn:
+        ranked = conn.execute(text(
+            f'SELECT "Top Tier" FROM vc_overall_raw vo ORDER BY {vc_systemprompts.METRIC_COLUMN["Ticket Size"]} DESC NULLS LAST, 1'
+        )).scalars().all()
+    assert ranked == ["Beta", "Alpha", "Epsilon", "Delta", "Gamma", "Zeta"]
+
+
+def test_stale_typed_column_fails_parity_until_the_version_moves(vc_tables, monkeypatch):
+    monkeypatch.setattr(vc_database, "get_dataset_version", lambda: 7)
+    vc_database.verify_vc_metric_parity()
+    assert vc_database.typed_metrics_usable()
+    with vc_tables.begin() as conn:
+        conn.execute(text('UPDATE vc_overall_raw SET "AUM" = \'$5\' WHERE "Top Tier" = \'Delta\''))
+    with pytest.raises(vc_database.MetricParityError, match="AUM"):
+        vc_database.verify_vc_metric_parity()
+    assert not vc_database.typed_metrics_usable()
+
+    # Another process reloads the table and bumps the version: the next call re-checks
+    vc_database.normalize_vc_metrics()
+    monkeypatch.setattr(vc_database, "get_dataset_version", lambda: 8)
+    assert vc_database.typed_metrics_usable()
@@ -0,0 +1,163 @@
+# train_local_router.py
+# Trains the local query router (VC_local_router) from logged LLM routing
+# decisions, prints accuracy and latency reports, and writes the artifact the
+# router node loads (LOCAL_ROUTER_PATH).
+#
+#   python train_local_router.py
+#   python train_local_router.py --label-interactions 500     # bootstrap: route past questions with the LLM first
+#   python train_local_router.py --llm-latency-sample 20      # also time the LLM router for comparison
+import argparse
+import asyncio
+import hashlib
+import statistics
+import time
+from collections import Counter
+from sqlalchemy import text
+import VC_chain_database as vc_database
+from VC_local_router import LABELS, LOCAL_ROUTER_PATH, LOCAL_ROUTER_THRESHOLD, canonical_label, train_local_router
+
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+
+def load_examples() -> list[tuple[str, str, str]]:
+    """(user_input, context_summary, query_type) for every LLM routing decision, deduplicated (latest wins)."""
+    with vc_database.engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT user_input, coalesce(context_summary, ''), query_type
+            FROM   router_decisions
+            WHERE  source = 'llm'
+            ORDER  BY created_at
+        """)).fetchall()
+    latest = {}
+    for user_input, context_summary, query_type in rows:
+        latest[(user_input, context_summary)] = canonical_label(query_type)
+    return [(user_input, context_summary, query_type) for (user_input, context_summary), query_type in latest.items()]
+
+
+async def label_interactions(limit: int, concurrency: int):
+    """Route logged questions that have no decision yet with the LLM router and store the decisions."""
+    import VC_chain_logic as vc_logic
+    with vc_database.engine.connect() as conn:
+        questions = [row[0] for row in conn.execute(text("""
+            SELECT user_input
+            FROM   interactions i
+            WHERE  user_input IS NOT NULL AND user_input <> ''
+              AND  NOT EXISTS (SELECT 1 FROM router_decisions d WHERE d.user_input = i.user_input)
+            GROUP  BY user_input
+            ORDER  BY max(timestamp) DESC
+            LIMIT  :limit
+        """), {"limit": limit})]
+    slots = asyncio.Semaphore(concurrency)
+
+    async def label(question):
+        async with slots:
+            # No history replayed: the context is what the summarizer builds for a first turn
+            context_summary = vc_logic.minimal_context_summary(question)
+            state = {"input": question, "chat_history": [], "context_summary": context_summary, "general_agent_check": False}
+            try:
+                response = await vc_logic.run_llm_router(state, {"configurable": {"thread_id": "train_local_router"}})
+            except Exception as e:
+                print(f"Could not label {question[:60]!r}: {e}")
+                return
+            await asyncio.to_thread(vc_database.save_router_decision, None, question, context_summary, response["query_type"], "llm")
+
+    await asyncio.gather(*(label(question) for question in questions))
+    print(f"Labelled {len(questions)} logged questions with the LLM router")
+
+
+def in_holdout(example: tuple, holdout: float) -> bool:
+    # Split by query text, so rephrasings of one question never straddle train and holdout
+    digest = hashlib.blake2b(example[0].lower().encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2 ** 64 < holdout
+
+
+def accuracy_report(router, holdout_examples: list):
+    predictions = [router.predict(query, context) for query, context, _ in holdout_examples]
+    truth = [label for _, _, label in holdout_examples]
+    correct = sum(predicted == label for (predicted, _), label in zip(predictions, truth))
+    print(f"\nHoldout accuracy: {correct / len(truth):.1%} ({correct}/{len(truth)})")
+
+    print(f"\n{'label':<24} {'precision':>9} {'recall':>7} {'support':>8}")
+    for label in LABELS:
+        predicted_as = [t for (p, _), t in zip(predictions, truth) if p == label]
+        actual = [p for (p, _), t in zip(predictions, truth) if t == label]
+        precision = sum(t == label for t in predicted_as) / len(predicted_as) if predicted_as else float("nan")
+        recall = sum(p == label for p in actual) / len(actual) if actual else float("nan")
+        print(f"{label:<24} {precision:>9.1%} {recall:>7.1%} {len(actual):>8}")
+
+    # Coverage = turns that skip the LLM; accuracy is measured on those turns only
+    print(f"\n{'threshold':>9} {'coverage':>9} {'accuracy':>9}")
+    for threshold in sorted(set(THRESHOLDS) | {LOCAL_ROUTER_THRESHOLD}):
+        confident = [(p, t) for (p, confidence), t in zip(predictions, truth) if confidence >= threshold]
+        accuracy = sum(p == t for p, t in confident) / len(confident) if confident else float("nan")
+        marker = "  <- LOCAL_ROUTER_THRESHOLD" if threshold == LOCAL_ROUTER_THRESHOLD else ""
+        print(f"{threshold:>9.2f} {len(confident) / len(truth):>9.1%} {accuracy:>9.1%}{marker}")
+    return correct / len(truth)
+
+
+def latency_report(router, examples: list):
+    latencies = []
+    for query, context, _ in examples:
+        started = time.perf_counter()
+        router.predict(query, context)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    latencies.sort()
+    print(f"\nLocal router latency over {len(latencies)} queries: mean {statistics.mean(latencies):.0f}µs, "
+          f"p50 {latencies[len(latencies) // 2]:.0f}µs, p99 {latencies[int(0.99 * (len(latencies) - 1))]:.0f}µs")
+
+
+async def llm_latency_report(examples: list):
+    import VC_chain_logic as vc_logic
+    latencies = []
+    for query, context, _ in examples:
+        state = {"input": query, "chat_history": [], "context_summary": context, "general_agent_check": False}
+        started = time.perf_counter()
+        await vc_logic.run_llm_router(state, {"configurable": {"thread_id": "train_local_router"}})
+        latencies.append(time.perf_counter() - started)
+    print(f"LLM router latency over {len(latencies)} queries: mean {statistics.mean(latencies) * 1000:.0f}ms, "
+          f"p50 {statistics.median(latencies) * 1000:.0f}ms")
+
+
+async def main():
+    # One event loop for both LLM phases: the shared async LLM client is bound to the loop it first ran on
+    parser = argparse.ArgumentParser(description="Train the local query router from logged routing decisions")
+    parser.add_argument("--output", default=LOCAL_ROUTER_PATH)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of distinct queries held out for the report")
+    parser.add_argument("--min-examples", type=int, default=50)
+    parser.add_argument("--label-interactions", type=int, default=0, help="route this many unlabelled logged questions with the LLM first")
+    parser.add_argument("--label-concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-sample", type=int, default=0, help="time the LLM router on this many holdout queries")
+    args = parser.parse_args()
+
+    if args.label_interactions:
+        await label_interactions(args.label_interactions, args.label_concurrency)
+
+    examples = load_examples()
+    print(f"{len(examples)} labelled examples: {dict(Counter(label for _, _, label in examples))}")
+    if len(examples) < args.min_examples:
+        print(f"Need at least {args.min_examples} examples; log more traffic or use --label-interactions")
+        return
+
+    train_examples = [example for example in examples if not in_holdout(example, args.holdout)]
+    holdout_examples = [example for example in examples if in_holdout(example, args.holdout)]
+    started = time.perf_counter()
+    router = train_local_router(train_examples, epochs=args.epochs)
+    print(f"Trained on {len(train_examples)} examples in {time.perf_counter() - started:.1f}s")
+
+    holdout_accuracy = None
+    if holdout_examples:
+        holdout_accuracy = accuracy_report(router, holdout_examples)
+        latency_report(router, holdout_examples)
+        if args.llm_latency_sample:
+            await llm_latency_report(holdout_examples[:args.llm_latency_sample])
+
+    # The shipped model sees every example
+    router = train_local_router(examples, epochs=args.epochs)
+    router.metadata.update({"holdout_accuracy": holdout_accuracy, "holdout_examples": len(holdout_examples)})
+    router.save(args.output)
+    print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())